@@ -3,6 +3,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os
 import traceback
+import multiprocessing
 # Corrected import: Use relative import for constants within the package
 from . import constants
 
@@ -61,6 +62,15 @@ class AnkiTagProcessorApp(tk.Tk):
         if hasattr(self.page1, 'update_anki_data'):
              self.page1.update_anki_data(self.anki_decks, self.anki_tags, self.anki_note_types)
 
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_close(self):
+        """Window close: tells a running workflow to stop before the main loop ends, then closes the app."""
+        if hasattr(self, 'page4') and hasattr(self.page4, 'shutdown_workflow'):
+            try: self.page4.shutdown_workflow()
+            except Exception as e: print(f"Error stopping workflow on close: {e}")
+        self.destroy()
+
     def _load_initial_anki_data(self):
         """Loads data from AnkiConnect and stores it in app variables."""
         print("Loading initial Anki data...")
@@ -121,6 +131,7 @@ class AnkiTagProcessorApp(tk.Tk):
 if __name__ == "__main__":
     # IMPORTANT: Run this script as a module from the PARENT directory
     # Example: python -m AnkiTagProcessor.AnkiTagProcessor_main
+    multiprocessing.freeze_support() # Bulk page rendering uses worker processes (needed for frozen Windows builds)
     try:
         app = AnkiTagProcessorApp()
         app.mainloop()
@@ -26,6 +26,44 @@ DEFAULT_SECOND_PASS_MODEL = "gemini-2.0-flash" # Use a fast model by default
 if DEFAULT_SECOND_PASS_MODEL not in GEMINI_UNIFIED_MODELS and GEMINI_UNIFIED_MODELS:
     DEFAULT_SECOND_PASS_MODEL = GEMINI_UNIFIED_MODELS[0] # Fallback if default isn't listed
 
+def _env_positive_int(name, default):
+    """Positive int from environment variable name; default if it is unset or not a positive integer."""
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+# Bulk workflow: default for how many PDFs are extracted at the same time (uploads/extraction calls overlap);
+# QUIZDB_BULK_WORKERS overrides it, and it stays adjustable on the Workflow page
+BULK_MAX_CONCURRENT_FILES = _env_positive_int("QUIZDB_BULK_WORKERS", 4)
+# Bulk workflow: rendered page images are cached here by PDF content hash, so reprocessing a PDF skips PyMuPDF
+PDF_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".quizdb_cache")
+# Tags returned by Gemini, keyed by tagging pass, model/prompt and item text; items seen before are not sent for tagging again.
+# An SQLite file, so several app instances add to it safely; the least recently used entries beyond the cap are evicted
+TAG_CACHE_PATH = os.path.join(PDF_CACHE_DIR, "tag_cache.sqlite3")
+TAG_CACHE_MAX_ENTRIES = 200_000
+# Visual extraction results, keyed by PDF content hash and extraction model/prompt (can be turned off on the Workflow page)
+EXTRACT_CACHE_DIR = os.path.join(PDF_CACHE_DIR, "extractions")
+# Size caps of the page image and extraction caches; least recently used entries are removed after each workflow run
+PAGE_IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+EXTRACT_CACHE_MAX_BYTES = 256 * 1024 ** 2
+# Bulk workflow: page rendering worker processes (rendering is CPU-bound and runs outside the GIL). One core is left for
+# the Tk thread and the extraction/upload threads, which would otherwise be starved while every core renders
+BULK_IMAGE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+# Request budget enforced by core.gemini_api.RateLimiter: 80% of the free-tier Flash limits (30 RPM / 1M TPM),
+# leaving headroom for token-estimate error and other clients on the same key
+GEMINI_RPM_LIMIT = 24
+GEMINI_TPM_LIMIT = 800_000
+# Tagging: batches sent at the same time (each waits its turn on the RateLimiter above, so this only overlaps latency)
+TAG_MAX_CONCURRENT_BATCHES = 4
+
+# Status log boxes keep the last STATUS_LOG_MAX_LINES lines; older lines are dropped in one delete once the box is
+# STATUS_LOG_TRIM_SLACK lines over (Tk Text redraws slow down badly as the line count grows)
+STATUS_LOG_MAX_LINES = 2000
+STATUS_LOG_TRIM_SLACK = 500
+
 GEMINI_SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
@@ -61,3 +99,28 @@ try:
 except ImportError:
     PYMUPDF_INSTALLED = False
     fitz = None # Ensure fitz is None if import fails
+
+# --- Optional: BLAKE3 (faster content hashing for the page image cache; SHA-256 is used otherwise) ---
+try:
+    import blake3
+    BLAKE3_INSTALLED = True
+except ImportError:
+    BLAKE3_INSTALLED = False
+    blake3 = None
+
+# --- Optional: orjson (C JSON encoder/decoder for Gemini responses and saved results; stdlib json is used otherwise) ---
+try:
+    import orjson
+    ORJSON_INSTALLED = True
+except ImportError:
+    ORJSON_INSTALLED = False
+    orjson = None
+
+# --- Optional: ijson (streams large intermediate JSON arrays item by item instead of reading the whole file first) ---
+# Only used with a compiled backend (yajl2_c etc.): ijson's pure-Python fallback parses many times slower than json.load
+try:
+    import ijson
+    IJSON_INSTALLED = getattr(ijson, "backend", "python") != "python"
+except ImportError:
+    IJSON_INSTALLED = False
+    ijson = None
@@ -3,6 +3,12 @@ import os
 import time
 import traceback
 import json # Keep for the new function
+import hashlib
+import mmap
+import shutil
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from tkinter import messagebox
 import csv # Import csv module for robust TSV writing
@@ -11,25 +17,87 @@ import html # Import html for escaping attributes
 # Use relative imports
 # Ensure these imports work within your project structure
 try:
-    from ..constants import PYMUPDF_INSTALLED, fitz
-    from ..utils.helpers import ProcessingError, sanitize_filename
+    from ..constants import PYMUPDF_INSTALLED, fitz, PDF_CACHE_DIR, BLAKE3_INSTALLED, blake3
+    from ..utils.helpers import ProcessingError, sanitize_filename, touch_cache_entry, prune_cache_dir
 except ImportError:
     # Basic fallback for standalone testing/viewing if relative imports fail
     print("Warning: Relative imports failed. Using dummy constants/helpers.")
     PYMUPDF_INSTALLED = False
     fitz = None
+    PDF_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".quizdb_cache")
+    BLAKE3_INSTALLED = False
+    blake3 = None
     class ProcessingError(Exception): pass
     def sanitize_filename(name): return name.replace(" ", "_")
+    def touch_cache_entry(path): pass
+    def prune_cache_dir(cache_dir, max_bytes): return 0, 0
+
+# --- TSV column layouts (shared by all writers below) ---
+VISUAL_TSV_HEADER = ("Question", "QuestionMedia", "Answer", "AnswerMedia")
+TEXT_ANALYSIS_TSV_HEADER = ("Question", "Answer")
+TAGGED_TSV_HEADER = ("Question", "QuestionMedia", "Answer", "AnswerMedia", "Tags") # Final Anki import layout
+# Write buffer for TSV outputs. The default 8 KiB buffer turns a large bulk TSV into thousands of
+# small write() syscalls; 1 MiB lets csv.writer fill memory and hand the OS big chunks instead.
+TSV_WRITE_BUFFER_SIZE = 1024 * 1024
+# Page rendering parameters. They are part of the page image cache key, so changing them invalidates old entries.
+PAGE_IMAGE_ZOOM = 1.5
+PAGE_IMAGE_FORMAT = "jpeg"
+# Parallel rendering only pays for the worker start-up cost when each worker gets at least this many pages
+MIN_PAGES_PER_RENDER_WORKER = 8
+# Cache <-> destination image copies run on this many threads; each copy is a kernel-side shutil.copyfile,
+# so the threads just keep several files in flight (helps most on network shares and slow disks)
+IMAGE_COPY_WORKERS = 4
+
+# --- Image Generation ---
+def _render_pages(doc, pages_to_render, image_folder_path, num_pages, log_func):
+    """Renders (page index, image filename) pairs from an open document. Returns {page number str: filename} for pages saved."""
+    rendered = {}
+    mat = fitz.Matrix(PAGE_IMAGE_ZOOM, PAGE_IMAGE_ZOOM) # Adjust PAGE_IMAGE_ZOOM as needed
+    for i, image_filename in pages_to_render:
+        page_num = i + 1
+        try:
+            page = doc.load_page(i)
+        except Exception as load_e:
+            log_func(f"Error loading PDF page {page_num}: {load_e}", "error")
+            continue # Skip this page
+        try:
+            pix = page.get_pixmap(matrix=mat)
+        except Exception as pixmap_e:
+            log_func(f"Error creating image for page {page_num}: {pixmap_e}", "error")
+            continue # Skip this page
+        try:
+            pix.save(os.path.join(image_folder_path, image_filename), PAGE_IMAGE_FORMAT) # Save as JPG (MuPDF encodes directly, no PIL hop)
+        except Exception as save_e:
+            log_func(f"Error saving image file '{image_filename}': {save_e}", "error")
+            continue # Skip this page
+        finally:
+            pix = page = None # Release the pixmap samples and page now, not when the next page's objects replace them
+        rendered[str(page_num)] = image_filename # --- IMPORTANT: Use STRING key for the map ---
+        # Log progress periodically
+        if page_num % 10 == 0 or page_num == num_pages:
+            log_func(f"Generated image for page {page_num}/{num_pages}...", "debug")
+    return rendered
+
+def _render_page_range(pdf_path, pages_to_render, image_folder_path, num_pages):
+    """Process-pool worker: reopens the PDF by path (fitz documents can't be pickled) and renders its share of pages.
+    Returns (rendered map, [(message, level), ...])."""
+    log_records = []
+    def collect_log(message, level="info"): log_records.append((message, level))
+    doc = fitz.open(pdf_path)
+    try:
+        return _render_pages(doc, pages_to_render, image_folder_path, num_pages, collect_log), log_records
+    finally:
+        doc.close()
 
-
-# --- Image Generation (No change from original) ---
 def generate_page_images(pdf_path, image_destination_path, sanitized_base_name,
                          save_direct_flag, log_func, parent_widget=None,
-                         filename_prefix=None):
-    """Generates JPG images for each page of a PDF."""
+                         filename_prefix=None, render_workers=1, doc=None):
+    """Generates JPG images for each page of a PDF.
+    With render_workers > 1, large PDFs are split into contiguous page ranges rendered in worker processes.
+    Pass an open fitz.Document of pdf_path as doc to skip re-opening it; the caller keeps ownership (it is not closed here)."""
     log_func(f"Generating page images for '{os.path.basename(pdf_path)}'...", "info")
     page_image_map = {}
-    doc = None
+    owns_doc = doc is None
     final_image_folder_path = image_destination_path # Start assuming we use the provided path
 
     if not PYMUPDF_INSTALLED:
@@ -70,11 +138,13 @@ def generate_page_images(pdf_path, image_destination_path, sanitized_base_name,
         log_func(f"Saving images directly into: {final_image_folder_path}", "info")
 
     try:
-        doc = fitz.open(pdf_path)
+        if owns_doc: doc = fitz.open(pdf_path)
         num_pages = len(doc)
         log_func(f"PDF has {num_pages} pages.", "info")
         pad_width = max(3, len(str(num_pages))) # Determine padding based on number of pages
 
+        # Pass 1: names and overwrite decisions (may prompt, so this stays in this process)
+        pages_to_render = []
         for i in range(num_pages):
             page_num = i + 1
             # Consistent image naming convention
@@ -103,32 +173,31 @@ def generate_page_images(pdf_path, image_destination_path, sanitized_base_name,
                      log_func(f"Overwriting existing image (no UI confirmation): {image_filename}", "info")
 
             if perform_save:
-                try:
-                    page = doc.load_page(i)
-                except Exception as load_e:
-                    log_func(f"Error loading PDF page {page_num}: {load_e}", "error")
-                    continue # Skip this page
-
-                zoom = 1.5 # Adjust zoom factor as needed
-                mat = fitz.Matrix(zoom, zoom)
-                try:
-                    pix = page.get_pixmap(matrix=mat)
-                except Exception as pixmap_e:
-                    log_func(f"Error creating image for page {page_num}: {pixmap_e}", "error")
-                    continue # Skip this page
-
-                try:
-                    pix.save(image_filepath, "jpeg") # Save as JPG
-                except Exception as save_e:
-                    log_func(f"Error saving image file '{image_filename}': {save_e}", "error")
-                    continue # Skip this page
-
-            # --- IMPORTANT: Use STRING key for the map ---
-            page_image_map[str(page_num)] = image_filename # Map STRING page number to the final filename
-
-            # Log progress periodically
-            if page_num % 10 == 0 or page_num == num_pages:
-                log_func(f"Generated image for page {page_num}/{num_pages}...", "debug")
+                pages_to_render.append((i, image_filename))
+
+        # Pass 2: rendering
+        workers = min(render_workers or 1, len(pages_to_render) // MIN_PAGES_PER_RENDER_WORKER)
+        rendered_in_pool = False
+        if workers > 1:
+            step = math.ceil(len(pages_to_render) / workers)
+            page_ranges = [pages_to_render[j:j + step] for j in range(0, len(pages_to_render), step)]
+            log_func(f"Rendering {len(pages_to_render)} pages in {len(page_ranges)} worker processes...", "debug")
+            try:
+                # Spawned, not forked: the caller (the UI process) has gRPC channels and threads a fork would copy mid-call
+                with ProcessPoolExecutor(max_workers=len(page_ranges), mp_context=multiprocessing.get_context("spawn")) as render_pool:
+                    futures = [render_pool.submit(_render_page_range, pdf_path, page_range, final_image_folder_path, num_pages)
+                               for page_range in page_ranges]
+                    for future in futures:
+                        rendered, range_log = future.result()
+                        for message, level in range_log: log_func(message, level)
+                        page_image_map.update(rendered)
+                rendered_in_pool = True
+            except Exception as pool_e: # Pool could not start/died: render the remaining pages here
+                log_func(f"Parallel rendering unavailable ({pool_e}); rendering in this process.", "warning")
+                pages_to_render = [(i, name) for i, name in pages_to_render if str(i + 1) not in page_image_map]
+        if not rendered_in_pool:
+            page_image_map.update(_render_pages(doc, pages_to_render, final_image_folder_path, num_pages, log_func))
+        page_image_map = {key: page_image_map[key] for key in sorted(page_image_map, key=int)} # Page order, as before
 
         log_func(f"Image generation complete. Processed {len(page_image_map)} images.", "info")
         return final_image_folder_path, page_image_map
@@ -137,35 +206,161 @@ def generate_page_images(pdf_path, image_destination_path, sanitized_base_name,
         log_func(f"Error in image generation step: {e}\n{traceback.format_exc()}", "error")
         return None, {}
     finally:
-       # Ensure the document is closed even if errors occur
-       if doc:
+       # Ensure the document is closed even if errors occur (only if we opened it)
+       if owns_doc and doc:
         try:
             doc.close()
         except Exception:
             pass # Ignore errors during close
 
+# --- Page Image Cache (keyed by PDF content, so renamed/moved copies still hit) ---
+def pdf_content_hash(pdf_path, chunk_size=1024 * 1024):
+    """Content digest of a file for the cache key: BLAKE3 if installed (several times faster), else SHA-256.
+    The file is memory-mapped and hashed straight from the OS page cache (no copy into our memory); where it can't be
+    mapped (empty file, special filesystem) it is read into one reused buffer, so memory stays flat whatever the PDF size."""
+    if BLAKE3_INSTALLED:
+        digest, tag = blake3.blake3(max_threads=blake3.blake3.AUTO), "b3-" # Tagged so keys from the two algorithms never mix; AUTO: multithreaded on big inputs
+    else:
+        digest, tag = hashlib.sha256(), ""
+    with open(pdf_path, 'rb', buffering=0) as f: # Unbuffered: readinto fills our buffer directly, no extra copy
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError): # ValueError: empty file, which can't be mapped
+            mm = None
+        if mm is not None:
+            with mm:
+                digest.update(mm) # One call over the whole mapping (hashlib releases the GIL for it)
+            return tag + digest.hexdigest()
+        buf = bytearray(chunk_size); view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n: break
+            digest.update(view[:n])
+    return tag + digest.hexdigest()
+
+def _page_cache_entry_dir(content_hash):
+    """Cache folder for one PDF + the current rendering parameters."""
+    params_hash = hashlib.sha256(f"{PAGE_IMAGE_ZOOM}|{PAGE_IMAGE_FORMAT}".encode()).hexdigest()[:12]
+    return os.path.join(PDF_CACHE_DIR, "page_images", f"{content_hash}_{params_hash}")
+
+def prune_page_image_cache(max_bytes):
+    """Removes the least recently used page image cache entries beyond max_bytes. Returns (entries removed, bytes freed)."""
+    return prune_cache_dir(os.path.join(PDF_CACHE_DIR, "page_images"), max_bytes)
+
+def _copy_files(pairs):
+    """Copies (src, dst) pairs concurrently. Raises the first OSError after all copies have finished."""
+    pairs = list(pairs)
+    if len(pairs) < 2:
+        for src, dst in pairs: shutil.copyfile(src, dst)
+        return
+    with ThreadPoolExecutor(max_workers=min(IMAGE_COPY_WORKERS, len(pairs))) as pool:
+        for _ in pool.map(lambda pair: shutil.copyfile(*pair), pairs): pass # Drain to surface exceptions
+
+def load_cached_page_images(content_hash, image_destination_path, image_name_prefix, log_func):
+    """On a cache hit, places the cached pages into image_destination_path named like generate_page_images would.
+    Returns the page_image_map, or None on a miss (or if the entry is unusable)."""
+    entry_dir = _page_cache_entry_dir(content_hash)
+    try:
+        with open(os.path.join(entry_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+            cached_pages = json.load(f)["pages"] # {"1": "page_001.jpg", ...}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None # Miss (or a corrupt entry, which the next render overwrites)
+    touch_cache_entry(entry_dir) # Recently used: kept when the cache is pruned
+    try:
+        os.makedirs(image_destination_path, exist_ok=True)
+        page_image_map = {page_key: f"{image_name_prefix}_{page_part_name}" for page_key, page_part_name in cached_pages.items()}
+        _copy_files((os.path.join(entry_dir, cached_pages[page_key]), os.path.join(image_destination_path, image_filename))
+                    for page_key, image_filename in page_image_map.items())
+    except OSError as e:
+        log_func(f"Page image cache entry unusable ({e}); rendering instead.", "warning")
+        return None
+    log_func(f"Page image cache hit: reused {len(page_image_map)} images.", "info")
+    return page_image_map
+
+def store_page_images_in_cache(content_hash, image_folder_path, page_image_map, image_name_prefix, log_func):
+    """Copies freshly rendered pages into the cache. Failures only cost future cache hits."""
+    entry_dir = _page_cache_entry_dir(content_hash)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}" # Built aside and renamed, so readers never see half an entry
+    strip_len = len(image_name_prefix) + 1
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        cached_pages = {page_key: image_filename[strip_len:] for page_key, image_filename in page_image_map.items()} # "<prefix>_page_001.jpg" -> "page_001.jpg"
+        _copy_files((os.path.join(image_folder_path, page_image_map[page_key]), os.path.join(tmp_dir, page_part_name))
+                    for page_key, page_part_name in cached_pages.items())
+        with open(os.path.join(tmp_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump({"pages": cached_pages}, f)
+        shutil.rmtree(entry_dir, ignore_errors=True) # Replace any stale/corrupt entry
+        os.replace(tmp_dir, entry_dir)
+        log_func(f"Stored {len(cached_pages)} page images in cache.", "debug")
+    except OSError as e:
+        log_func(f"Could not store page images in cache: {e}", "warning")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def render_page_images_job(pdf_path, image_destination_path, sanitized_base_name,
+                           save_direct_flag, filename_prefix=None, use_cache=True, content_hash=None):
+    """Process-pool entry point for generate_page_images, with the page image cache checked first.
+    Pass the PDF's pdf_content_hash as content_hash if the caller already has it (saves re-reading the file).
+    Tk objects can't cross the process boundary, so log lines are collected and returned for the caller to replay.
+    Returns (final_image_folder_path, page_image_map, [(message, level), ...])."""
+    log_records = []
+    def collect_log(message, level="info"): log_records.append((message, level))
+    image_name_prefix = filename_prefix or sanitized_base_name
+    if not use_cache:
+        content_hash = None
+    elif content_hash is None:
+        try:
+            content_hash = pdf_content_hash(pdf_path)
+        except OSError as e:
+            collect_log(f"Could not hash '{os.path.basename(pdf_path)}' for the page image cache: {e}", "warning")
+    if content_hash:
+        page_image_map = load_cached_page_images(content_hash, image_destination_path, image_name_prefix, collect_log)
+        if page_image_map is not None:
+            return image_destination_path, page_image_map, log_records
+    try: # Opened here so the page count is known for the cache check below (without PyMuPDF, generate_page_images raises)
+        doc = fitz.open(pdf_path) if PYMUPDF_INSTALLED else None
+    except Exception as e:
+        collect_log(f"Error opening PDF '{os.path.basename(pdf_path)}': {e}", "error")
+        return None, {}, log_records
+    try:
+        final_image_folder_path, page_image_map = generate_page_images(
+            pdf_path, image_destination_path, sanitized_base_name, save_direct_flag, collect_log,
+            parent_widget=None, filename_prefix=filename_prefix, doc=doc # No UI in a worker process: existing images are overwritten
+        )
+        num_pages = len(doc)
+    finally:
+        if doc is not None: doc.close()
+    if content_hash and final_image_folder_path and page_image_map:
+        if len(page_image_map) == num_pages: # Only a complete render is cached: a missing page would stay missing on every hit
+            store_page_images_in_cache(content_hash, final_image_folder_path, page_image_map, image_name_prefix, collect_log)
+        else:
+            collect_log(f"Rendered {len(page_image_map)} of {num_pages} pages of '{os.path.basename(pdf_path)}'; not caching the page images.", "warning")
+    # Worker processes render PDF after PDF; trim MuPDF's object store between them so memory doesn't keep growing
+    if fitz is not None and hasattr(fitz, "TOOLS"):
+        try: fitz.TOOLS.store_shrink(100)
+        except Exception: pass
+    return final_image_folder_path, page_image_map, log_records
+
 # --- Text Extraction (No change from original) ---
-def extract_text_from_pdf(pdf_path, log_func):
-    """Extracts plain text from a PDF file using PyMuPDF."""
+def extract_text_from_pdf(pdf_path, log_func, doc=None):
+    """Extracts plain text from a PDF file using PyMuPDF.
+    Pass an open fitz.Document of pdf_path as doc to skip re-opening it; the caller keeps ownership."""
     log_func(f"Extracting text from PDF: {os.path.basename(pdf_path)}", "debug")
     if not PYMUPDF_INSTALLED or not fitz:
         log_func("PyMuPDF (fitz) is not available.", "error")
         return None
 
-    text = ""
-    doc = None
+    owns_doc = doc is None
     try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text("text") + "\n\n" # Add newline between pages
+        if owns_doc: doc = fitz.open(pdf_path)
+        # One join instead of growing a string page by page (quadratic copying on long books)
+        text = "\n\n".join(page.get_text("text") for page in doc) # Blank line between pages
         log_func(f"Finished extracting text from {len(doc)} pages.", "debug")
         return text.strip()
     except Exception as e:
         log_func(f"Error extracting text from PDF '{os.path.basename(pdf_path)}': {e}", "error")
         return None
     finally:
-        if doc:
+        if owns_doc and doc:
             try:
                 doc.close()
             except Exception:
@@ -209,8 +404,8 @@ def generate_tsv_visual(parsed_data, page_image_map, log_func, return_rows=False
     (This function remains unchanged as the issue is likely in generate_tsv_from_json_data)
     """
     log_func("Generating Visual Q&A TSV data from JSON...", "info")
-    header = ["Question", "QuestionMedia", "Answer", "AnswerMedia"]
-    output_rows = [header] # Start with header
+    header = VISUAL_TSV_HEADER
+    output_rows = [list(header)] # Start with header
 
     if not isinstance(parsed_data, list):
          log_func("TSV Generation Error: Input data is not a list.", "error")
@@ -277,7 +472,7 @@ def generate_tsv_visual(parsed_data, page_image_map, log_func, return_rows=False
                 tsv_output_dir = '.'
             tsv_filepath = os.path.join(tsv_output_dir, tsv_filename)
             try:
-                with open(tsv_filepath, 'w', encoding='utf-8', newline='') as f:
+                with open(tsv_filepath, 'w', encoding='utf-8', newline='', buffering=TSV_WRITE_BUFFER_SIZE) as f:
                     writer = csv.writer(f, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
                     writer.writerows(output_rows)
                 log_func(f"Saved Visual TSV file to: {tsv_filepath}", "info")
@@ -299,24 +494,25 @@ def generate_tsv_text_analysis(parsed_data, tsv_output_dir, sanitized_base_name,
     log_func("Generating Text Analysis TSV file (Question/Answer only)...", "info")
     tsv_filename = f"{sanitized_base_name}_text_analysis.txt"
     tsv_filepath = os.path.join(tsv_output_dir, tsv_filename)
-    header = ["Question", "Answer"]
+    header = TEXT_ANALYSIS_TSV_HEADER
     if not isinstance(parsed_data, list):
         log_func("TSV Generation Error: Input data is not a list.", "error")
         parsed_data = []
     if not parsed_data:
         log_func("No data provided for text analysis TSV generation. Creating file with header only.", "warning")
+    def iter_text_rows():
+        for item in parsed_data:
+            if isinstance(item, dict):
+                question = item.get("question", "").replace("\n", "<br>").replace("\t", " ")
+                answer = item.get("answer", "").replace("\n", "<br>").replace("\t", " ")
+                yield (question, answer)
+            else:
+                log_func(f"Warning: Skipping non-dictionary item in text analysis data: {item}", "warning")
     try:
-        with open(tsv_filepath, 'w', encoding='utf-8', newline='') as f:
+        with open(tsv_filepath, 'w', encoding='utf-8', newline='', buffering=TSV_WRITE_BUFFER_SIZE) as f:
             writer = csv.writer(f, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
             writer.writerow(header)
-            for item in parsed_data:
-                if isinstance(item, dict):
-                    question = item.get("question", "").replace("\n", "<br>").replace("\t", " ")
-                    answer = item.get("answer", "").replace("\n", "<br>").replace("\t", " ")
-                    row_values = [question, answer]
-                    writer.writerow(row_values)
-                else:
-                    log_func(f"Warning: Skipping non-dictionary item in text analysis data: {item}", "warning")
+            writer.writerows(iter_text_rows())
         log_func(f"Saved Text Analysis TSV file to '{tsv_filename}'. Processed {len(parsed_data)} items.", "info")
         return tsv_filepath
     except IOError as e:
@@ -328,10 +524,21 @@ def generate_tsv_text_analysis(parsed_data, tsv_output_dir, sanitized_base_name,
 
 
 # --- CORRECTED FUNCTION ---
+def attach_page_image_map(parsed_data, page_image_map, source_pdf_prefix):
+    """
+    Tags extracted items with their source PDF for generate_tsv_from_json_data. Every item carries its own
+    '_page_image_map', so each item converts on its own (filtered, reordered or hand-edited JSON keeps its media).
+    """
+    for item in parsed_data:
+        if isinstance(item, dict):
+            item['_page_image_map'] = page_image_map # Map page numbers to image filenames (same dict object, shared in memory)
+            item['_source_pdf_prefix'] = source_pdf_prefix # Store the base name for reference
+    return parsed_data
+
 def generate_tsv_from_json_data(json_data, tsv_output_path, log_func):
     """
     Generates a TSV file with specific columns (Question, QuestionMedia, Answer, AnswerMedia, Tags)
-    from a list of JSON objects (dictionaries).
+    from a list (or any iterable, e.g. a generator) of JSON objects (dictionaries). Rows are streamed to disk.
     Assumes input dictionaries contain keys like 'question_text', 'answer_text', 'Tags',
     '_page_image_map', 'question_page', 'relevant_question_image_pages',
     'answer_page', 'relevant_answer_image_pages'.
@@ -339,23 +546,12 @@ def generate_tsv_from_json_data(json_data, tsv_output_path, log_func):
     log_func(f"Generating 5-column Anki TSV from JSON data to {os.path.basename(tsv_output_path)}...", "info")
 
     # --- Define the fixed 5-column header ---
-    header = ["Question", "QuestionMedia", "Answer", "AnswerMedia", "Tags"]
+    header = TAGGED_TSV_HEADER
 
-    if not isinstance(json_data, list):
-        log_func("TSV Generation Error: Input data is not a list.", "error")
+    if isinstance(json_data, (str, bytes, dict)) or not hasattr(json_data, '__iter__'):
+        log_func("TSV Generation Error: Input data is not a list of items.", "error")
         return False # Indicate failure
-
-    if not json_data:
-        log_func("Warning: Input JSON data is empty. Creating TSV with header only.", "warning")
-        # Write only header if data is empty
-        try:
-            with open(tsv_output_path, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
-                writer.writerow(header)
-            return True # Success (empty file created)
-        except IOError as e:
-            log_func(f"Error writing empty TSV file '{tsv_output_path}': {e}", "error")
-            return False
+    rows_written = 0 # Counted while streaming, since a generator has no len()
 
     # --- Helper function to create image tags ---
     def get_img_tag(page_number, page_map, item_index):
@@ -392,80 +588,88 @@ def generate_tsv_from_json_data(json_data, tsv_output_path, log_func):
              log_func(f"Warning: Invalid page number '{page_number}' type ({type(page_number).__name__}) or value for item {item_index + 1}: {e}", "warning")
              return None # Return None if page number is invalid
 
+    def iter_tagged_rows():
+        """Yields one 5-column row per valid item; consumed by csv.writer.writerows."""
+        nonlocal rows_written
+        for i, item in enumerate(json_data):
+            if not isinstance(item, dict):
+                log_func(f"Warning: Skipping non-dictionary item at index {i}.", "warning")
+                continue
+
+            # Extract core fields
+            question_text = item.get("question_text", item.get("Question", ""))
+            answer_text = item.get("answer_text", item.get("Answer", ""))
+            tags = item.get("Tags", "") # Assumes 'Tags' key is added by tagging step
+
+            # Clean text fields (replace newlines with <br>, tabs with space)
+            question_cleaned = str(question_text).replace("\n", "<br>").replace("\t", " ")
+            answer_cleaned = str(answer_text).replace("\n", "<br>").replace("\t", " ")
+
+            # --- Construct Media Strings ---
+            page_image_map = item.get("_page_image_map", {}) # Get the map for this item
+            q_media_tags = set()
+            a_media_tags = set()
+
+            # Question Media Pages
+            q_page_num = item.get("question_page")
+            rel_q_pages = item.get("relevant_question_image_pages", [])
+
+            # Add image tag for the main question page number
+            if q_page_num is not None:
+                q_context_tag = get_img_tag(q_page_num, page_image_map, i)
+                if q_context_tag: q_media_tags.add(q_context_tag)
+
+            # Add image tags for relevant question image pages
+            if isinstance(rel_q_pages, list):
+                for pg in rel_q_pages:
+                    tag = get_img_tag(pg, page_image_map, i)
+                    if tag: q_media_tags.add(tag)
+            elif rel_q_pages: # Log if it exists but isn't a list
+                 log_func(f"Warning: 'relevant_question_image_pages' is not a list for item {i+1}.", "warning")
+
+            # Answer Media Pages
+            a_page_num = item.get("answer_page")
+            rel_a_pages = item.get("relevant_answer_image_pages", [])
+
+            # Add image tag for the main answer page number
+            if a_page_num is not None:
+                 a_context_tag = get_img_tag(a_page_num, page_image_map, i)
+                 if a_context_tag: a_media_tags.add(a_context_tag)
+
+            # Add image tags for relevant answer image pages
+            if isinstance(rel_a_pages, list):
+                for pg in rel_a_pages:
+                    tag = get_img_tag(pg, page_image_map, i)
+                    if tag: a_media_tags.add(tag)
+            elif rel_a_pages: # Log if it exists but isn't a list
+                 log_func(f"Warning: 'relevant_answer_image_pages' is not a list for item {i+1}.", "warning")
+
+            # Combine media tags into space-separated strings
+            question_media_string = " ".join(sorted(list(q_media_tags)))
+            answer_media_string = " ".join(sorted(list(a_media_tags)))
+
+            # Assemble the final row with exactly 5 columns in the specified order
+            row_to_write = [
+                question_cleaned,
+                question_media_string,
+                answer_cleaned,
+                answer_media_string,
+                tags # Use the tags string directly
+            ]
+            rows_written += 1
+            yield row_to_write
+
     # --- Process data and write to TSV ---
     try:
-        with open(tsv_output_path, 'w', encoding='utf-8', newline='') as f:
+        with open(tsv_output_path, 'w', encoding='utf-8', newline='', buffering=TSV_WRITE_BUFFER_SIZE) as f:
             writer = csv.writer(f, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
             writer.writerow(header) # Write the fixed header
+            writer.writerows(iter_tagged_rows()) # Single C-level loop over all rows, nothing buffered besides the file buffer
 
-            for i, item in enumerate(json_data):
-                if not isinstance(item, dict):
-                    log_func(f"Warning: Skipping non-dictionary item at index {i}.", "warning")
-                    continue
-
-                # Extract core fields
-                question_text = item.get("question_text", item.get("Question", ""))
-                answer_text = item.get("answer_text", item.get("Answer", ""))
-                tags = item.get("Tags", "") # Assumes 'Tags' key is added by tagging step
-
-                # Clean text fields (replace newlines with <br>, tabs with space)
-                question_cleaned = str(question_text).replace("\n", "<br>").replace("\t", " ")
-                answer_cleaned = str(answer_text).replace("\n", "<br>").replace("\t", " ")
-
-                # --- Construct Media Strings ---
-                page_image_map = item.get("_page_image_map", {}) # Get the map for this item
-                q_media_tags = set()
-                a_media_tags = set()
-
-                # Question Media Pages
-                q_page_num = item.get("question_page")
-                rel_q_pages = item.get("relevant_question_image_pages", [])
-
-                # Add image tag for the main question page number
-                if q_page_num is not None:
-                    q_context_tag = get_img_tag(q_page_num, page_image_map, i)
-                    if q_context_tag: q_media_tags.add(q_context_tag)
-
-                # Add image tags for relevant question image pages
-                if isinstance(rel_q_pages, list):
-                    for pg in rel_q_pages:
-                        tag = get_img_tag(pg, page_image_map, i)
-                        if tag: q_media_tags.add(tag)
-                elif rel_q_pages: # Log if it exists but isn't a list
-                     log_func(f"Warning: 'relevant_question_image_pages' is not a list for item {i+1}.", "warning")
-
-                # Answer Media Pages
-                a_page_num = item.get("answer_page")
-                rel_a_pages = item.get("relevant_answer_image_pages", [])
-
-                # Add image tag for the main answer page number
-                if a_page_num is not None:
-                     a_context_tag = get_img_tag(a_page_num, page_image_map, i)
-                     if a_context_tag: a_media_tags.add(a_context_tag)
-
-                # Add image tags for relevant answer image pages
-                if isinstance(rel_a_pages, list):
-                    for pg in rel_a_pages:
-                        tag = get_img_tag(pg, page_image_map, i)
-                        if tag: a_media_tags.add(tag)
-                elif rel_a_pages: # Log if it exists but isn't a list
-                     log_func(f"Warning: 'relevant_answer_image_pages' is not a list for item {i+1}.", "warning")
-
-                # Combine media tags into space-separated strings
-                question_media_string = " ".join(sorted(list(q_media_tags)))
-                answer_media_string = " ".join(sorted(list(a_media_tags)))
-
-                # Assemble the final row with exactly 5 columns in the specified order
-                row_to_write = [
-                    question_cleaned,
-                    question_media_string,
-                    answer_cleaned,
-                    answer_media_string,
-                    tags # Use the tags string directly
-                ]
-                writer.writerow(row_to_write)
-
-        log_func(f"Successfully generated 5-column TSV file with {len(json_data)} data rows.", "info")
+        if rows_written == 0:
+            log_func("Warning: Input JSON data is empty. Created TSV with header only.", "warning")
+        else:
+            log_func(f"Successfully generated 5-column TSV file with {rows_written} data rows.", "info")
         return True # Indicate success
 
     except IOError as e:
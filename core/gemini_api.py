@@ -6,14 +6,27 @@ import time
 import re
 import traceback
 import os
+import functools
+import threading
+import hashlib
+import datetime
 from tkinter import messagebox
 import math
+import random
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List # Keep List for schema definition
 from pydantic import BaseModel, Field, ValidationError # Added Pydantic
+try:
+    from google.generativeai import caching as genai_caching # Context caching (newer SDK versions only)
+except ImportError:
+    genai_caching = None
 
 # Use relative imports ONLY
-from ..constants import GEMINI_SAFETY_SETTINGS
-from ..utils.helpers import ProcessingError, sanitize_filename, save_tsv_incrementally
+from ..constants import (GEMINI_SAFETY_SETTINGS, GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT, TAG_MAX_CONCURRENT_BATCHES,
+                         ORJSON_INSTALLED, orjson)
+from ..utils.helpers import ProcessingError, sanitize_filename, save_tsv_incrementally, JsonArrayWriter
 from ..prompts import BATCH_TAGGING, SECOND_PASS_TAGGING
 
 
@@ -90,13 +103,87 @@ except Exception as e:
     print(f"Initial dummy genai configure failed (might be ok if key set later): {e}")
 
 
+# genai.configure() throws away the SDK's cached service clients (and their open channels),
+# so only call it when the key actually changes; every other call reuses the live connection.
+_configured_api_key = None
+_configure_lock = threading.Lock()
+_model_cache = {} # (model name, variant) -> GenerativeModel, shared by all threads (guarded by _configure_lock)
+_prompt_cache_unsupported = set() # (model name, prompt sha256) that can't be cached (see below); not retried (guarded by _configure_lock)
+PROMPT_CACHE_TTL = datetime.timedelta(hours=1)
+_PROMPT_CACHE_EXPIRY_MARGIN = 300 # Seconds before expiry after which batches stop using the cache and send the full prompt
+# Cache creation errors that will recur for the same model/prompt: the model has no caching (NotFound / InvalidArgument),
+# the prompt is below its minimum cache size (InvalidArgument), or the SDK can't make the request. Other errors (quota,
+# unavailable, timeouts) are transient, so creation is tried again by the next pass
+_PROMPT_CACHE_UNSUPPORTED_ERRORS = (TypeError, AttributeError, NotImplementedError) + tuple(
+    getattr(google.api_core.exceptions, name) for name in ("InvalidArgument", "NotFound") if hasattr(google.api_core.exceptions, name))
+
+def _get_model(model_name, variant="plain", **model_kwargs):
+    """Returns a cached GenerativeModel so repeated calls reuse the same instance and its underlying client.
+    Callers passing different model_kwargs must use a different variant name."""
+    key = (model_name, variant)
+    with _configure_lock:
+        model = _model_cache.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, safety_settings=GEMINI_SAFETY_SETTINGS, **model_kwargs)
+            _model_cache[key] = model
+        return model
+
+def _create_prompt_cache(model_name, prompt, log_func):
+    """Stores `prompt` server-side with Gemini context caching, as the leading user turn of the conversation, so requests
+    only send (and are billed for) the turn after it. Uncached requests send the same two turns (see _prompt_turn), so
+    the model sees the same conversation either way. Returns (model, cached content, expiry time), or None when caching is
+    unavailable: older SDK, a model without caching support, or a prompt below the model's minimum cache size.
+    The caller owns the cache and must pass it to _delete_prompt_cache when done (storage is billed until then)."""
+    if genai_caching is None: return None
+    key = (model_name, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    with _configure_lock:
+        if key in _prompt_cache_unsupported: return None
+    try:
+        cached_content = genai_caching.CachedContent.create(model=f"models/{model_name}", contents=[_prompt_turn(prompt)], ttl=PROMPT_CACHE_TTL)
+    except _PROMPT_CACHE_UNSUPPORTED_ERRORS as e:
+        log_func(f"Prompt caching not available for '{model_name}' ({type(e).__name__}: {e}); sending the full prompt with each batch.", "debug")
+        with _configure_lock: _prompt_cache_unsupported.add(key)
+        return None
+    except Exception as e: # Transient (quota, unavailable, timeout): this pass goes without, the next one tries again
+        log_func(f"Could not cache the tagging prompt for '{model_name}' ({type(e).__name__}: {e}); sending the full prompt with each batch.", "debug")
+        return None
+    expires_at = time.time() + PROMPT_CACHE_TTL.total_seconds()
+    try:
+        model = genai.GenerativeModel.from_cached_content(cached_content=cached_content, safety_settings=GEMINI_SAFETY_SETTINGS)
+    except Exception as e:
+        log_func(f"Could not use the cached prompt for '{model_name}' ({type(e).__name__}: {e}); sending the full prompt with each batch.", "debug")
+        _delete_prompt_cache((None, cached_content, expires_at), log_func)
+        return None
+    log_func(f"Cached the tagging prompt for '{model_name}' (expires in {PROMPT_CACHE_TTL} unless deleted first).", "debug")
+    return model, cached_content, expires_at
+
+def _prompt_turn(text):
+    """One user turn of a tagging request: the prompt (cached or not) and the batch are sent as two of these."""
+    return {"role": "user", "parts": [text]}
+
+def _delete_prompt_cache(prompt_cache, log_func):
+    """Deletes a cache made by _create_prompt_cache (no-op for None). Errors are logged only; the TTL still applies."""
+    if prompt_cache is None: return
+    try:
+        prompt_cache[1].delete()
+        log_func("Deleted the cached tagging prompt.", "debug")
+    except Exception as e:
+        log_func(f"Could not delete the cached tagging prompt ({type(e).__name__}: {e}); it expires on its own.", "debug")
+
 def configure_gemini(api_key):
-    """Configures the Gemini library with the provided API key."""
+    """Configures the Gemini library with the provided API key (no-op if already configured with it)."""
+    global _configured_api_key
     if not api_key or api_key == "YOUR_API_KEY_HERE":
         print("Error: API key missing or placeholder.")
         return False
     try:
-        genai.configure(api_key=api_key)
+        with _configure_lock:
+            if api_key == _configured_api_key:
+                return True
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            _model_cache.clear() # Cached models may hold a client bound to the previous key
+            _prompt_cache_unsupported.clear() # Caching support is checked again under the new key
         print("Gemini API configured successfully.")
         return True
     except Exception as e:
@@ -104,6 +191,16 @@ def configure_gemini(api_key):
         traceback.print_exc()
         return False
 
+def warm_up_gemini(api_key, model_name):
+    """Configures the key and opens the API connection ahead of the first real request, so its channel/TLS setup
+    overlaps local work (hashing, page rendering). count_tokens is free, and goes through the same cached model and
+    client the generate calls use. Errors are ignored: the real call reports them."""
+    if not configure_gemini(api_key): return
+    try:
+        _get_model(model_name).count_tokens("ping")
+    except Exception as e:
+        print(f"Gemini warm-up skipped: {type(e).__name__}: {e}")
+
 
 # --- Modified parse_batch_tag_response function ---
 def parse_batch_tag_response(response_text, batch_size, allowed_tags_set_for_pass):
@@ -165,9 +262,103 @@ def parse_batch_tag_response(response_text, batch_size, allowed_tags_set_for_pas
     return tags_list
 
 
+# --- Rate Limiting ---
+def estimate_tokens(text):
+    """Rough token count for rate limiting (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter for Gemini calls.
+    acquire() blocks only as long as needed to stay under requests/minute, tokens/minute and the minimum
+    spacing between request starts (the old fixed delay, which now overlaps with the previous call's latency).
+    """
+    WINDOW_S = 60.0
+
+    def __init__(self, rpm=GEMINI_RPM_LIMIT, tpm=GEMINI_TPM_LIMIT, min_interval=0.0):
+        self.rpm = rpm; self.tpm = tpm; self.min_interval = max(0.0, min_interval or 0.0)
+        self._request_times = deque() # Start times within the window
+        self._token_times = deque() # (start time, estimated tokens) within the window
+        self._window_tokens = 0
+        self._last_start = None
+        self._paused_until = 0.0 # Set by pause() after a 429: every caller holds off until then
+        self._lock = threading.Lock()
+
+    def _wait_needed(self, now, est_tokens):
+        """Seconds to wait before a request of est_tokens may start (caller holds the lock)."""
+        cutoff = now - self.WINDOW_S
+        while self._request_times and self._request_times[0] <= cutoff: self._request_times.popleft()
+        while self._token_times and self._token_times[0][0] <= cutoff: self._window_tokens -= self._token_times.popleft()[1]
+        wait = self._paused_until - now
+        if self._last_start is not None: wait = max(wait, self._last_start + self.min_interval - now)
+        if self.rpm and len(self._request_times) >= self.rpm:
+            wait = max(wait, self._request_times[0] + self.WINDOW_S - now)
+        if self.tpm and self._token_times and self._window_tokens + est_tokens > self.tpm:
+            # Wait until enough of the window's tokens expire (a single request larger than the budget runs once the window is empty)
+            excess = self._window_tokens + est_tokens - self.tpm
+            for start, tokens in self._token_times:
+                excess -= tokens
+                if excess <= 0: break
+            wait = max(wait, start + self.WINDOW_S - now)
+        return wait
+
+    def acquire(self, est_tokens=0, log_func=None):
+        """Blocks until a request may start, then records it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._wait_needed(now, est_tokens)
+                if wait <= 0:
+                    self._last_start = now
+                    self._request_times.append(now)
+                    self._token_times.append((now, est_tokens)); self._window_tokens += est_tokens
+                    return
+            if log_func and wait >= 1.0: log_func(f"Rate limit: waiting {wait:.1f}s...", "debug")
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every request for `seconds` (the server said we are over quota), which also drains concurrent callers."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# --- Retry with exponential backoff for transient Gemini errors (429 quota, 5xx, timeouts) ---
+_API_ERRORS = google.api_core.exceptions
+_THROTTLE_ERRORS = tuple(getattr(_API_ERRORS, name) for name in ("ResourceExhausted", "TooManyRequests") if hasattr(_API_ERRORS, name))
+_RETRYABLE_ERRORS = _THROTTLE_ERRORS + tuple(getattr(_API_ERRORS, name) for name in
+                                             ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded") if hasattr(_API_ERRORS, name))
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY_S = 1.0 # Doubles per attempt, capped at RETRY_MAX_DELAY_S; each wait is jittered
+RETRY_MAX_DELAY_S = 30.0
+
+def _call_with_retry(call, log_func, what, limiter=None, est_tokens=0):
+    """Returns call(), retrying transient API errors with jittered exponential backoff (other errors raise at once).
+    With a limiter, every attempt waits for its budget, and a quota error pauses the limiter for all its callers."""
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        if limiter: limiter.acquire(est_tokens, log_func)
+        try:
+            return call()
+        except _RETRYABLE_ERRORS as e:
+            if attempt == RETRY_MAX_ATTEMPTS: raise
+            ceiling = min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** attempt)
+            wait = random.uniform(ceiling / 2, ceiling) # Jitter: concurrent callers don't all retry at the same moment
+            if limiter and isinstance(e, _THROTTLE_ERRORS): limiter.pause(wait)
+            log_func(f"{what}: {type(e).__name__}, retrying in {wait:.1f}s (attempt {attempt + 1}/{RETRY_MAX_ATTEMPTS})...", "warning")
+            time.sleep(wait)
+
+
+# --- JSON (orjson when installed: same results, C speed; orjson.JSONDecodeError subclasses json.JSONDecodeError) ---
+_json_loads = orjson.loads if ORJSON_INSTALLED else json.loads
+
 # --- Helper for Incremental Saving (JSON) ---
+# Callers save the same growing list after every batch. Per temp file we remember which list it was (its id and last
+# saved item, not the list itself), how many items are on disk, the offset before the closing "]" and the file size,
+# so the next save appends only the new items.
+_incremental_json_state = {} # temp file path -> (id(data_list), last saved item, count, resume_offset, file_size)
+
 def save_json_incrementally(data_list, output_dir, base_filename, step_name, log_func):
-    """Saves the current list of parsed JSON objects to a temporary file."""
+    """Saves the current list of parsed JSON objects to a temporary file.
+    When called again with the same (grown) list, only the new items are written; the file is a complete JSON array after every call."""
     if not data_list:
         log_func(f"No data to save for {step_name}.", "debug")
         return None
@@ -183,13 +374,23 @@ def save_json_incrementally(data_list, output_dir, base_filename, step_name, log
     temp_filename = f"{base_filename}_{step_name}_temp_results.json"
     temp_filepath = os.path.join(output_dir, temp_filename)
     try:
-        # Ensure data_list contains dictionaries, not Pydantic models, before saving
-        dict_list = [item.model_dump() if isinstance(item, BaseModel) else item for item in data_list]
-        with open(temp_filepath, 'w', encoding='utf-8') as f:
-            json.dump(dict_list, f, indent=2)
-        log_func(f"Saved intermediate {step_name} results ({len(dict_list)} items) to {temp_filename}", "debug")
+        state = _incremental_json_state.pop(temp_filepath, None)
+        resume_at, saved_count = None, 0
+        if state is not None:
+            prev_id, prev_last, prev_count, prev_offset, prev_size = state
+            # Append only if this is the same list, it has only grown, and nobody touched the file since
+            if (prev_id == id(data_list) and prev_count <= len(data_list) and data_list[prev_count - 1] is prev_last
+                    and os.path.getsize(temp_filepath) == prev_size):
+                resume_at, saved_count = prev_offset, prev_count
+        with JsonArrayWriter(temp_filepath, resume_at=resume_at, resume_count=saved_count) as writer:
+            # Ensure items are dictionaries, not Pydantic models, before saving
+            writer.write_items(item.model_dump() if isinstance(item, BaseModel) else item for item in data_list[saved_count:])
+            offset = writer.checkpoint(fsync=False) # Temp results: the OS writes them back on its own schedule
+        _incremental_json_state[temp_filepath] = (id(data_list), data_list[-1], len(data_list), offset, os.path.getsize(temp_filepath))
+        log_func(f"Saved intermediate {step_name} results ({len(data_list)} items, {len(data_list) - saved_count} new) to {temp_filename}", "debug")
         return temp_filepath
     except Exception as e:
+        _incremental_json_state.pop(temp_filepath, None)
         log_func(f"Error saving intermediate {step_name} results to {temp_filepath}: {e}", "error")
         return None
 
@@ -256,15 +457,15 @@ def call_gemini_visual_extraction(
         log_func(f"PDF uploaded ({upload_duration:.1f}s). URI: {uploaded_file_uri}", "info")
 
         # Initialize model WITHOUT generation config initially
-        model = genai.GenerativeModel(model_name, safety_settings=GEMINI_SAFETY_SETTINGS)
+        model = _get_model(model_name)
 
         log_func(f"Sending JSON extraction request to Gemini ({model_name}) with dictionary schema...", "info")
         api_start_time = time.time()
 
         # Pass the generation_config_dict directly to generate_content
-        response = model.generate_content(
-            [prompt_text, uploaded_file],
-            generation_config=generation_config_dict
+        response = _call_with_retry(
+            functools.partial(model.generate_content, [prompt_text, uploaded_file], generation_config=generation_config_dict),
+            log_func, "Visual extraction request"
         )
         api_duration = time.time() - api_start_time
         log_func(f"Received response from Gemini ({api_duration:.1f}s).", "info")
@@ -300,14 +501,14 @@ def call_gemini_visual_extraction(
                 if json_string:
                     parsed_data = None # Initialize parsed_data for this block
                     try:
-                        parsed_data = json.loads(json_string)
+                        parsed_data = _json_loads(json_string)
                     except json.JSONDecodeError as e:
                         log_func(f"Direct JSON parsing failed: {e}. Trying to strip markdown...", "warning")
                         cleaned_json_string = re.sub(r"^```json\s*", "", json_string.strip(), flags=re.IGNORECASE)
                         cleaned_json_string = re.sub(r"\s*```$", "", cleaned_json_string)
                         if cleaned_json_string != json_string:
                             try:
-                                parsed_data = json.loads(cleaned_json_string)
+                                parsed_data = _json_loads(cleaned_json_string)
                                 log_func("Parsing successful after stripping markdown.", "info")
                             except json.JSONDecodeError as e2:
                                 log_func(f"Parsing failed even after stripping: {e2}", "error")
@@ -418,7 +619,7 @@ def call_gemini_visual_extraction(
 # ... (call_gemini_text_analysis function remains unchanged) ...
 def call_gemini_text_analysis(
     text_content, api_key, model_name, prompt, log_func,
-    output_dir, base_filename, chunk_size=30000, api_delay=5.0, parent_widget=None
+    output_dir, base_filename, chunk_size=30000, api_delay=5.0, parent_widget=None, rate_limiter=None
 ):
     """Calls Gemini with text content in chunks expecting structured JSON output based on BookProcessingItem schema."""
     log_func(f"Processing text with Gemini ({model_name}) in chunks (Structured Output)...", "info")
@@ -432,6 +633,8 @@ def call_gemini_text_analysis(
     if total_len == 0: log_func("Input text empty. Skipping.", "warning"); return []
 
     num_chunks = math.ceil(total_len / chunk_size)
+    # api_delay is now the minimum spacing between request starts, on top of the RPM/TPM budget
+    limiter = rate_limiter or RateLimiter(min_interval=api_delay)
     log_func(f"Splitting text ({total_len} chars) into ~{num_chunks} chunks of size {chunk_size}.", "debug")
 
     block_reason_enum = getattr(genai.types, "BlockReason", None)
@@ -449,7 +652,7 @@ def call_gemini_text_analysis(
 
     try:
         # Pass the config during model initialization
-        model = genai.GenerativeModel(model_name, safety_settings=GEMINI_SAFETY_SETTINGS, generation_config=generation_config)
+        model = _get_model(model_name, "text_analysis", generation_config=generation_config)
     except Exception as model_e:
          error_msg = f"Failed to initialize Gemini model '{model_name}': {model_e}"; log_func(error_msg, "error")
          if parent_widget: messagebox.showerror("API Error", error_msg, parent=parent_widget)
@@ -469,7 +672,8 @@ def call_gemini_text_analysis(
             log_func(f"Sending chunk {chunk_num} request with structured output schema...", "debug")
             api_start_time = time.time()
             # Pass config to generate_content (redundant if set on model, but safe)
-            response = model.generate_content(full_prompt, generation_config=generation_config)
+            response = _call_with_retry(functools.partial(model.generate_content, full_prompt, generation_config=generation_config),
+                                        log_func, f"Chunk {chunk_num}", limiter, estimate_tokens(full_prompt))
             api_duration = time.time() - api_start_time
             log_func(f"Received response chunk {chunk_num} ({api_duration:.1f}s).", "debug")
 
@@ -512,14 +716,14 @@ def call_gemini_text_analysis(
                         if raw_response_text:
                             parsed_data = None # Initialize for this block
                             try:
-                                parsed_data = json.loads(raw_response_text)
+                                parsed_data = _json_loads(raw_response_text)
                             except json.JSONDecodeError:
                                 # Try stripping markdown
                                 cleaned_json_string = re.sub(r"^```json\s*", "", raw_response_text, flags=re.IGNORECASE)
                                 cleaned_json_string = re.sub(r"\s*```$", "", cleaned_json_string)
                                 if cleaned_json_string != raw_response_text:
                                     try:
-                                        parsed_data = json.loads(cleaned_json_string)
+                                        parsed_data = _json_loads(cleaned_json_string)
                                         log_func("Parsing successful after stripping markdown.", "info")
                                     except json.JSONDecodeError as e2:
                                         log_func(f"Parsing Error: Failed JSON decode chunk {chunk_num} even after stripping: {e2}", "error")
@@ -602,7 +806,6 @@ def call_gemini_text_analysis(
 
         chunk_end_time = time.time()
         log_func(f"Finished chunk {chunk_num}. Parsed OK: {chunk_parsed_successfully}. Time: {chunk_end_time - chunk_start_time:.2f}s", "debug")
-        if chunk_num < num_chunks and api_delay > 0: log_func(f"Waiting {api_delay:.1f}s...", "debug"); time.sleep(api_delay)
 
     log_func("Text analysis Gemini calls complete.", "info")
     if had_unrecoverable_error:
@@ -634,6 +837,9 @@ def tag_tsv_rows_gemini(
     enable_second_pass=False, # Flag indicating if this call is for Pass 2 (triggers merge)
     second_pass_model_name=None, # Keep for consistency, though not used directly here
     second_pass_prompt=None, # Keep for consistency, though not used directly here
+    rate_limiter=None, # Shared RateLimiter; by default one is built from api_delay
+    max_concurrent_batches=TAG_MAX_CONCURRENT_BATCHES, # Batches in flight at once
+    stop_event=None, # threading.Event; once set, no further batch is sent and the pass ends without yielding items
 ):
     """
     Tags JSON data items using Gemini batches. If enable_second_pass is True,
@@ -678,7 +884,7 @@ def tag_tsv_rows_gemini(
     current_allowed_tags = ALLOWED_TAGS_SET_PASS_2 if enable_second_pass else ALLOWED_TAGS_SET # Choose allowed tags based on pass
 
     try:
-        current_model = genai.GenerativeModel(current_model_name, safety_settings=GEMINI_SAFETY_SETTINGS)
+        current_model = _get_model(current_model_name)
         log_func(f"Pass {current_pass_num} model '{current_model_name}' initialized.", "info")
     except Exception as e:
         log_func(f"FATAL: Error initializing Pass {current_pass_num} model '{current_model_name}': {e}. Cannot proceed.", "error")
@@ -690,11 +896,16 @@ def tag_tsv_rows_gemini(
     current_intermediate_save_path = os.path.join(output_dir, f"{safe_base_name}_temp.json") if output_dir else None
     current_step_name = f"tagging_pass{current_pass_num}"
     all_tagged_items_current_pass = [] # Store results for the CURRENT pass
+    # api_delay is now the minimum spacing between request starts, on top of the RPM/TPM budget
+    limiter = rate_limiter or RateLimiter(min_interval=api_delay)
 
     # --- Process Batches for Current Pass ---
-    for i in range(0, total_items, batch_size):
+    def _tag_one_batch(i):
+        """Tags input_data[i:i + batch_size]; returns (batch number, tagged copies of the batch items, start time).
+        The tagged copies are None if stop_event was set before the batch started."""
         batch_start_time = time.time()
         batch_num = i // batch_size + 1
+        if stop_event is not None and stop_event.is_set(): return batch_num, None, batch_start_time
         current_batch_items = input_data[i : min(i + batch_size, total_items)] # Slice the input data directly
         actual_batch_size = len(current_batch_items)
         log_func(f"Pass {current_pass_num} - Processing Batch {batch_num}/{total_batches} ({actual_batch_size} items)...", "debug")
@@ -713,13 +924,20 @@ def tag_tsv_rows_gemini(
             batch_prompt_lines.append(prompt_line)
 
         batch_prompt_content = "\n".join(batch_prompt_lines)
-        full_prompt = f"{current_prompt}\n\n{batch_prompt_content}"
+        batch_turn = _prompt_turn(batch_prompt_content)
+        # Close to its expiry the cache could lapse mid-request, so the full prompt is sent instead from then on
+        use_prompt_cache = prompt_cache is not None and time.time() < prompt_cache[2] - _PROMPT_CACHE_EXPIRY_MARGIN
 
         # --- Call Gemini ---
         response_text = f"ERROR: API Call Failed (Batch {batch_num})" # Default error
         try:
             api_start_time = time.time()
-            response = current_model.generate_content(full_prompt)
+            if use_prompt_cache:
+                send_batch = functools.partial(prompt_cache[0].generate_content, [batch_turn])
+            else: # The same conversation as with the cache: the prompt turn, then the batch turn
+                send_batch = functools.partial(current_model.generate_content, [_prompt_turn(current_prompt), batch_turn])
+            response = _call_with_retry(send_batch, log_func, f"Pass {current_pass_num} - Batch {batch_num}", limiter,
+                                        estimate_tokens(current_prompt) + estimate_tokens(batch_prompt_content))
             api_duration = time.time() - api_start_time
             log_func(f"Pass {current_pass_num} - Batch {batch_num} API call duration: {api_duration:.2f}s", "debug")
 
@@ -756,6 +974,7 @@ def tag_tsv_rows_gemini(
         # Use the allowed tags specific to this pass for filtering
         parsed_tags_list = parse_batch_tag_response(response_text, actual_batch_size, current_allowed_tags)
 
+        tagged_batch = []
         for idx, item_dict in enumerate(current_batch_items):
             # Make a copy to store results for this pass
             current_item_copy = item_dict.copy()
@@ -791,28 +1010,51 @@ def tag_tsv_rows_gemini(
                 current_item_copy['Tags'] = new_tags_string_this_pass
             # --- End Modified Merge Logic ---
 
-            all_tagged_items_current_pass.append(current_item_copy)
-            processed_items_count += 1
-
-            # --- Update Progress ---
-            if progress_callback:
-                # Progress calculation should be handled by the caller (_wf_gemini_tag_json)
-                # based on which pass this is. Here, just report items processed.
-                # We can pass the pass number back if needed, or rely on caller context.
-                progress_callback(processed_items_count, total_items) # Simple progress for now
-
-        # --- Intermediate Save ---
-        if current_intermediate_save_path:
-            # Save the results accumulated *so far* in this pass
-            save_json_incrementally(all_tagged_items_current_pass, output_dir, safe_base_name, current_step_name, log_func)
-
-        batch_end_time = time.time()
-        log_func(f"Pass {current_pass_num} - Batch {batch_num} finished. Time: {batch_end_time - batch_start_time:.2f}s", "debug")
-
-        # --- Delay ---
-        if batch_num < total_batches and api_delay > 0:
-            log_func(f"Waiting {api_delay:.1f}s...", "debug")
-            time.sleep(api_delay)
+            tagged_batch.append(current_item_copy)
+        return batch_num, tagged_batch, batch_start_time
+
+    # Batches run on up to max_concurrent_batches threads (the calls are network-bound; the limiter keeps the
+    # RPM/TPM budget and api_delay spacing). Only a small window of batches is submitted ahead of the one being
+    # consumed, so a stop drops the rest without sending them. Results are consumed in batch order, so results,
+    # progress and saves are handled here exactly as in a sequential run.
+    batch_workers = max(1, min(max_concurrent_batches, total_batches))
+    batch_starts = iter(range(0, total_items, batch_size))
+    stopped = False
+    # The (large, unchanging) tagging prompt is cached server-side once for this pass, before any batch starts, and
+    # deleted as soon as the batches are done. A single batch sends it once anyway, so no cache is made then
+    prompt_cache = _create_prompt_cache(current_model_name, current_prompt, log_func) if total_batches > 1 else None
+    batch_pool = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix=f"tag_p{current_pass_num}")
+    try:
+        pending = deque(batch_pool.submit(_tag_one_batch, i) for i in itertools.islice(batch_starts, 2 * batch_workers))
+        while pending:
+            batch_num, tagged_batch, batch_start_time = pending.popleft().result()
+            if tagged_batch is None: stopped = True; break
+            next_start = next(batch_starts, None)
+            if next_start is not None: pending.append(batch_pool.submit(_tag_one_batch, next_start))
+            for current_item_copy in tagged_batch:
+                all_tagged_items_current_pass.append(current_item_copy)
+                processed_items_count += 1
+
+                # --- Update Progress ---
+                if progress_callback:
+                    # Progress calculation should be handled by the caller (_wf_gemini_tag_json)
+                    # based on which pass this is. Here, just report items processed.
+                    progress_callback(processed_items_count, total_items)
+
+            # --- Intermediate Save ---
+            if current_intermediate_save_path:
+                # Save the results accumulated *so far* in this pass
+                save_json_incrementally(all_tagged_items_current_pass, output_dir, safe_base_name, current_step_name, log_func)
+
+            batch_end_time = time.time()
+            log_func(f"Pass {current_pass_num} - Batch {batch_num} finished. Time: {batch_end_time - batch_start_time:.2f}s", "debug")
+            if stop_event is not None and stop_event.is_set(): stopped = True; break
+    finally:
+        batch_pool.shutdown(wait=True, cancel_futures=True) # Batches already running finish; queued ones are dropped unsent
+        _delete_prompt_cache(prompt_cache, log_func)
+    if stopped:
+        log_func(f"Tagging Pass {current_pass_num} stopped after {processed_items_count}/{total_items} items.", "warning")
+        return
     # --- End of Batch Loop ---
 
     # --- Yield Final Results ---
@@ -0,0 +1,28 @@
+# scripts/demo_workflow_page.py
+# Opens the Workflow page on its own, with a minimal stand-in for the main app.
+# Run it as a module from the PARENT directory, like the app itself:
+#     python -m AnkiTagProcessor.scripts.demo_workflow_page
+import tkinter as tk
+import multiprocessing
+
+from ..ui.page4_workflow import WorkflowPage
+
+
+class MockApp:
+    """The only app attributes WorkflowPage uses."""
+    def __init__(self):
+        self.gemini_api_key = tk.StringVar(value="YOUR_API_KEY_HERE") # Replace with a real key for actual testing
+        self.api_key_visible = False
+
+    def toggle_api_key_visibility(self):
+        print("Toggling API Key visibility (Mock)")
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support() # Bulk page rendering uses worker processes
+    root = tk.Tk()
+    root.title("Workflow Page Test")
+    root.geometry("800x700")
+    page = WorkflowPage(root, MockApp())
+    page.pack(expand=True, fill='both')
+    root.mainloop()
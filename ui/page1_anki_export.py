@@ -119,8 +119,7 @@ class AnkiExportPage(ttk.Frame):
         # Update available tags listbox
         if hasattr(self, 'p1_available_tags_listbox'):
             self.p1_available_tags_listbox.delete(0, tk.END)
-            for tag in sorted(tags):
-                self.p1_available_tags_listbox.insert(tk.END, tag)
+            if tags: self.p1_available_tags_listbox.insert(tk.END, *sorted(tags)) # One Tcl call for the whole collection's tags
 
         # Clear fields if deck changed or data reloaded
         if hasattr(self, 'p1_available_fields_listbox'): self.p1_available_fields_listbox.delete(0, tk.END)
@@ -168,8 +167,7 @@ class AnkiExportPage(ttk.Frame):
 
             fields = self.app.anki_note_types[model_name]
             self.p1_available_fields = sorted(fields)
-            for field in self.p1_available_fields:
-                self.p1_available_fields_listbox.insert(tk.END, field)
+            if self.p1_available_fields: self.p1_available_fields_listbox.insert(tk.END, *self.p1_available_fields)
 
         except AnkiProcessingError as e:
             messagebox.showerror("AnkiConnect Error", f"Failed to get fields for deck '{deck}':\n{e}", parent=self)
@@ -178,21 +176,19 @@ class AnkiExportPage(ttk.Frame):
 
     def _include_selected_tags(self):
         selected_indices = self.p1_available_tags_listbox.curselection()
+        available = self.p1_available_tags_listbox.get(0, tk.END) # One call instead of one get() per selected row
         current_included = set(self.p1_included_tags_listbox.get(0, tk.END))
-        for i in selected_indices:
-            tag = self.p1_available_tags_listbox.get(i)
-            if tag not in current_included:
-                self.p1_included_tags_listbox.insert(tk.END, tag)
+        new_tags = [available[i] for i in selected_indices if available[i] not in current_included]
+        if new_tags: self.p1_included_tags_listbox.insert(tk.END, *new_tags)
         # Update the internal list directly from the listbox content
         self.p1_include_tags = list(self.p1_included_tags_listbox.get(0, tk.END))
 
     def _exclude_selected_tags(self):
         selected_indices = self.p1_available_tags_listbox.curselection()
+        available = self.p1_available_tags_listbox.get(0, tk.END)
         current_excluded = set(self.p1_excluded_tags_listbox.get(0, tk.END))
-        for i in selected_indices:
-            tag = self.p1_available_tags_listbox.get(i)
-            if tag not in current_excluded:
-                self.p1_excluded_tags_listbox.insert(tk.END, tag)
+        new_tags = [available[i] for i in selected_indices if available[i] not in current_excluded]
+        if new_tags: self.p1_excluded_tags_listbox.insert(tk.END, *new_tags)
         self.p1_exclude_tags = list(self.p1_excluded_tags_listbox.get(0, tk.END))
 
     def _remove_included_tags(self):
@@ -217,11 +213,10 @@ class AnkiExportPage(ttk.Frame):
 
     def _add_selected_fields(self):
         selected_indices = self.p1_available_fields_listbox.curselection()
+        available = self.p1_available_fields_listbox.get(0, tk.END)
         current_selected = set(self.p1_selected_fields_listbox.get(0, tk.END))
-        for i in selected_indices:
-            field = self.p1_available_fields_listbox.get(i)
-            if field not in current_selected:
-                self.p1_selected_fields_listbox.insert(tk.END, field)
+        new_fields = [available[i] for i in selected_indices if available[i] not in current_selected]
+        if new_fields: self.p1_selected_fields_listbox.insert(tk.END, *new_fields)
         self.p1_selected_fields = list(self.p1_selected_fields_listbox.get(0, tk.END))
 
     def _remove_selected_fields(self):
@@ -5,20 +5,25 @@ import os
 import threading
 import traceback # Added for logging
 import json # Added to fix undefined variable error
+import queue
 from datetime import datetime
 
 # --- Use relative imports ONLY ---
 from ..constants import (DEFAULT_VISUAL_MODEL, VISUAL_CAPABLE_MODELS, DEFAULT_MODEL, # Added DEFAULT_MODEL
                      DEFAULT_VISUAL_EXTRACTION_PROMPT, DEFAULT_BOOK_PROCESSING_PROMPT,
-                     PYMUPDF_INSTALLED, GEMINI_UNIFIED_MODELS) # Added GEMINI_UNIFIED_MODELS
+                     PYMUPDF_INSTALLED, GEMINI_UNIFIED_MODELS, # Added GEMINI_UNIFIED_MODELS
+                     STATUS_LOG_MAX_LINES, STATUS_LOG_TRIM_SLACK)
 from ..utils.helpers import (ProcessingError, WorkflowStepError, sanitize_filename,
                            show_error_dialog, show_info_dialog, ask_yes_no)
 from ..core.anki_connect import detect_anki_media_path, guess_anki_media_initial_dir
 # Import the correct, existing functions from file_processor
 from ..core.file_processor import (generate_page_images, extract_text_from_pdf,
-                                   read_text_file, generate_tsv_visual, generate_tsv_text_analysis)
+                                   read_text_file, generate_tsv_visual, generate_tsv_text_analysis,
+                                   attach_page_image_map)
 from ..core.gemini_api import (call_gemini_visual_extraction, call_gemini_text_analysis,
                            cleanup_gemini_file)
+
+_P2_UI_DRAIN_INTERVAL_MS = 50 # Worker -> UI queue drain period while processing (log lines, dialogs, finish)
 # --- Removed the try...except ImportError block ---
 
 
@@ -44,6 +49,10 @@ class ProcessFilePage(ttk.Frame):
         self.p2_is_processing = False
         self.p2_image_output_folder_final = None
         self.p2_page_image_map = {}
+        # Worker threads never touch Tk: log lines (str) and (callable, args) UI calls are queued in posting order and
+        # applied by _drain_p2_ui_queue, whose timer runs while processing (or until a Tk-thread post is handled)
+        self._p2_ui_queue = queue.Queue()
+        self._p2_drain_armed = False
 
         # --- Build UI ---
         self._build_ui()
@@ -186,20 +195,67 @@ class ProcessFilePage(ttk.Frame):
     # --- No changes needed in the logic of these methods, only the imports at the top were fixed ---
 
     def log_status(self, message, level="info"):
-        """Logs messages to the status ScrolledText on this page."""
+        """Logs messages to the status ScrolledText on this page. Thread-safe: the line is queued and written by
+        the next drain tick, so a burst of log calls costs one insert and one redraw."""
+        prefix_map = {"info": "[INFO] ", "step": "[STEP] ", "warning": "[WARN] ", "error": "[ERROR] ", "upload": "[UPLOAD] ", "debug": "[DEBUG] "}
+        prefix = prefix_map.get(level, "[INFO] ")
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self._p2_post(f"{timestamp} {prefix}{message}\n")
+
+    def _post_ui(self, func, *args):
+        """Thread-safe: runs func(*args) on the Tk thread, in order with the log lines queued around it."""
+        self._p2_post((func, args))
+
+    def _p2_post(self, item):
+        self._p2_ui_queue.put(item)
+        # Worker posts only happen while processing, when the drain is already running; Tk-thread posts arm it here
+        if not self._p2_drain_armed and threading.current_thread() is threading.main_thread(): self._arm_p2_drain()
+
+    def _arm_p2_drain(self):
+        """Starts the _drain_p2_ui_queue timer if it isn't running (main thread only)."""
+        if self._p2_drain_armed: return
+        try:
+            self.after(_P2_UI_DRAIN_INTERVAL_MS, self._drain_p2_ui_queue); self._p2_drain_armed = True
+        except tk.TclError: pass # Page destroyed
+
+    def _drain_p2_ui_queue(self):
+        """Periodic Tk-thread drain of the UI queue. The next tick is armed before queued calls run, so a modal dialog
+        doesn't pause it; the timer stops once nothing is processing and the queue is empty."""
+        if not self.p2_is_processing and self._p2_ui_queue.empty():
+            self._p2_drain_armed = False; return
+        try:
+            self.after(_P2_UI_DRAIN_INTERVAL_MS, self._drain_p2_ui_queue)
+        except tk.TclError: self._p2_drain_armed = False; return # Page destroyed
+        self._flush_log()
+
+    def _flush_log(self):
+        """Handles everything queued so far (main thread only): consecutive log lines go in with a single insert."""
+        lines = []
+        while True:
+            try: item = self._p2_ui_queue.get_nowait()
+            except queue.Empty: break
+            if isinstance(item, str):
+                lines.append(item); continue
+            if lines: self._write_log_text("".join(lines)); lines = [] # Earlier lines first
+            func, args = item
+            try: func(*args)
+            except Exception as e: print(f"P2 UI call {getattr(func, '__name__', func)} failed: {e}")
+        if lines: self._write_log_text("".join(lines))
+
+    def _write_log_text(self, text):
+        """Appends already formatted log lines to the status widget in one insert."""
         try:
             if not hasattr(self, 'p2_status_text') or not self.p2_status_text.winfo_exists(): return
             self.p2_status_text.config(state="normal")
-            prefix_map = {"info": "[INFO] ", "step": "[STEP] ", "warning": "[WARN] ", "error": "[ERROR] ", "upload": "[UPLOAD] ", "debug": "[DEBUG] "}
-            prefix = prefix_map.get(level, "[INFO] ")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            self.p2_status_text.insert(tk.END, f"{timestamp} {prefix}{message}\n")
+            self.p2_status_text.insert(tk.END, text)
+            line_count = int(self.p2_status_text.index("end-1c").split(".")[0])
+            if line_count > STATUS_LOG_MAX_LINES + STATUS_LOG_TRIM_SLACK: # Keep the widget (and its redraws) bounded
+                self.p2_status_text.delete("1.0", f"{line_count - STATUS_LOG_MAX_LINES}.0")
             self.p2_status_text.see(tk.END) # Scroll to the end
             self.p2_status_text.config(state="disabled")
-            self.update_idletasks() # Ensure UI updates immediately
         except tk.TclError as e:
             # Fallback print if TclError occurs (e.g., widget destroyed)
-            print(f"P2 STATUS LOG (Backup): {message} (Error: {e})")
+            print(f"P2 STATUS LOG (Backup): {text} (Error: {e})", end="")
         except Exception as e:
             print(f"Unexpected error in P2 log_status: {e}")
 
@@ -534,7 +590,9 @@ class ProcessFilePage(ttk.Frame):
             target_func = self._run_text_analysis_thread
 
         # --- Start Thread ---
+        self._flush_log() # Anything still queued belongs to the previous run (and its log, about to be cleared)
         self.p2_is_processing = True
+        self._arm_p2_drain()
         # Update UI to indicate processing started
         try:
             if hasattr(self, 'p2_run_button') and self.p2_run_button.winfo_exists():
@@ -564,7 +622,7 @@ class ProcessFilePage(ttk.Frame):
         parsed_data = None
         try:
             # === Step 1a: Generate Page Images ===
-            self.after(0, self.log_status, "Step 1a (Visual): Generating Page Images...", "step")
+            self.log_status("Step 1a (Visual): Generating Page Images...", "step")
             # generate_page_images handles subfolder creation if save_direct_flag is False
             img_folder, self.p2_page_image_map = generate_page_images(
                 pdf_path, image_destination_path, safe_base_name, save_direct_flag, self.log_status, parent_widget=self
@@ -572,10 +630,10 @@ class ProcessFilePage(ttk.Frame):
             if img_folder is None:
                 raise ProcessingError("Image generation failed.")
             self.p2_image_output_folder_final = img_folder # Store the actual path where images were saved
-            self.after(0, self.log_status, f"Step 1a Complete. Images in: {self.p2_image_output_folder_final}", "info")
+            self.log_status(f"Step 1a Complete. Images in: {self.p2_image_output_folder_final}", "info")
 
             # === Step 1b: Invoke Gemini for JSON Extraction ===
-            self.after(0, self.log_status, f"Step 1b (Visual): Gemini JSON Extraction ({model_name})...", "step")
+            self.log_status(f"Step 1b (Visual): Gemini JSON Extraction ({model_name})...", "step")
             # call_gemini_visual_extraction handles incremental saving internally if needed
             parsed_data, uploaded_file_uri = call_gemini_visual_extraction(
                 pdf_path, api_key, model_name, prompt_text, self.log_status, parent_widget=self
@@ -583,30 +641,27 @@ class ProcessFilePage(ttk.Frame):
             if parsed_data is None: # Check for None specifically, [] is valid (no pairs found)
                 raise ProcessingError("Gemini PDF visual extraction failed (check logs/temp files).")
             if not parsed_data: # Log if the list is empty
-                self.after(0, self.log_status, "Gemini extraction yielded no Q&A pairs.", "warning")
-            self.after(0, self.log_status, "Step 1b Complete.", "info")
+                self.log_status("Gemini extraction yielded no Q&A pairs.", "warning")
+            self.log_status("Step 1b Complete.", "info")
 
             # === Step 1c: Save Intermediate JSON ===
-            self.after(0, self.log_status, "Step 1c (Visual): Saving intermediate JSON data...", "step")
+            self.log_status("Step 1c (Visual): Saving intermediate JSON data...", "step")
             intermediate_json_path = os.path.join(tsv_output_dir, f"{safe_base_name}_intermediate_visual.json")
             try:
                 # Add metadata needed for potential TSV generation later (in Page 3 or 4)
                 # This might be redundant if Page 3 doesn't use it, but good for consistency
-                for item in parsed_data:
-                    if isinstance(item, dict):
-                        item['_page_image_map'] = self.p2_page_image_map # Map page numbers to image filenames
-                        item['_source_pdf_prefix'] = safe_base_name # Store the base name for reference
+                attach_page_image_map(parsed_data, self.p2_page_image_map, safe_base_name)
                 # Save the data
                 with open(intermediate_json_path, 'w', encoding='utf-8') as f:
                     json.dump(parsed_data, f, indent=2)
-                self.after(0, self.log_status, f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
+                self.log_status(f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
             except Exception as json_e:
                 raise ProcessingError(f"Failed to save intermediate JSON: {json_e}")
-            self.after(0, self.log_status, "Step 1c Complete.", "info")
+            self.log_status("Step 1c Complete.", "info")
 
             # === Success ===
             success = True
-            self.after(0, self.log_status, "Visual Q&A extraction completed successfully!", "info")
+            self.log_status("Visual Q&A extraction completed successfully!", "info")
 
             # Prepare success message
             success_message = f"Visual Q&A Extraction Complete!\n\nIntermediate JSON File:\n{intermediate_json_path}\n\n"
@@ -617,23 +672,23 @@ class ProcessFilePage(ttk.Frame):
                 success_message += f"IMPORTANT: Manually copy images from\n'{os.path.basename(self.p2_image_output_folder_final)}' into Anki's 'collection.media' folder if needed."
 
             # Show success dialog and ask to switch page
-            self.after(0, show_info_dialog, "Extraction Success", success_message, self)
+            self._post_ui(show_info_dialog, "Extraction Success", success_message, self)
             if intermediate_json_path and os.path.exists(intermediate_json_path):
                  if ask_yes_no("Proceed to Tagging?", f"Created intermediate JSON.\nSwitch to 'Tag TSV File' page and load this JSON file for tagging?", parent=self):
-                     self.after(0, self.app.switch_to_page, 2, intermediate_json_path) # Switch to Page 3 (index 2) with JSON path
+                     self._post_ui(self.app.switch_to_page, 2, intermediate_json_path) # Switch to Page 3 (index 2) with JSON path
             elif not parsed_data: # Handle case where no data was extracted
-                 self.after(0, self.log_status, "No Q&A data extracted, skipping tagging prompt.", "info")
+                 self.log_status("No Q&A data extracted, skipping tagging prompt.", "info")
 
         except (ProcessingError, WorkflowStepError) as pe:
             # Log and show specific workflow errors
-            self.after(0, self.log_status, f"Visual workflow halted: {pe}", "error")
-            self.after(0, show_error_dialog, "Workflow Error", f"Workflow failed: {pe}", self)
+            self.log_status(f"Visual workflow halted: {pe}", "error")
+            self._post_ui(show_error_dialog, "Workflow Error", f"Workflow failed: {pe}", self)
             success = False
         except Exception as e:
             # Log and show unexpected errors
             error_msg = f"Unexpected error: {type(e).__name__}: {e}"
-            self.after(0, self.log_status, f"FATAL ERROR (Visual): {error_msg}\n{traceback.format_exc()}", "error")
-            self.after(0, show_error_dialog, "Unexpected Error", f"An unexpected error occurred:\n{error_msg}", self)
+            self.log_status(f"FATAL ERROR (Visual): {error_msg}\n{traceback.format_exc()}", "error")
+            self._post_ui(show_error_dialog, "Unexpected Error", f"An unexpected error occurred:\n{error_msg}", self)
             success = False
         finally:
             # Cleanup uploaded file if necessary
@@ -641,9 +696,9 @@ class ProcessFilePage(ttk.Frame):
                  try:
                      cleanup_gemini_file(uploaded_file_uri, api_key, self.log_status)
                  except Exception as clean_e:
-                     self.after(0, self.log_status, f"Error during Gemini file cleanup: {clean_e}", "warning")
+                     self.log_status(f"Error during Gemini file cleanup: {clean_e}", "warning")
             # Signal processing finished (success or failure)
-            self.after(0, self._processing_finished, success)
+            self._post_ui(self._processing_finished, success)
 
     def _run_text_analysis_thread(self, input_file_path, tsv_output_dir, api_key, model_name, prompt_text,
                                   safe_base_name, chunk_size, api_delay):
@@ -653,10 +708,10 @@ class ProcessFilePage(ttk.Frame):
         parsed_data = None
         intermediate_json_path = None # Will be set by call_gemini_text_analysis
         try:
-            self.after(0, self.log_status, f"Starting Text Analysis for: {os.path.basename(input_file_path)}", "info")
+            self.log_status(f"Starting Text Analysis for: {os.path.basename(input_file_path)}", "info")
 
             # === Step 1a: Extract Text Content ===
-            self.after(0, self.log_status, "Step 1a (Text): Extracting text content...", "step")
+            self.log_status("Step 1a (Text): Extracting text content...", "step")
             extracted_text = ""
             file_type = ""
             if input_file_path.lower().endswith(".pdf"):
@@ -671,16 +726,15 @@ class ProcessFilePage(ttk.Frame):
             if extracted_text is None: # Check for None return on error
                 raise ProcessingError(f"Text extraction failed for {file_type}.")
             if not extracted_text.strip(): # Check if extracted text is empty/whitespace
-                self.after(0, self.log_status, "No text content extracted from the file. Workflow finished.", "warning")
+                self.log_status("No text content extracted from the file. Workflow finished.", "warning")
                 # Consider this a "success" in terms of workflow completion, though no output generated
                 success = True
-                self.after(0, self._processing_finished, success)
-                return # Stop the thread
+                return # Stop the thread (finally signals the finish)
 
-            self.after(0, self.log_status, f"Step 1a Complete. Extracted ~{len(extracted_text)} characters.", "info")
+            self.log_status(f"Step 1a Complete. Extracted ~{len(extracted_text)} characters.", "info")
 
             # === Step 1b: Invoke Gemini for Text Analysis (uses chunking API func) ===
-            self.after(0, self.log_status, f"Step 1b (Text): Calling Gemini ({model_name}) in chunks...", "step")
+            self.log_status(f"Step 1b (Text): Calling Gemini ({model_name}) in chunks...", "step")
             # call_gemini_text_analysis handles chunking and incremental saving internally
             parsed_data = call_gemini_text_analysis(
                 extracted_text, api_key, model_name, prompt_text, self.log_status,
@@ -691,8 +745,8 @@ class ProcessFilePage(ttk.Frame):
             if parsed_data is None: # Check for None on failure
                 raise ProcessingError("Failed during Gemini text analysis (check logs/temp files).")
             if not parsed_data: # Log if list is empty
-                self.after(0, self.log_status, "Gemini analysis yielded no Q&A pairs.", "warning")
-            self.after(0, self.log_status, "Step 1b Complete (Gemini chunk processing).", "info")
+                self.log_status("Gemini analysis yielded no Q&A pairs.", "warning")
+            self.log_status("Step 1b Complete (Gemini chunk processing).", "info")
             # The intermediate JSON (_text_analysis_final.json) is saved internally by call_gemini_text_analysis
 
             # === Step 1c: (Removed TSV Generation) ===
@@ -700,7 +754,7 @@ class ProcessFilePage(ttk.Frame):
 
             # === Success ===
             success = True
-            self.after(0, self.log_status, "Text Analysis extraction completed successfully!", "info")
+            self.log_status("Text Analysis extraction completed successfully!", "info")
 
             # Find the path to the intermediate JSON saved by the API call
             intermediate_json_path = os.path.join(tsv_output_dir, f"{safe_base_name}_text_analysis_final.json")
@@ -708,32 +762,32 @@ class ProcessFilePage(ttk.Frame):
             # Prepare and show success message
             if os.path.exists(intermediate_json_path):
                 success_message = f"Text Analysis Extraction Complete!\n\nIntermediate JSON File Saved To:\n{intermediate_json_path}"
-                self.after(0, show_info_dialog, "Extraction Success", success_message, self)
+                self._post_ui(show_info_dialog, "Extraction Success", success_message, self)
             else:
                 # Should not happen if call_gemini_text_analysis succeeded, but handle defensively
-                self.after(0, self.log_status, f"Intermediate JSON file not found at expected path: {intermediate_json_path}", "warning")
-                self.after(0, show_info_dialog, "Extraction Success", "Text analysis extraction complete, but intermediate JSON file was not found.", self)
+                self.log_status(f"Intermediate JSON file not found at expected path: {intermediate_json_path}", "warning")
+                self._post_ui(show_info_dialog, "Extraction Success", "Text analysis extraction complete, but intermediate JSON file was not found.", self)
 
 
             # Ask to switch page
             if intermediate_json_path and os.path.exists(intermediate_json_path):
                 if ask_yes_no("Proceed to Tagging?", f"Created intermediate JSON.\nSwitch to 'Tag TSV File' page and load this JSON file for tagging?", parent=self):
-                     self.after(0, self.app.switch_to_page, 2, intermediate_json_path) # Switch to Page 3 (index 2) with JSON path
+                     self._post_ui(self.app.switch_to_page, 2, intermediate_json_path) # Switch to Page 3 (index 2) with JSON path
             elif not parsed_data: # Handle case where no data was extracted
-                 self.after(0, self.log_status, "No Q&A data extracted, skipping tagging prompt.", "info")
+                 self.log_status("No Q&A data extracted, skipping tagging prompt.", "info")
 
 
         except (ProcessingError, WorkflowStepError) as pe:
             # Log and show specific workflow errors
-            self.after(0, self.log_status, f"Text analysis workflow halted: {pe}", "error")
-            self.after(0, show_error_dialog, "Workflow Error", f"Workflow failed: {pe}", self)
+            self.log_status(f"Text analysis workflow halted: {pe}", "error")
+            self._post_ui(show_error_dialog, "Workflow Error", f"Workflow failed: {pe}", self)
             success = False
         except Exception as e:
             # Log and show unexpected errors
             error_msg = f"Unexpected error: {type(e).__name__}: {e}"
-            self.after(0, self.log_status, f"FATAL ERROR (Text): {error_msg}\n{traceback.format_exc()}", "error")
-            self.after(0, show_error_dialog, "Unexpected Error", f"An unexpected error occurred:\n{error_msg}", self)
+            self.log_status(f"FATAL ERROR (Text): {error_msg}\n{traceback.format_exc()}", "error")
+            self._post_ui(show_error_dialog, "Unexpected Error", f"An unexpected error occurred:\n{error_msg}", self)
             success = False
         finally:
             # Signal processing finished
-            self.after(0, self._processing_finished, success)
+            self._post_ui(self._processing_finished, success)
@@ -6,6 +6,7 @@ import threading
 import traceback
 import time
 import json # Added for JSON handling
+import queue
 from datetime import datetime
 
 # --- Use relative imports ONLY ---
@@ -18,6 +19,9 @@ from ..core.file_processor import generate_tsv_from_json_data
 from ..core.gemini_api import tag_tsv_rows_gemini, configure_gemini
 
 
+_UI_DRAIN_INTERVAL_MS = 50 # Worker -> UI drain period (status text, progress, dialogs/finish); ~20 Hz
+
+
 class TagTsvPage(ttk.Frame):
     def __init__(self, master, app_instance, **kwargs):
         super().__init__(master, **kwargs)
@@ -28,12 +32,19 @@ class TagTsvPage(ttk.Frame):
         self.p3_batch_size = tk.IntVar(value=10)
         self.p3_progress_var = tk.DoubleVar(value=0)
         self.p3_system_prompt_text = tk.StringVar(value=BATCH_TAGGING) # Pass 1
-        self.p3_api_delay = tk.DoubleVar(value=10.0)
+        self.p3_api_delay = tk.DoubleVar(value=0.0) # Extra spacing between requests; the RPM/TPM limiter and 429 backoff already pace them
         self.p3_gemini_selected_model = tk.StringVar(value=DEFAULT_MODEL) # Pass 1
         self.p3_is_processing = False
         self.p3_enable_second_pass = tk.BooleanVar(value=False)
         self.p3_second_pass_model = tk.StringVar(value=DEFAULT_SECOND_PASS_MODEL)
         self.p3_second_pass_prompt_var = tk.StringVar(value=SECOND_PASS_TAGGING)
+        # Worker -> UI handoff: calls are queued in order; status text and progress keep only their latest value.
+        # One periodic drain applies them, instead of one Tk callback per tagged item
+        self._ui_queue = queue.Queue() # (callable, args)
+        self._ui_lock = threading.Lock()
+        self._pending_status = None # Latest status label text from a worker thread
+        self._pending_progress = None # Latest progress value from a worker thread
+        self._ui_drain_armed = False # True while the _drain_ui_queue timer is scheduled (it stops itself when idle)
 
         # --- Build UI ---
         self._build_ui()
@@ -149,21 +160,68 @@ class TagTsvPage(ttk.Frame):
     # --- Methods specific to Page 3 ---
 
     def log_status(self, message, level="info"):
-        """Logs messages to the status label on this page."""
+        """Logs messages to the status label on this page. Thread-safe: from a worker thread the text is only stored,
+        and the next drain tick shows the latest one (a label can only show one line anyway)."""
+        prefix_map = {"info": "", "step": "", "warning": "WARN: ", "error": "ERROR: ", "debug": "DEBUG: "}
+        prefix = prefix_map.get(level, "")
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        short_message = message.split('\n')[0]
+        short_message = short_message[:100] + "..." if len(short_message) > 100 else short_message
+        text = f"{timestamp} {prefix}{short_message}"
+        if threading.current_thread() is not threading.main_thread():
+            with self._ui_lock: self._pending_status = text
+            return
+        self._set_status_text(text)
+        try: self.update_idletasks() # Main thread callers may be about to block (dialogs, file reads): show it now
+        except tk.TclError: pass
+
+    def _set_status_text(self, text):
         try:
             if hasattr(self, 'p3_status_label') and self.p3_status_label.winfo_exists():
-                prefix_map = {"info": "", "step": "", "warning": "WARN: ", "error": "ERROR: ", "debug": "DEBUG: "}
-                prefix = prefix_map.get(level, "")
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                short_message = message.split('\n')[0]
-                short_message = short_message[:100] + "..." if len(short_message) > 100 else short_message
-                self.p3_status_label.config(text=f"{timestamp} {prefix}{short_message}")
-                self.update_idletasks()
+                self.p3_status_label.config(text=text)
         except tk.TclError:
-            print(f"P3 Log Warning: Could not update status label ({message})")
+            print(f"P3 Log Warning: Could not update status label ({text})")
         except Exception as e:
             print(f"Unexpected error in P3 log_status: {e}")
 
+    def _post_ui(self, func, *args):
+        """Thread-safe: runs func(*args) on the Tk thread at the next drain tick."""
+        self._ui_queue.put((func, args))
+        if not self._ui_drain_armed and threading.current_thread() is threading.main_thread(): self._arm_ui_drain()
+
+    def _arm_ui_drain(self):
+        """Starts the _drain_ui_queue timer if it isn't running (main thread only)."""
+        if self._ui_drain_armed: return
+        try:
+            self.after(_UI_DRAIN_INTERVAL_MS, self._drain_ui_queue); self._ui_drain_armed = True
+        except tk.TclError: pass # Page destroyed
+
+    def _queue_progress(self, value):
+        """Thread-safe progress update; only the latest value is applied, once per drain tick."""
+        with self._ui_lock: self._pending_progress = value
+
+    def _drain_ui_queue(self):
+        """Periodic Tk-thread drain. Latest status/progress first, then queued calls in order (so a final
+        'complete' status or 100% set by a call is not overwritten by an earlier update).
+        The timer runs while a tagging run is active and stops once it is over and everything has been applied."""
+        with self._ui_lock:
+            idle = not self.p3_is_processing and self._ui_queue.empty() and self._pending_status is None and self._pending_progress is None
+        if idle:
+            self._ui_drain_armed = False; return
+        try:
+            self.after(_UI_DRAIN_INTERVAL_MS, self._drain_ui_queue) # Re-armed first, so a modal dialog below doesn't stop it
+        except tk.TclError: self._ui_drain_armed = False; return # Page destroyed
+        with self._ui_lock:
+            status, self._pending_status = self._pending_status, None
+            progress, self._pending_progress = self._pending_progress, None
+        if status is not None: self._set_status_text(status)
+        if progress is not None: self._update_progress_bar(progress)
+        while True:
+            try: func, args = self._ui_queue.get_nowait()
+            except queue.Empty: break
+            try: func(*args)
+            except Exception as e: print(f"P3 UI call {getattr(func, '__name__', func)} failed: {e}")
+
     def _sync_prompt_var_from_editor(self, event=None):
          """Syncs Pass 1 prompt editor content to its variable."""
          try:
@@ -340,6 +398,7 @@ class TagTsvPage(ttk.Frame):
 
         # --- Start Thread ---
         self.p3_is_processing = True
+        self._arm_ui_drain() # Before the worker can post anything; stops itself once the run is over
         try:
             if hasattr(self, 'p3_process_button'): self.p3_process_button.config(state=tk.DISABLED)
             if hasattr(self, 'p3_status_label'): self.p3_status_label.config(text="Starting processing...")
@@ -370,18 +429,18 @@ class TagTsvPage(ttk.Frame):
         try:
             # Handle empty input data gracefully
             if not input_qa_data:
-                self.after(0, self.log_status, "Input JSON was empty. Generating empty TSV file.", "warning")
+                self.log_status("Input JSON was empty. Generating empty TSV file.", "warning")
                 # Call generate_tsv_from_json_data with empty list to create header-only file
                 tsv_success = generate_tsv_from_json_data([], final_tsv_output_path, self.log_status)
                 if not tsv_success: raise Exception("Failed to generate empty TSV file.")
-                self.after(0, self._update_progress_bar, 100)
+                self._queue_progress(100)
                 success = True
-                self.after(0, self._show_completion_message, final_tsv_output_path)
+                self._post_ui(self._show_completion_message, final_tsv_output_path)
                 return # Exit thread early
 
             # --- Pass 1 Tagging ---
-            self.after(0, self.log_status, "Step 1: Tagging Pass 1...", "step")
-            self.after(0, self._update_progress_bar, 5) # Initial progress
+            self.log_status("Step 1: Tagging Pass 1...", "step")
+            self._queue_progress(5) # Initial progress
 
             # *** Call the MODIFIED tag_tsv_rows_gemini ***
             # It now takes the list of dicts directly
@@ -390,7 +449,7 @@ class TagTsvPage(ttk.Frame):
                 api_key, model_name_pass1, system_prompt_pass1,
                 batch_size, api_delay, self.log_status,
                 # Update progress calculation with two arguments
-                progress_callback=lambda processed, total: self.after(0, self._update_progress_bar, 
+                progress_callback=lambda processed, total: self._queue_progress(
                     (processed / total * 100) / (2 if enable_second_pass else 1.1) if total > 0 else 0),
                 output_dir=os.path.dirname(intermediate_json_p1_path), # For potential internal temp files
                 base_filename=os.path.splitext(os.path.basename(intermediate_json_p1_path))[0],
@@ -413,27 +472,27 @@ class TagTsvPage(ttk.Frame):
             tagging_pass1_success = True # Assume success if no exception
 
             # Save Pass 1 intermediate JSON
-            self.after(0, self.log_status, "Step 1: Saving Pass 1 JSON results...", "step")
+            self.log_status("Step 1: Saving Pass 1 JSON results...", "step")
             try:
                 with open(intermediate_json_p1_path, 'w', encoding='utf-8') as f:
                     json.dump(tagged_data_p1_actual, f, indent=2)
-                self.after(0, self.log_status, f"Saved Pass 1 results to {os.path.basename(intermediate_json_p1_path)}", "info")
+                self.log_status(f"Saved Pass 1 results to {os.path.basename(intermediate_json_p1_path)}", "info")
             except Exception as e:
                 raise Exception(f"Failed to save Pass 1 JSON: {e}")
 
             final_data_to_convert = tagged_data_p1_actual # Default to Pass 1 data
-            self.after(0, self._update_progress_bar, 50 if enable_second_pass else 90) # Update progress
+            self._queue_progress(50 if enable_second_pass else 90) # Update progress
 
             # --- Pass 2 Tagging (Optional) ---
             if enable_second_pass:
-                self.after(0, self.log_status, "Step 2: Tagging Pass 2...", "step")
+                self.log_status("Step 2: Tagging Pass 2...", "step")
 
                 tagged_data_p2_generator = tag_tsv_rows_gemini(
                     tagged_data_p1_actual, # Input is Pass 1 data (list of dicts)
                     api_key, model_name_pass2, system_prompt_pass2,
                     batch_size, api_delay, self.log_status,
                     # Update progress calculation with two arguments
-                    progress_callback=lambda processed, total: self.after(0, self._update_progress_bar, 
+                    progress_callback=lambda processed, total: self._queue_progress(
                         50 + ((processed / total * 100) * 0.4) if total > 0 else 50),
                     output_dir=os.path.dirname(intermediate_json_p2_path),
                     base_filename=os.path.splitext(os.path.basename(intermediate_json_p2_path))[0],
@@ -455,19 +514,19 @@ class TagTsvPage(ttk.Frame):
                 tagging_pass2_success = True
 
                 # Save Pass 2 intermediate JSON
-                self.after(0, self.log_status, "Step 2: Saving Pass 2 JSON results...", "step")
+                self.log_status("Step 2: Saving Pass 2 JSON results...", "step")
                 try:
                     with open(intermediate_json_p2_path, 'w', encoding='utf-8') as f:
                         json.dump(tagged_data_p2_actual, f, indent=2)
-                    self.after(0, self.log_status, f"Saved Pass 2 results to {os.path.basename(intermediate_json_p2_path)}", "info")
+                    self.log_status(f"Saved Pass 2 results to {os.path.basename(intermediate_json_p2_path)}", "info")
                 except Exception as e:
                     raise Exception(f"Failed to save Pass 2 JSON: {e}")
 
                 final_data_to_convert = tagged_data_p2_actual # Use Pass 2 data for final conversion
-                self.after(0, self._update_progress_bar, 90) # Update progress after pass 2
+                self._queue_progress(90) # Update progress after pass 2
 
             # --- Final TSV Generation ---
-            self.after(0, self.log_status, "Step 3: Generating Final TSV...", "step")
+            self.log_status("Step 3: Generating Final TSV...", "step")
             if final_data_to_convert is None: # Check if data exists (e.g., if Pass 1 failed and Pass 2 skipped)
                 raise Exception("No final tagged data available for TSV conversion.")
 
@@ -476,31 +535,31 @@ class TagTsvPage(ttk.Frame):
             if not tsv_success:
                 raise Exception("Failed to generate final TSV file.")
 
-            self.after(0, self._update_progress_bar, 100)
+            self._queue_progress(100)
             success = True
-            self.after(0, self._show_completion_message, final_tsv_output_path)
+            self._post_ui(self._show_completion_message, final_tsv_output_path)
 
         except Exception as e:
             error_msg = f"Error in P3 processing thread:\n{type(e).__name__}: {e}"
             # Avoid showing full traceback in dialog, log it instead
             print(f"P3 Thread Error Traceback:\n{traceback.format_exc()}")
-            self.after(0, self.log_status, f"P3 Thread Error: {error_msg}", "error") # Log error
-            self.after(0, self._show_error_status, error_msg) # Show short error in UI
+            self.log_status(f"P3 Thread Error: {error_msg}", "error") # Log error
+            self._post_ui(self._show_error_status, error_msg) # Show short error in UI
             success = False
         finally:
             # Optionally clean up intermediate JSON files if successful
             if success:
                 if intermediate_json_p1_path and os.path.exists(intermediate_json_p1_path):
-                    # try: os.remove(intermediate_json_p1_path); self.after(0, self.log_status, f"Cleaned up {os.path.basename(intermediate_json_p1_path)}", "debug")
-                    # except Exception as rem_e: self.after(0, self.log_status, f"Could not remove {os.path.basename(intermediate_json_p1_path)}: {rem_e}", "warning")
+                    # try: os.remove(intermediate_json_p1_path); self.log_status(f"Cleaned up {os.path.basename(intermediate_json_p1_path)}", "debug")
+                    # except Exception as rem_e: self.log_status(f"Could not remove {os.path.basename(intermediate_json_p1_path)}: {rem_e}", "warning")
                     pass # ADDED: Placeholder for the now-empty 'if' block
                 if intermediate_json_p2_path and os.path.exists(intermediate_json_p2_path):
-                     # try: os.remove(intermediate_json_p2_path); self.after(0, self.log_status, f"Cleaned up {os.path.basename(intermediate_json_p2_path)}", "debug")
-                     # except Exception as rem_e: self.after(0, self.log_status, f"Could not remove {os.path.basename(intermediate_json_p2_path)}: {rem_e}", "warning")
+                     # try: os.remove(intermediate_json_p2_path); self.log_status(f"Cleaned up {os.path.basename(intermediate_json_p2_path)}", "debug")
+                     # except Exception as rem_e: self.log_status(f"Could not remove {os.path.basename(intermediate_json_p2_path)}: {rem_e}", "warning")
                      pass # ADDED: Placeholder for the now-empty 'if' block
 
             # This line MUST remain outside the commented section and 'if success' block
-            self.after(0, self._processing_finished, success)
+            self._post_ui(self._processing_finished, success)
 
 
     def _update_progress_bar(self, progress_value):
@@ -8,31 +8,54 @@ import time
 import json # Added for JSON handling
 from datetime import datetime
 import shutil
+import functools
+import hashlib
+import sqlite3
+from types import SimpleNamespace
+import queue
+import multiprocessing
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError, wait as wait_futures
 
 # Use relative imports ONLY
 # Assuming these imports are correct based on your project structure
 try:
     from ..constants import (DEFAULT_VISUAL_MODEL, VISUAL_CAPABLE_MODELS, DEFAULT_MODEL, GEMINI_UNIFIED_MODELS,
                              DEFAULT_VISUAL_EXTRACTION_PROMPT, DEFAULT_BOOK_PROCESSING_PROMPT,
-                             DEFAULT_BATCH_TAGGING_PROMPT, PYMUPDF_INSTALLED, DEFAULT_SECOND_PASS_MODEL)
+                             DEFAULT_BATCH_TAGGING_PROMPT, PYMUPDF_INSTALLED, DEFAULT_SECOND_PASS_MODEL,
+                             BULK_MAX_CONCURRENT_FILES, BULK_IMAGE_WORKERS, STATUS_LOG_MAX_LINES, STATUS_LOG_TRIM_SLACK,
+                             ORJSON_INSTALLED, orjson, TAG_CACHE_PATH, TAG_CACHE_MAX_ENTRIES, EXTRACT_CACHE_DIR,
+                             EXTRACT_CACHE_MAX_BYTES, PAGE_IMAGE_CACHE_MAX_BYTES)
     from ..prompts import (VISUAL_EXTRACTION, BOOK_PROCESSING, BATCH_TAGGING, SECOND_PASS_TAGGING)
     from ..utils.helpers import (ProcessingError, WorkflowStepError, sanitize_filename,
-                             show_error_dialog, show_info_dialog, ask_yes_no, save_tsv_incrementally) # Added save_tsv_incrementally
+                             show_error_dialog, show_info_dialog, ask_yes_no, save_tsv_incrementally, # Added save_tsv_incrementally
+                             JsonArrayWriter, prefetch_file, iter_json_array, has_pdf_header,
+                             touch_cache_entry, prune_cache_dir)
     from ..core.anki_connect import detect_anki_media_path, guess_anki_media_initial_dir
     # Import the correct functions from file_processor
-    from ..core.file_processor import (generate_page_images, extract_text_from_pdf,
+    from ..core.file_processor import (generate_page_images, render_page_images_job, extract_text_from_pdf,
                                        read_text_file, generate_tsv_visual, generate_tsv_text_analysis,
-                                       generate_tsv_from_json_data) # Make sure this is imported
+                                       generate_tsv_from_json_data, pdf_content_hash, attach_page_image_map, # Make sure this is imported
+                                       prune_page_image_cache)
     # Import the correct functions from gemini_api
     from ..core.gemini_api import (call_gemini_visual_extraction, call_gemini_text_analysis,
                                    cleanup_gemini_file, tag_tsv_rows_gemini, # Corrected name
-                                   configure_gemini, save_json_incrementally)
+                                   configure_gemini, warm_up_gemini, save_json_incrementally, RateLimiter)
 except ImportError as e:
     # Fallback for running the script directly or if relative imports fail
     print(f"Warning: Relative import failed ({e}). This might happen if running the script directly. Ensure it's run as part of the package.")
     # Add alternative import paths or handle the error as needed for standalone execution/testing
     # For now, we'll let it proceed, but functionality might be limited.
     PYMUPDF_INSTALLED = False # Assume false if imports fail
+    BULK_MAX_CONCURRENT_FILES, BULK_IMAGE_WORKERS = 1, 1
+    STATUS_LOG_MAX_LINES, STATUS_LOG_TRIM_SLACK = 2000, 500
+    ORJSON_INSTALLED, orjson = False, None
+    TAG_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".quizdb_cache", "tag_cache.sqlite3")
+    EXTRACT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".quizdb_cache", "extractions")
+    TAG_CACHE_MAX_ENTRIES, EXTRACT_CACHE_MAX_BYTES, PAGE_IMAGE_CACHE_MAX_BYTES = 200_000, 256 * 1024 ** 2, 2 * 1024 ** 3
+    def touch_cache_entry(path): pass
+    def prune_cache_dir(cache_dir, max_bytes): return 0, 0
+    def prune_page_image_cache(max_bytes): return 0, 0
     # Define dummy constants/functions if needed for basic UI loading without full functionality
     DEFAULT_VISUAL_MODEL, VISUAL_CAPABLE_MODELS, DEFAULT_MODEL, GEMINI_UNIFIED_MODELS = "gemini-pro-vision", ["gemini-pro-vision"], "gemini-pro", ["gemini-pro"]
     DEFAULT_VISUAL_EXTRACTION_PROMPT, DEFAULT_BOOK_PROCESSING_PROMPT, DEFAULT_BATCH_TAGGING_PROMPT, DEFAULT_SECOND_PASS_MODEL = "Extract Q&A", "Analyze Text", "Tag Data", "gemini-pro"
@@ -44,15 +67,166 @@ except ImportError as e:
     def detect_anki_media_path(parent_for_dialog=None): return None
     def guess_anki_media_initial_dir(): return os.path.expanduser("~")
     def generate_page_images(*args, **kwargs): print("WARN: generate_page_images unavailable"); return None, {}
+    def render_page_images_job(*args, **kwargs): print("WARN: render_page_images_job unavailable"); return None, {}, []
     def extract_text_from_pdf(*args, **kwargs): print("WARN: extract_text_from_pdf unavailable"); return None
     def read_text_file(*args, **kwargs): print("WARN: read_text_file unavailable"); return None
     def generate_tsv_from_json_data(*args, **kwargs): print("WARN: generate_tsv_from_json_data unavailable"); return False
+    def pdf_content_hash(*args, **kwargs): raise OSError("pdf_content_hash unavailable")
+    def attach_page_image_map(parsed_data, *args, **kwargs): return parsed_data
     def call_gemini_visual_extraction(*args, **kwargs): print("WARN: call_gemini_visual_extraction unavailable"); return None, None
     def call_gemini_text_analysis(*args, **kwargs): print("WARN: call_gemini_text_analysis unavailable"); return None
     def cleanup_gemini_file(*args, **kwargs): print("WARN: cleanup_gemini_file unavailable")
     def tag_tsv_rows_gemini(*args, **kwargs): print("WARN: tag_tsv_rows_gemini unavailable"); yield ["Error", "Function Unavailable"]; return # Yield header and exit
+    def RateLimiter(*args, **kwargs): return None # tag_tsv_rows_gemini then builds its own
+    def warm_up_gemini(*args, **kwargs): pass
     class WorkflowStepError(Exception): pass
 
+# --- Output file name templates (all workflow outputs are written next to the input file) ---
+_VIS_INTER_FMT = "{base}_intermediate_visual.json"
+_VIS_FINAL_FMT = "{base}_final_tagged_visual.txt"
+_TEXT_INTER_FMT = "{base}_intermediate_analysis.json"
+_TEXT_FINAL_FMT = "{base}_final_tagged_analysis.txt"
+_BULK_INTER_FMT = "bulk_visual_{stamp}_intermediate.json"
+_BULK_FINAL_FMT = "bulk_visual_{stamp}_final_tagged.txt"
+_BULK_IMAGE_SUBFOLDER_FMT = "Bulk_Visual_{stamp}"
+_FILE_NOT_RUN = object() # _bulk_process_single_pdf result for a file that Stop kept from starting (neither failed nor skipped)
+# Bulk end-of-run summary for the log/button (str.format bound once)
+_BULK_SUMMARY = "Bulk processing finished. {ok}/{total} successful, {failed} failed (renamed 'UP_'), {skipped} skipped.".format
+_PARTIAL_SUFFIX = ".partial" # Bulk intermediate JSON is written here and renamed once every file is done
+_RESUME_SIDECAR_SUFFIX = ".resume.json" # Checkpoint next to the intermediate: {"offset", "count", "done": [pdf paths], "run": signature}
+_TAGGED_JSON_FMT = "{base}_final_tagged_data.json"
+_INTERMEDIATE_SUFFIXES = ("_intermediate_visual", "_intermediate_analysis", "_intermediate") # Stripped to get the tagged JSON base name
+_UI_DRAIN_INTERVAL_MS = 50 # Worker -> UI queue drain period (log lines, progress, dialogs/finish); ~20 Hz
+_UI_DRAIN_MAX_ITEMS = 500 # Queue items handled per drain tick at most
+_PROGRESS_MIN_STEP = 0.5 # Progress bar (0-100) is only moved for changes of at least this much (1/200 of the bar)
+_PROMPT_SYNC_DELAY_MS = 250 # Prompt editor -> StringVar sync is deferred this long, so a burst of typing costs one copy
+_REMOVE_INTERMEDIATE_ON_SUCCESS = False # Intermediates are kept for now (useful for re-tagging/debugging)
+
+
+def _dump_json(path, data):
+    """Writes data to path as 2-space indented JSON (the layout json.dump(indent=2) produces).
+    Uses orjson when installed: it encodes straight to UTF-8 bytes in C, without building the whole str first.
+    Written to a temp file and renamed over path, so a crash mid-write leaves the previous file intact."""
+    tmp_path = path + ".tmp"
+    try:
+        if ORJSON_INSTALLED:
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def _tag_cache_scope(pass_num, model_name, prompt):
+    """Key prefix for the tag cache: tags are only reused for the same pass, model and prompt (Pass 2 filters against
+    its own allowed-tags set and merges the item's initial tags, so its results differ even for the same model/prompt)."""
+    return hashlib.blake2b(f"{pass_num}\x1f{model_name}\x1f{prompt}".encode("utf-8"), digest_size=16).digest()
+
+def _tag_item_key(scope, item):
+    """Tag cache / dedupe key of one item: the text the tagging prompt is built from (question, answer, existing tags)."""
+    q_text = item.get("question_text", item.get("Question", "")); a_text = item.get("answer_text", item.get("Answer", ""))
+    return hashlib.blake2b(f"{q_text}\x1f{a_text}\x1f{item.get('Tags', '')}".encode("utf-8"), digest_size=16, key=scope).hexdigest()
+
+def _bulk_run_signature(input_pdf_paths, extract_model_name, extract_prompt):
+    """What a bulk checkpoint was made for: a run only resumes it with the same PDFs (same order), model and prompt."""
+    return {"inputs": list(input_pdf_paths), "model": extract_model_name,
+            "prompt_sha256": hashlib.sha256(extract_prompt.encode("utf-8")).hexdigest()}
+
+def _has_tag_text(item):
+    """False for items whose question and answer are both empty/whitespace: there is nothing to send for tagging."""
+    return bool(str(item.get("question_text", item.get("Question", ""))).strip() or str(item.get("answer_text", item.get("Answer", ""))).strip())
+
+def _read_cache_file(path):
+    """Reads a JSON cache file; None if it is missing or unreadable (a cache miss, never an error)."""
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read()) if ORJSON_INSTALLED else json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache_file(path, data):
+    """Writes a JSON cache file via a temp file + rename, so an interrupted write never leaves a truncated entry."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp" # Per thread: bulk workers may write the same entry at once
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data) if ORJSON_INSTALLED else json.dumps(data).encode("utf-8"))
+    os.replace(tmp_path, path)
+
+class _TagCache:
+    """The tag cache ({item key: tags}) in an SQLite file. Lookups read single rows; new tags are kept here and written in
+    one transaction by close(), which also evicts the least recently used entries beyond max_entries. Several app
+    instances can share the file: each adds its own entries instead of rewriting the whole cache.
+    Thread-safe (both tagging passes use one instance). If the file can't be opened, it acts as an empty cache."""
+    def __init__(self, path, max_entries=TAG_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._new = {} # Tags added this run, written by close()
+        self._hits = set() # Keys found in the file, marked as used by close()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False) # Access is serialized by _lock
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS tags (key TEXT PRIMARY KEY, tags TEXT NOT NULL, used REAL NOT NULL)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS tags_used ON tags (used)")
+        except (OSError, sqlite3.Error) as e:
+            print(f"Tag cache unavailable ({e}); tagging without it.")
+            self._conn = None
+
+    def get(self, key):
+        with self._lock:
+            tags = self._new.get(key)
+            if tags is not None or self._conn is None: return tags
+            try:
+                row = self._conn.execute("SELECT tags FROM tags WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None # A miss: the item is just tagged again
+            if row is None: return None
+            self._hits.add(key)
+            return row[0]
+
+    def __setitem__(self, key, tags):
+        with self._lock: self._new[key] = tags
+
+    def close(self):
+        """Writes this run's new tags and use times, evicts beyond max_entries, and closes the file. Returns the number
+        of entries written. Raises sqlite3.Error if the write fails (the cache is closed either way)."""
+        with self._lock:
+            conn, self._conn = self._conn, None
+            if conn is None: return 0
+            try:
+                now = time.time()
+                with conn: # One transaction
+                    conn.executemany("UPDATE tags SET used = ? WHERE key = ?", ((now, key) for key in self._hits))
+                    conn.executemany("INSERT OR REPLACE INTO tags (key, tags, used) VALUES (?, ?, ?)",
+                                     ((key, tags, now) for key, tags in self._new.items()))
+                    conn.execute("DELETE FROM tags WHERE key IN (SELECT key FROM tags ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_entries,))
+                return len(self._new)
+            finally:
+                conn.close()
+
+def _extract_cache_path(content_hash, model_name, prompt):
+    """Extraction cache entry for one PDF content hash + extraction model/prompt."""
+    scope = hashlib.blake2b(f"{model_name}\x1f{prompt}".encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(EXTRACT_CACHE_DIR, f"{content_hash}_{scope}.json")
+
+def _needs_second_pass(item):
+    """True if Pass 1 gave the item no usable tags (none at all, or an ERROR: marker)."""
+    tags = item.get('Tags', '')
+    return not tags.strip() or "ERROR:" in tags
+
+def _merge_tag_strings(tags1, tags2):
+    """Merges two space-separated tag strings: the sorted union of the tags, then any ERROR: markers (pass 1's first)."""
+    tags = set(); errors = []
+    for tag in f"{tags1} {tags2}".split(): # One split/scan for both passes
+        if tag.startswith("ERROR:"): errors.append(tag)
+        else: tags.add(tag)
+    return " ".join(sorted(tags) + errors)
+
 
 class WorkflowPage(ttk.Frame):
     def __init__(self, master, app_instance, **kwargs):
@@ -63,23 +237,42 @@ class WorkflowPage(ttk.Frame):
         self.p4_wf_processing_type = StringVar(value="Visual Q&A (PDF)")
         self.p4_wf_input_file_path = StringVar()
         self.p4_wf_is_bulk_mode = BooleanVar(value=False)
-        self.p4_wf_input_file_paths = []
+        self.p4_wf_input_file_paths = () # Bulk mode PDFs; a tuple, replaced (never mutated) on each selection
         self.p4_wf_save_directly_to_media = BooleanVar(value=False)
         self.p4_wf_anki_media_path = StringVar()
         self.p4_wf_extraction_model = StringVar(value=DEFAULT_VISUAL_MODEL)
         self.p4_wf_tagging_model = StringVar(value=DEFAULT_MODEL) # Pass 1
         self.p4_wf_tagging_batch_size = IntVar(value=10)
-        self.p4_wf_tagging_api_delay = tk.DoubleVar(value=10.0)
+        self.p4_wf_tagging_api_delay = tk.DoubleVar(value=0.0) # Extra spacing between tag requests; the RPM/TPM limiter and 429 backoff already pace them
+        self.p4_wf_bulk_max_concurrent = IntVar(value=BULK_MAX_CONCURRENT_FILES) # Bulk: PDFs extracted at the same time
         self.p4_wf_text_chunk_size = IntVar(value=30000)
         self.p4_wf_text_api_delay = tk.DoubleVar(value=5.0)
         self.p4_wf_visual_extraction_prompt_var = StringVar(value=VISUAL_EXTRACTION)
         self.p4_wf_book_processing_prompt_var = StringVar(value=BOOK_PROCESSING)
         self.p4_wf_tagging_prompt_var = StringVar(value=BATCH_TAGGING) # Pass 1
         self.p4_wf_enable_second_pass = BooleanVar(value=False)
+        self.p4_wf_pass2_untagged_only = BooleanVar(value=False) # Cascade: Pass 2 only re-tags what Pass 1 left untagged
         self.p4_wf_second_pass_model = StringVar(value=DEFAULT_SECOND_PASS_MODEL)
         self.p4_wf_second_pass_prompt_var = StringVar(value=SECOND_PASS_TAGGING)
         self.p4_wf_progress_var = tk.DoubleVar(value=0)
+        self.p4_wf_debug = BooleanVar(value=False) # Adds debug lines and tracebacks to the status log
+        self.p4_wf_use_extract_cache = BooleanVar(value=True) # Reuse saved extraction results for unchanged PDFs
         self.p4_wf_is_processing = False
+        self._debug_enabled = False # Snapshot of p4_wf_debug taken when a workflow starts (read by worker threads)
+        self._use_extract_cache = True # Snapshot of p4_wf_use_extract_cache, same idea
+
+        # --- Worker -> UI marshaling: workers never touch Tk; everything goes through _ui_queue (see _drain_ui_queue) ---
+        self._ui_queue = queue.Queue() # Formatted log lines (str) and (callable, args) UI calls, in posting order
+        self._pending_progress = None # Latest progress value; applied once per drain tick (last wins)
+        self._wf_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="p4_wf") # One reused worker thread; runs never overlap
+        self._wf_future = None # Future of the running workflow; cleared once its done-check has run on the Tk thread
+        self._ui_drain_armed = False # True while the _drain_ui_queue timer is scheduled (it stops itself when idle)
+        self._wf_stop = threading.Event() # Set by the Stop button; workflow threads check it between files/steps
+        self._ranged_progress_last_sent = 0.0 # Monotonic time of the last forwarded tagging progress update
+        self._tag_pass_progress = [(0, 0), (0, 0)] # (processed, total) of concurrent tagging passes 1 and 2
+        self._progress_shown = 0.0 # Value last applied to the progress bar (main thread only)
+        self._ui_flush_lock = threading.Lock()
+        self._prompt_sync_jobs = {} # editor attribute name -> (after id, StringVar) of a pending prompt sync
 
         # --- Instance variables for UI elements needed across methods ---
         self.left_frame = None # Will be assigned in _build_ui
@@ -140,6 +333,7 @@ class WorkflowPage(ttk.Frame):
         bulk_button_frame = ttk.Frame(self.p4_wf_bulk_input_list_frame); bulk_button_frame.grid(row=0, column=2, sticky="ns", padx=(5,0))
         self.p4_wf_browse_button_bulk = tk.Button(bulk_button_frame, text="Select PDFs...", command=self._select_input_files_bulk); self.p4_wf_browse_button_bulk.pack(pady=2, fill=tk.X)
         self.p4_wf_clear_button_bulk = tk.Button(bulk_button_frame, text="Clear List", command=self._clear_bulk_files_list); self.p4_wf_clear_button_bulk.pack(pady=2, fill=tk.X)
+        tk.Label(bulk_button_frame, text="Files at once:").pack(pady=(6,0)); p4_wf_bulk_concurrent_entry = ttk.Entry(bulk_button_frame, textvariable=self.p4_wf_bulk_max_concurrent, width=4); p4_wf_bulk_concurrent_entry.pack(pady=2)
         self.p4_wf_bulk_input_list_frame.grid_remove() # Hide initially
 
         self.p4_wf_image_output_frame = ttk.LabelFrame(self.left_frame, text="2. Image Output Location (Visual Q&A)"); # Packed conditionally later
@@ -174,17 +368,61 @@ class WorkflowPage(ttk.Frame):
         self.p4_wf_second_pass_model_dropdown.grid(row=4, column=2, columnspan=3, padx=5, pady=2, sticky="ew")
         self.p4_wf_text_config_frame = ttk.Frame(self.p4_wf_config_frame); self.p4_wf_text_config_frame.grid(row=5, column=0, columnspan=5, sticky="ew"); tk.Label(self.p4_wf_text_config_frame, text="Text Chunk Size:").grid(row=0, column=0, padx=5, pady=2, sticky="w"); p4_wf_text_chunk_entry = ttk.Entry(self.p4_wf_text_config_frame, textvariable=self.p4_wf_text_chunk_size, width=8); p4_wf_text_chunk_entry.grid(row=0, column=1, padx=5, pady=2, sticky="w"); tk.Label(self.p4_wf_text_config_frame, text="Text API Delay(s):").grid(row=0, column=2, padx=5, pady=2, sticky="w"); p4_wf_text_delay_entry = ttk.Entry(self.p4_wf_text_config_frame, textvariable=self.p4_wf_text_api_delay, width=6); p4_wf_text_delay_entry.grid(row=0, column=3, padx=5, pady=2, sticky="w")
         tk.Label(self.p4_wf_config_frame, text="Tag Batch Size:").grid(row=6, column=0, padx=5, pady=2, sticky="w"); p4_wf_tag_batch_entry = ttk.Entry(self.p4_wf_config_frame, textvariable=self.p4_wf_tagging_batch_size, width=8); p4_wf_tag_batch_entry.grid(row=6, column=1, padx=5, pady=2, sticky="w"); tk.Label(self.p4_wf_config_frame, text="Tag API Delay(s):").grid(row=6, column=2, padx=5, pady=2, sticky="w"); p4_wf_tag_delay_entry = ttk.Entry(self.p4_wf_config_frame, textvariable=self.p4_wf_tagging_api_delay, width=6); p4_wf_tag_delay_entry.grid(row=6, column=3, padx=5, pady=2, sticky="w")
+        self.p4_wf_debug_check = ttk.Checkbutton(self.p4_wf_config_frame, text="Debug Logging (debug lines and tracebacks)", variable=self.p4_wf_debug); self.p4_wf_debug_check.grid(row=7, column=0, columnspan=5, padx=5, pady=(5,0), sticky="w")
+        self.p4_wf_extract_cache_check = ttk.Checkbutton(self.p4_wf_config_frame, text="Reuse cached extraction for unchanged PDFs", variable=self.p4_wf_use_extract_cache); self.p4_wf_extract_cache_check.grid(row=8, column=0, columnspan=5, padx=5, pady=(0,0), sticky="w")
+        self.p4_wf_pass2_untagged_only_check = ttk.Checkbutton(self.p4_wf_config_frame, text="Pass 2 only for items Pass 1 left untagged (fewer Pass 2 requests)", variable=self.p4_wf_pass2_untagged_only, state="disabled"); self.p4_wf_pass2_untagged_only_check.grid(row=9, column=0, columnspan=5, padx=5, pady=(0,0), sticky="w")
 
         # --- Right Column Widgets (Prompts) ---
-        self.p4_wf_visual_extract_prompt_frame = ttk.LabelFrame(right_frame, text="Visual Extraction Prompt (Step 1)"); self.p4_wf_visual_extract_prompt_frame.grid(row=0, column=0, padx=0, pady=(0,5), sticky="nsew"); self.p4_wf_visual_extract_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_visual_extract_prompt_frame.grid_columnconfigure(0, weight=1); self.p4_wf_visual_extraction_prompt_text = scrolledtext.ScrolledText(self.p4_wf_visual_extract_prompt_frame, wrap=tk.WORD, height=6); self.p4_wf_visual_extraction_prompt_text.grid(row=0, column=0, padx=5, pady=5, sticky="nsew"); self.p4_wf_visual_extraction_prompt_text.insert(tk.END, self.p4_wf_visual_extraction_prompt_var.get()); self.p4_wf_visual_extraction_prompt_text.bind("<<Modified>>", self._sync_prompt_var_from_editor_p4_visual_extract)
-        self.p4_wf_text_analysis_prompt_frame = ttk.LabelFrame(right_frame, text="Text Analysis Prompt (Step 1)"); self.p4_wf_text_analysis_prompt_frame.grid(row=1, column=0, padx=0, pady=(0,5), sticky="nsew"); self.p4_wf_text_analysis_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_text_analysis_prompt_frame.grid_columnconfigure(0, weight=1); self.p4_wf_book_processing_prompt_text = scrolledtext.ScrolledText(self.p4_wf_text_analysis_prompt_frame, wrap=tk.WORD, height=6); self.p4_wf_book_processing_prompt_text.grid(row=0, column=0, padx=5, pady=5, sticky="nsew"); self.p4_wf_book_processing_prompt_text.insert(tk.END, self.p4_wf_book_processing_prompt_var.get()); self.p4_wf_book_processing_prompt_text.bind("<<Modified>>", self._sync_prompt_var_from_editor_p4_book_process)
-        self.p4_wf_tagging_pass1_prompt_frame = ttk.LabelFrame(right_frame, text="Tagging Prompt (Pass 1)"); self.p4_wf_tagging_pass1_prompt_frame.grid(row=2, column=0, padx=0, pady=5, sticky="nsew"); self.p4_wf_tagging_pass1_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_tagging_pass1_prompt_frame.grid_columnconfigure(0, weight=1); self.p4_wf_tagging_prompt_text_editor = scrolledtext.ScrolledText(self.p4_wf_tagging_pass1_prompt_frame, wrap=tk.WORD, height=8); self.p4_wf_tagging_prompt_text_editor.grid(row=0, column=0, padx=5, pady=5, sticky="nsew"); self.p4_wf_tagging_prompt_text_editor.insert(tk.END, self.p4_wf_tagging_prompt_var.get()); self.p4_wf_tagging_prompt_text_editor.bind("<<Modified>>", self._sync_prompt_var_from_editor_p4_tag)
-        self.p4_wf_tagging_pass2_prompt_frame = ttk.LabelFrame(right_frame, text="Tagging Prompt (Pass 2)"); self.p4_wf_tagging_pass2_prompt_frame.grid(row=3, column=0, padx=0, pady=(5,0), sticky="nsew"); self.p4_wf_tagging_pass2_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_tagging_pass2_prompt_frame.grid_columnconfigure(0, weight=1); self.p4_wf_second_pass_prompt_text_editor = scrolledtext.ScrolledText(self.p4_wf_tagging_pass2_prompt_frame, wrap=tk.WORD, height=8, state="disabled"); self.p4_wf_second_pass_prompt_text_editor.grid(row=0, column=0, padx=5, pady=5, sticky="nsew"); self.p4_wf_second_pass_prompt_text_editor.insert(tk.END, self.p4_wf_second_pass_prompt_var.get()); self.p4_wf_second_pass_prompt_text_editor.bind("<<Modified>>", self._sync_prompt_var_from_editor_p4_tag_pass2)
+        self.p4_wf_visual_extract_prompt_frame = ttk.LabelFrame(right_frame, text="Visual Extraction Prompt (Step 1)"); self.p4_wf_visual_extract_prompt_frame.grid(row=0, column=0, padx=0, pady=(0,5), sticky="nsew"); self.p4_wf_visual_extract_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_visual_extract_prompt_frame.grid_columnconfigure(0, weight=1)
+        self.p4_wf_text_analysis_prompt_frame = ttk.LabelFrame(right_frame, text="Text Analysis Prompt (Step 1)"); self.p4_wf_text_analysis_prompt_frame.grid(row=1, column=0, padx=0, pady=(0,5), sticky="nsew"); self.p4_wf_text_analysis_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_text_analysis_prompt_frame.grid_columnconfigure(0, weight=1)
+        self.p4_wf_tagging_pass1_prompt_frame = ttk.LabelFrame(right_frame, text="Tagging Prompt (Pass 1)"); self.p4_wf_tagging_pass1_prompt_frame.grid(row=2, column=0, padx=0, pady=5, sticky="nsew"); self.p4_wf_tagging_pass1_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_tagging_pass1_prompt_frame.grid_columnconfigure(0, weight=1)
+        self.p4_wf_tagging_pass2_prompt_frame = ttk.LabelFrame(right_frame, text="Tagging Prompt (Pass 2)"); self.p4_wf_tagging_pass2_prompt_frame.grid(row=3, column=0, padx=0, pady=(5,0), sticky="nsew"); self.p4_wf_tagging_pass2_prompt_frame.grid_rowconfigure(0, weight=1); self.p4_wf_tagging_pass2_prompt_frame.grid_columnconfigure(0, weight=1)
 
         # --- Bottom Frame Widgets ---
-        self.p4_wf_run_button = tk.Button(bottom_frame, text="Run Workflow", command=self._start_workflow_thread, font=('Arial', 11, 'bold'), bg='lightyellow'); self.p4_wf_run_button.grid(row=0, column=0, columnspan=2, padx=10, pady=(5, 5), sticky="ew")
+        self.p4_wf_run_button = tk.Button(bottom_frame, text="Run Workflow", command=self._start_workflow_thread, font=('Arial', 11, 'bold'), bg='lightyellow'); self.p4_wf_run_button.grid(row=0, column=0, padx=(10, 5), pady=(5, 5), sticky="ew")
+        self.p4_wf_stop_button = tk.Button(bottom_frame, text="Stop", command=self._request_workflow_stop, font=('Arial', 11, 'bold'), state="disabled"); self.p4_wf_stop_button.grid(row=0, column=1, padx=(0, 10), pady=(5, 5), sticky="e")
         status_frame = ttk.LabelFrame(bottom_frame, text="Workflow Status"); status_frame.grid(row=1, column=0, columnspan=2, padx=0, pady=(5,0), sticky="nsew"); status_frame.grid_rowconfigure(1, weight=1); status_frame.grid_columnconfigure(0, weight=1); self.p4_wf_progress_bar = ttk.Progressbar(status_frame, variable=self.p4_wf_progress_var, maximum=100); self.p4_wf_progress_bar.grid(row=0, column=0, padx=5, pady=(5,2), sticky="ew"); self.p4_wf_status_text = scrolledtext.ScrolledText(status_frame, wrap=tk.WORD, height=6, state="disabled"); self.p4_wf_status_text.grid(row=1, column=0, padx=5, pady=(2,5), sticky="nsew")
 
+        # Handles for the widgets touched on every log/progress/finish update: plain attribute reads, no hasattr/winfo_exists
+        # probes (a destroyed widget raises TclError, which those paths catch)
+        self._w = SimpleNamespace(status=self.p4_wf_status_text, run_btn=self.p4_wf_run_button, stop_btn=self.p4_wf_stop_button,
+                                 progress=self.p4_wf_progress_bar)
+
+        # Log lines, progress and UI calls from any thread are queued; _drain_ui_queue applies them on the Tk thread in
+        # batches. Its timer only runs while there is something to drain: a workflow start (or a Tk-thread log line) arms it
+
+        # The prompt editors are the heaviest widgets on the page (four ScrolledTexts holding long prompts);
+        # they are created the first time the page is shown. The prompt StringVars hold the text until then.
+        self._prompt_editors_built = False
+        self.bind("<Map>", self._on_first_map, add="+")
+
+    def _on_first_map(self, event=None):
+        """Builds the prompt editors the first time this page is mapped."""
+        if self._prompt_editors_built or (event is not None and event.widget is not self): return
+        self._build_prompt_editors()
+
+    # (editor attribute, prompt StringVar attribute, parent LabelFrame attribute, editor height)
+    _PROMPT_EDITORS = (
+        ('p4_wf_visual_extraction_prompt_text', 'p4_wf_visual_extraction_prompt_var', 'p4_wf_visual_extract_prompt_frame', 6),
+        ('p4_wf_book_processing_prompt_text', 'p4_wf_book_processing_prompt_var', 'p4_wf_text_analysis_prompt_frame', 6),
+        ('p4_wf_tagging_prompt_text_editor', 'p4_wf_tagging_prompt_var', 'p4_wf_tagging_pass1_prompt_frame', 8),
+        ('p4_wf_second_pass_prompt_text_editor', 'p4_wf_second_pass_prompt_var', 'p4_wf_tagging_pass2_prompt_frame', 8), # State set by _toggle_second_pass_widgets
+    )
+
+    def _build_prompt_editors(self):
+        """Creates the prompt ScrolledTexts inside their (already gridded) frames and loads the prompt vars into them."""
+        if self._prompt_editors_built: return
+        self._prompt_editors_built = True
+        try:
+            for editor_attr, var_attr, frame_attr, height in self._PROMPT_EDITORS:
+                var = getattr(self, var_attr)
+                editor = scrolledtext.ScrolledText(getattr(self, frame_attr), wrap=tk.WORD, height=height); editor.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+                editor.insert(tk.END, var.get()); editor.edit_modified(False) # Loaded text isn't an edit
+                editor.bind("<<Modified>>", functools.partial(self._on_prompt_modified, editor_attr, var))
+                setattr(self, editor_attr, editor)
+        except tk.TclError as e: print(f"P4 WF Prompt Editors Build Warning: {e}"); return
+        self._toggle_second_pass_widgets() # Apply the pass 2 editor state (and load its text if pass 2 is already enabled)
+
     def _toggle_bulk_mode(self):
         """Updates UI elements based on whether Bulk Mode is enabled."""
         is_bulk = self.p4_wf_is_bulk_mode.get()
@@ -296,6 +534,7 @@ class WorkflowPage(ttk.Frame):
 
             if hasattr(self, 'p4_wf_second_pass_model_label'): self.p4_wf_second_pass_model_label.config(state=new_state_widget)
             if hasattr(self, 'p4_wf_second_pass_model_dropdown'): self.p4_wf_second_pass_model_dropdown.config(state=new_state_combo)
+            if hasattr(self, 'p4_wf_pass2_untagged_only_check'): self.p4_wf_pass2_untagged_only_check.config(state=new_state_widget)
 
             editor = getattr(self, 'p4_wf_second_pass_prompt_text_editor', None)
             frame = getattr(self, 'p4_wf_tagging_pass2_prompt_frame', None)
@@ -306,10 +545,12 @@ class WorkflowPage(ttk.Frame):
                          frame.grid() # Ensure it's visible
                      if editor and editor.winfo_exists():
                          editor.config(state=tk.NORMAL)
-                         # Force text update if needed (sometimes state change doesn't refresh content)
-                         editor.delete('1.0', tk.END)
-                         editor.insert('1.0', self.p4_wf_second_pass_prompt_var.get())
-                         editor.edit_modified(False)
+                         # Reload the prompt only if the editor doesn't already show it (re-toggling is the common case)
+                         desired = self.p4_wf_second_pass_prompt_var.get()
+                         if editor.get('1.0', 'end-1c') != desired:
+                             editor.delete('1.0', tk.END)
+                             editor.insert('1.0', desired)
+                             editor.edit_modified(False)
                  else:
                      if frame.winfo_ismapped():
                          frame.grid_remove() # Hide frame
@@ -321,60 +562,137 @@ class WorkflowPage(ttk.Frame):
 
 
     # --- Prompt Sync Methods ---
-    def _sync_prompt_var_from_editor_p4_visual_extract(self, event=None):
-        try:
-            if hasattr(self, 'p4_wf_visual_extraction_prompt_text') and self.p4_wf_visual_extraction_prompt_text.winfo_exists():
-                 current_text = self.p4_wf_visual_extraction_prompt_text.get("1.0", tk.END).strip()
-                 self.p4_wf_visual_extraction_prompt_var.set(current_text)
-                 self.p4_wf_visual_extraction_prompt_text.edit_modified(False) # Reset modified flag
-        except tk.TclError: pass # Ignore errors if widget is destroyed during sync
-    def _sync_prompt_var_from_editor_p4_book_process(self, event=None):
+    # <<Modified>> fires when an editor's modified flag goes up. The copy into the StringVar is deferred by
+    # _PROMPT_SYNC_DELAY_MS and the flag is only reset by that copy, so keystrokes in between don't fire again.
+    def _on_prompt_modified(self, editor_attr, var, event=None):
+        """<<Modified>> handler shared by all prompt editors (bound per editor with its attribute name and StringVar)."""
+        self._schedule_prompt_sync(editor_attr, var)
+
+    def _schedule_prompt_sync(self, editor_attr, var):
+        """(Re)arms the deferred copy of one editor's text into its StringVar."""
+        widget = getattr(self, editor_attr, None)
         try:
-            if hasattr(self, 'p4_wf_book_processing_prompt_text') and self.p4_wf_book_processing_prompt_text.winfo_exists():
-                 current_text = self.p4_wf_book_processing_prompt_text.get("1.0", tk.END).strip()
-                 self.p4_wf_book_processing_prompt_var.set(current_text)
-                 self.p4_wf_book_processing_prompt_text.edit_modified(False) # Reset modified flag
-        except tk.TclError: pass
-    def _sync_prompt_var_from_editor_p4_tag(self, event=None):
-        try:
-            widget = self.p4_wf_tagging_prompt_text_editor
-            if widget and widget.winfo_exists():
-                 current_text = widget.get("1.0", tk.END).strip()
-                 self.p4_wf_tagging_prompt_var.set(current_text)
-                 widget.edit_modified(False) # Reset modified flag
+            if widget is None or not widget.edit_modified(): return # Our own edit_modified(False) reset also fires <<Modified>>
+            pending = self._prompt_sync_jobs.pop(editor_attr, None)
+            if pending: self.after_cancel(pending[0])
+            self._prompt_sync_jobs[editor_attr] = (self.after(_PROMPT_SYNC_DELAY_MS, self._sync_prompt_var, editor_attr, var), var)
         except tk.TclError: pass
-    def _sync_prompt_var_from_editor_p4_tag_pass2(self, event=None):
+
+    def _sync_prompt_var(self, editor_attr, var):
+        """Copies one editor's text into its StringVar and resets the editor's modified flag."""
+        self._prompt_sync_jobs.pop(editor_attr, None)
         try:
-            widget = self.p4_wf_second_pass_prompt_text_editor
+            widget = getattr(self, editor_attr, None)
             if widget and widget.winfo_exists():
-                 current_text = widget.get("1.0", tk.END).strip()
-                 self.p4_wf_second_pass_prompt_var.set(current_text)
-                 widget.edit_modified(False) # Reset modified flag
-        except tk.TclError: pass
+                 var.set(widget.get("1.0", tk.END).strip())
+                 widget.edit_modified(False) # Re-arms <<Modified>> for the next edit
+        except tk.TclError: pass # Ignore errors if widget is destroyed during sync
+
+    def _flush_prompt_syncs(self):
+        """Runs any pending prompt syncs now (called before the prompt vars are read)."""
+        for editor_attr, (job, var) in list(self._prompt_sync_jobs.items()):
+            try: self.after_cancel(job)
+            except tk.TclError: pass
+            self._sync_prompt_var(editor_attr, var)
 
     # --- Logging ---
-    def log_status(self, message, level="info"):
-        """Logs messages to the status ScrolledText on this page."""
-        try:
-            if not hasattr(self, 'p4_wf_status_text') or not self.p4_wf_status_text.winfo_exists():
-                print(f"P4 WF Status Log (No Widget): {message}")
-                return
+    _LOG_PREFIXES = {"info": "[INFO] ", "step": "[STEP] ", "warning": "[WARN] ", "error": "[ERROR] ", "upload": "[UPLOAD] ", "debug": "[DEBUG] ", "skip": "[SKIP] "}
+
+    def _format_log_line(self, message, level):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        return f"{timestamp} {self._LOG_PREFIXES.get(level, '[INFO] ')}{message}\n"
 
-            self.p4_wf_status_text.config(state="normal")
-            prefix_map = {"info": "[INFO] ", "step": "[STEP] ", "warning": "[WARN] ", "error": "[ERROR] ", "upload": "[UPLOAD] ", "debug": "[DEBUG] ", "skip": "[SKIP] "}
-            prefix = prefix_map.get(level, "[INFO] ")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            self.p4_wf_status_text.insert(tk.END, f"{timestamp} {prefix}{message}\n")
-            self.p4_wf_status_text.see(tk.END) # Scroll to the end
-            self.p4_wf_status_text.config(state="disabled")
-            self.update_idletasks() # Ensure UI updates immediately
+    def _write_log_text(self, text):
+        """Appends already formatted log text to the status widget (main thread only)."""
+        try:
+            status = self._w.status
+            status.config(state="normal")
+            status.insert(tk.END, text)
+            line_count = int(status.index("end-1c").split(".")[0])
+            if line_count > STATUS_LOG_MAX_LINES + STATUS_LOG_TRIM_SLACK: # Long bulk runs: keep the widget (and its redraws) bounded
+                status.delete("1.0", f"{line_count - STATUS_LOG_MAX_LINES}.0")
+            status.see(tk.END) # Scroll to the end
+            status.config(state="disabled")
 
         except tk.TclError as e:
             # Fallback if widget becomes unavailable during logging
-            print(f"P4 WF Status Log (backup): {message} (Error: {e})")
+            print(f"P4 WF Status Log (backup): {text} (Error: {e})", end="")
         except Exception as e:
             print(f"Unexpected error in P4 WF log_status: {e}")
 
+    def log_status(self, message, level="info"):
+        """Logs messages to the status ScrolledText on this page. Thread-safe: the line is queued (timestamped now)
+        and written by the periodic drain, so no Tk call happens on the calling thread.
+        "debug" lines are dropped right here (no timestamp, no queueing) unless Debug Logging is on."""
+        if level == "debug" and not self._debug_enabled: return
+        self._ui_queue.put(self._format_log_line(message, level))
+        if not self._ui_drain_armed and threading.current_thread() is threading.main_thread(): self._arm_ui_drain()
+
+    def _post_ui(self, func, *args):
+        """Thread-safe: runs func(*args) on the Tk thread, in order with the log lines queued around it."""
+        self._ui_queue.put((func, args))
+        if not self._ui_drain_armed and threading.current_thread() is threading.main_thread(): self._arm_ui_drain()
+
+    def _process_ui_queue(self, max_items=None):
+        """Handles queued items (all, or up to max_items). Consecutive log lines are written with a single insert;
+        the latest queued progress value is applied last. Main thread only."""
+        lines = []; handled = 0
+        while max_items is None or handled < max_items:
+            try: item = self._ui_queue.get_nowait()
+            except queue.Empty: break
+            handled += 1
+            if isinstance(item, str):
+                lines.append(item); continue
+            if lines: self._write_log_text("".join(lines)); lines = [] # Earlier lines first
+            func, args = item
+            try: func(*args)
+            except Exception as e: print(f"P4 WF UI call {getattr(func, '__name__', func)} failed: {e}")
+        if lines: self._write_log_text("".join(lines))
+        with self._ui_flush_lock:
+            value, self._pending_progress = self._pending_progress, None
+        if value is not None and self.p4_wf_is_processing: # A late value must not overwrite the final 100/0
+            self._update_progress_bar(value)
+
+    def _arm_ui_drain(self):
+        """Starts the _drain_ui_queue timer if it isn't running (main thread only)."""
+        if self._ui_drain_armed: return
+        try:
+            self.after(_UI_DRAIN_INTERVAL_MS, self._drain_ui_queue); self._ui_drain_armed = True
+        except tk.TclError: pass # Page destroyed
+
+    def _drain_ui_queue(self):
+        """Periodic Tk-thread drain of the UI queue (bounded per tick so a flood can't stall the UI).
+        The next tick is armed first, so a modal dialog run from the queue doesn't pause the drain.
+        The timer stops once the page is idle: no workflow running, its done-check handled (nothing else posts
+        from a worker thread) and the queue empty. _arm_ui_drain restarts it."""
+        if not self.p4_wf_is_processing and self._wf_future is None and self._ui_queue.empty():
+            self._ui_drain_armed = False; return
+        try:
+            self.after(_UI_DRAIN_INTERVAL_MS, self._drain_ui_queue)
+        except tk.TclError: self._ui_drain_armed = False; return # Page destroyed
+        self._process_ui_queue(_UI_DRAIN_MAX_ITEMS)
+
+    def _queue_progress(self, value):
+        """Thread-safe progress update. Only the latest value is applied, once per drain tick."""
+        with self._ui_flush_lock:
+            self._pending_progress = value
+
+    def _update_ranged_progress(self, progress_start, progress_end, processed, total):
+        """Tagging progress_callback body: maps (processed, total) onto [progress_start, progress_end].
+        Bind the range with functools.partial. Calls closer together than one drain interval are dropped;
+        the final one (processed >= total) always goes through."""
+        now = time.monotonic()
+        if processed < total and now - self._ranged_progress_last_sent < _UI_DRAIN_INTERVAL_MS / 1000.0: return
+        self._ranged_progress_last_sent = now
+        self._queue_progress(progress_start + ((processed / total) * (progress_end - progress_start)) if total > 0 else progress_end)
+
+    def _update_two_pass_progress(self, pass_index, progress_start, progress_end, processed, total):
+        """progress_callback for two concurrent tagging passes: maps their combined (processed, total) onto
+        [progress_start, progress_end]. Bind pass_index (0 or 1) and the range with functools.partial."""
+        self._tag_pass_progress[pass_index] = (processed, total) # Each pass writes only its own slot
+        done = sum(p for p, _ in self._tag_pass_progress); expected = sum(t for _, t in self._tag_pass_progress)
+        self._update_ranged_progress(progress_start, progress_end, done, expected)
+
     # --- File/Directory Selection ---
     def _select_input_file_single(self):
         """Handles browsing for a single input file."""
@@ -388,8 +706,9 @@ class WorkflowPage(ttk.Frame):
 
         filepath = filedialog.askopenfilename(parent=self, title=title, filetypes=filetypes)
         if filepath:
-            is_pdf = filepath.lower().endswith(".pdf")
-            is_txt = filepath.lower().endswith(".txt")
+            ext = os.path.splitext(filepath)[1].lower() # Lower-case just the extension, once
+            is_pdf = ext == ".pdf"
+            is_txt = ext == ".txt"
 
             # Validate file type based on workflow
             if selected_type == "Visual Q&A (PDF)" and not is_pdf:
@@ -412,32 +731,39 @@ class WorkflowPage(ttk.Frame):
         """Handles browsing for multiple PDF files for bulk mode."""
         filepaths = filedialog.askopenfilenames(parent=self, title="Select PDF Files for Bulk Processing", filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")])
         if filepaths:
-            self.p4_wf_input_file_paths = list(filepaths) # Store full paths
             if hasattr(self, 'p4_wf_bulk_files_listbox'):
                 self.p4_wf_bulk_files_listbox.delete(0, tk.END) # Clear existing list
-                skipped_count = 0
-                valid_paths = []
-                for fp in self.p4_wf_input_file_paths:
-                    if fp.lower().endswith(".pdf"):
-                        self.p4_wf_bulk_files_listbox.insert(tk.END, os.path.basename(fp)) # Display only basename
-                        valid_paths.append(fp)
-                    else:
-                        skipped_count += 1
-                        self.log_status(f"Skipped non-PDF file: {os.path.basename(fp)}", level="skip")
-                self.p4_wf_input_file_paths = valid_paths # Update internal list to only valid PDFs
+                # One split per path: (path, basename, lower-cased extension)
+                entries = [(fp, base, os.path.splitext(base)[1].lower()) for fp in filepaths for base in (os.path.basename(fp),)]
+                skipped_names = [base for _, base, ext in entries if ext != ".pdf"]
+                entries = [entry for entry in entries if entry[2] == ".pdf"]
+                # Content check too (a renamed .txt would otherwise only fail mid-run); the reads are tiny, so overlap them
+                with ThreadPoolExecutor(max_workers=min(8, len(entries) or 1)) as header_pool:
+                    header_ok = list(header_pool.map(has_pdf_header, [fp for fp, _, _ in entries]))
+                not_pdf_names = [base for (_, base, _), ok in zip(entries, header_ok) if not ok]
+                entries = [entry for entry, ok in zip(entries, header_ok) if ok]
+                self.p4_wf_input_file_paths = tuple(fp for fp, _, _ in entries) # Only valid PDFs, full paths
+                if entries: # One insert call for the whole selection (display only basenames)
+                    self.p4_wf_bulk_files_listbox.insert(tk.END, *[base for _, base, _ in entries])
+                if skipped_names:
+                    self.log_status(f"Skipped {len(skipped_names)} non-PDF file(s): {', '.join(skipped_names)}", level="skip")
+                if not_pdf_names:
+                    self.log_status(f"Skipped {len(not_pdf_names)} .pdf file(s) that are not valid PDFs (or unreadable): {', '.join(not_pdf_names)}", level="skip")
+                skipped_names += not_pdf_names
                 log_msg = f"Selected {len(self.p4_wf_input_file_paths)} PDF files for bulk processing."
-                if skipped_count > 0:
-                    log_msg += f" Skipped {skipped_count} non-PDF files."
+                if skipped_names:
+                    log_msg += f" Skipped {len(skipped_names)} non-PDF files."
                 self.log_status(log_msg)
             else:
                 # Fallback log if listbox somehow doesn't exist
+                 self.p4_wf_input_file_paths = tuple(filepaths)
                  self.log_status(f"Selected {len(self.p4_wf_input_file_paths)} PDF files (listbox not found).")
         else:
             self.log_status("Bulk file selection cancelled.")
 
     def _clear_bulk_files_list(self):
         """Clears the list of files selected for bulk processing."""
-        self.p4_wf_input_file_paths = [] # Clear internal list
+        self.p4_wf_input_file_paths = () # Clear internal list
         if hasattr(self, 'p4_wf_bulk_files_listbox'):
             self.p4_wf_bulk_files_listbox.delete(0, tk.END) # Clear UI listbox
         self.log_status("Cleared bulk file list.")
@@ -516,8 +842,11 @@ class WorkflowPage(ttk.Frame):
         if self.p4_wf_is_processing:
             show_info_dialog("In Progress", "Workflow is already running.", parent=self)
             return
+        self._flush_prompt_syncs() # Edits from the last _PROMPT_SYNC_DELAY_MS may not be in the prompt vars yet
 
-        # --- Gather Common Inputs ---
+        # --- Snapshot Inputs ---
+        # Every string/bool setting is read here, once, before any dialog can run a nested event loop; validation and
+        # the worker arguments below only use these locals (numeric fields are read in their validation try blocks)
         is_bulk = self.p4_wf_is_bulk_mode.get()
         selected_type = self.p4_wf_processing_type.get()
         is_visual = selected_type == "Visual Q&A (PDF)"
@@ -528,6 +857,14 @@ class WorkflowPage(ttk.Frame):
         enable_second_pass = self.p4_wf_enable_second_pass.get()
         tag_model_pass2 = self.p4_wf_second_pass_model.get()
         tag_prompt_pass2 = self.p4_wf_second_pass_prompt_var.get()
+        extract_prompt = self.p4_wf_visual_extraction_prompt_var.get()
+        analysis_prompt = self.p4_wf_book_processing_prompt_var.get()
+        anki_media_dir = self.p4_wf_anki_media_path.get()
+        save_direct = self.p4_wf_save_directly_to_media.get()
+        input_file = self.p4_wf_input_file_path.get()
+        input_files = self.p4_wf_input_file_paths # A tuple: reselecting files mid-run replaces it, so no copy is needed
+        debug_enabled = self.p4_wf_debug.get()
+        use_extract_cache = self.p4_wf_use_extract_cache.get()
 
         # --- Common Validations ---
         if not api_key or api_key == "YOUR_API_KEY_HERE":
@@ -554,35 +891,46 @@ class WorkflowPage(ttk.Frame):
                 tag_api_delay=0.0 # Use the corrected value
         except tk.TclError:
             show_error_dialog("Error", "Invalid input for Tagging Batch Size or Delay.", parent=self); return
+        # Snapshot of every tagging setting: worker threads never touch Tk variables (not thread-safe, and each get() is a Tcl call)
+        tag_cfg = SimpleNamespace(model_pass1=tag_model_pass1, prompt_pass1=tag_prompt_pass1,
+                                  batch_size=tag_batch_size, api_delay=tag_api_delay, enable_second_pass=enable_second_pass,
+                                  model_pass2=tag_model_pass2, prompt_pass2=tag_prompt_pass2,
+                                  pass2_untagged_only=enable_second_pass and self.p4_wf_pass2_untagged_only.get())
 
         # --- Workflow Specific Logic and Validation ---
         target_func = None
         args = ()
         if is_bulk:
             # --- Bulk Mode Validation ---
-            input_files = self.p4_wf_input_file_paths
             if not input_files:
                 show_error_dialog("Error", "Bulk Mode: No PDF files selected in the list.", parent=self); return
-            extract_prompt = self.p4_wf_visual_extraction_prompt_var.get()
-            anki_media_dir = self.p4_wf_anki_media_path.get()
+            try:
+                max_concurrent_files = self.p4_wf_bulk_max_concurrent.get()
+                if max_concurrent_files <= 0:
+                    show_error_dialog("Error", "Bulk Mode: 'Files at once' must be greater than 0.", parent=self); return
+            except tk.TclError:
+                show_error_dialog("Error", "Bulk Mode: Invalid input for 'Files at once'.", parent=self); return
             if not extract_prompt:
                 show_error_dialog("Error", "Visual Extraction prompt cannot be empty.", parent=self); return
             if not PYMUPDF_INSTALLED:
                 show_error_dialog("Error", "PyMuPDF (fitz) is required for Bulk Visual Q&A workflow.", parent=self); return
             if not anki_media_dir or not os.path.isdir(anki_media_dir):
                 show_error_dialog("Error", "Bulk Mode requires a valid Anki media path for direct image saving. Please set it.", parent=self); return
+            output_dir = os.path.dirname(input_files[0]) or os.getcwd() # Use dir of first file
+            if not os.access(output_dir, os.W_OK): # Checked once here instead of failing on every PDF
+                show_error_dialog("Error", f"Bulk Mode: the output folder is not writable:\n{output_dir}", parent=self); return
             # Warn if path doesn't look like collection.media, but allow proceeding
             if os.path.basename(anki_media_dir).lower() != "collection.media":
                  if not ask_yes_no("Confirm Path", f"Anki media path '{os.path.basename(anki_media_dir)}' doesn't end in 'collection.media'.\nProceed anyway?", parent=self): return
 
-            output_dir = os.path.dirname(input_files[0]) if input_files else os.getcwd() # Use dir of first file
-            args = (input_files, output_dir, api_key, step1_model, tag_model_pass1, extract_prompt, tag_prompt_pass1, anki_media_dir, tag_batch_size, tag_api_delay,
-                    enable_second_pass, tag_model_pass2, tag_prompt_pass2)
+            resume_stamp = self._find_resumable_bulk_run(output_dir, _bulk_run_signature(input_files, step1_model, extract_prompt))
+            if resume_stamp and not ask_yes_no("Resume Bulk Run", f"An unfinished bulk run ({resume_stamp}) was found in:\n{output_dir}\n\nResume it? PDFs it already finished will be skipped.", parent=self):
+                resume_stamp = None
+            args = (input_files, output_dir, api_key, step1_model, extract_prompt, anki_media_dir, tag_cfg, resume_stamp, max_concurrent_files)
             target_func = self._run_bulk_visual_workflow_thread
 
         else: # Single File Mode
             # --- Single File Validation ---
-            input_file = self.p4_wf_input_file_path.get()
             if not input_file or not os.path.exists(input_file):
                 show_error_dialog("Error", "Please select a valid input file.", parent=self); return
             output_dir = os.path.dirname(input_file) if input_file else os.getcwd()
@@ -590,26 +938,24 @@ class WorkflowPage(ttk.Frame):
 
             if is_visual:
                 # --- Visual Q&A (Single) Validation ---
-                extract_prompt = self.p4_wf_visual_extraction_prompt_var.get()
-                save_direct = self.p4_wf_save_directly_to_media.get()
-                anki_media_path_from_ui = self.p4_wf_anki_media_path.get()
+                anki_media_path_from_ui = anki_media_dir
                 if not extract_prompt:
                     show_error_dialog("Error", "Visual Extraction prompt cannot be empty.", parent=self); return
                 if not PYMUPDF_INSTALLED:
                     show_error_dialog("Error", "PyMuPDF (fitz) is required for Visual Q&A workflow.", parent=self); return
                 if save_direct and (not anki_media_path_from_ui or not os.path.isdir(anki_media_path_from_ui)):
                     show_error_dialog("Error", "Direct image save is enabled, but the Anki media path is invalid or not set.", parent=self); return
+                if save_direct and not os.access(anki_media_path_from_ui, os.W_OK):
+                    show_error_dialog("Error", f"Direct image save is enabled, but the Anki media path is not writable:\n{anki_media_path_from_ui}", parent=self); return
                 # Warn if path doesn't look like collection.media, but allow proceeding
                 if save_direct and os.path.basename(anki_media_path_from_ui).lower() != "collection.media":
                       if not ask_yes_no("Confirm Path", f"Direct save path '{os.path.basename(anki_media_path_from_ui)}' doesn't end in 'collection.media'.\nProceed anyway?", parent=self): return
 
-                args = (input_file, output_dir, safe_base_name, api_key, step1_model, tag_model_pass1, extract_prompt, tag_prompt_pass1, save_direct, anki_media_path_from_ui, tag_batch_size, tag_api_delay,
-                        enable_second_pass, tag_model_pass2, tag_prompt_pass2)
+                args = (input_file, output_dir, safe_base_name, api_key, step1_model, extract_prompt, save_direct, anki_media_path_from_ui, tag_cfg)
                 target_func = self._run_single_visual_workflow_thread
 
             else: # Text Analysis (Single)
                 # --- Text Analysis (Single) Validation ---
-                analysis_prompt = self.p4_wf_book_processing_prompt_var.get()
                 try:
                     text_chunk_size = self.p4_wf_text_chunk_size.get()
                     text_api_delay = self.p4_wf_text_api_delay.get()
@@ -627,44 +973,96 @@ class WorkflowPage(ttk.Frame):
                 if input_file.lower().endswith(".pdf") and not PYMUPDF_INSTALLED:
                     show_error_dialog("Error", "PyMuPDF (fitz) is required for PDF text analysis.", parent=self); return
 
-                args = (input_file, output_dir, safe_base_name, api_key, step1_model, tag_model_pass1, analysis_prompt, tag_prompt_pass1, text_chunk_size, text_api_delay, tag_batch_size, tag_api_delay,
-                        enable_second_pass, tag_model_pass2, tag_prompt_pass2)
+                args = (input_file, output_dir, safe_base_name, api_key, step1_model, analysis_prompt, text_chunk_size, text_api_delay, tag_cfg)
                 target_func = self._run_single_text_analysis_workflow_thread
 
         # --- Start Thread ---
         if target_func:
             self.p4_wf_is_processing = True
+            self._wf_stop.clear()
+            self._debug_enabled = debug_enabled
+            self._use_extract_cache = use_extract_cache
+            self._process_ui_queue() # Anything still queued belongs to the old log that is about to be cleared
             try:
                 # Update UI to indicate processing start
                 if hasattr(self, 'p4_wf_run_button'): self.p4_wf_run_button.config(state="disabled", text="Workflow Running...", bg='lightgrey') # Change bg
+                if hasattr(self, 'p4_wf_stop_button'): self.p4_wf_stop_button.config(state="normal", text="Stop")
                 if hasattr(self, 'p4_wf_status_text'):
                     self.p4_wf_status_text.config(state="normal")
                     self.p4_wf_status_text.delete('1.0', tk.END) # Clear previous logs
                     self.p4_wf_status_text.config(state="disabled")
                 if hasattr(self, 'p4_wf_progress_bar'): self.p4_wf_progress_var.set(0)
+                self._progress_shown = 0.0
             except tk.TclError: pass # Ignore if widgets destroyed
 
             self.log_status(f"Starting {'Bulk' if is_bulk else 'Single File'} {selected_type} workflow...")
-            # Configure Gemini API before starting thread (optional, could be done in thread too)
-            # configure_gemini(api_key) # Assuming configure_gemini is thread-safe or called appropriately
+            # Configure Gemini and open its connection on the side, while the workflow starts on local work
+            threading.Thread(target=warm_up_gemini, args=(api_key, step1_model), name="p4_gemini_warmup", daemon=True).start()
 
-            thread = threading.Thread(target=target_func, args=args, daemon=True)
-            thread.start()
+            self._wf_future = future = self._wf_executor.submit(target_func, *args)
+            self._arm_ui_drain() # Before the worker can post anything; runs until the run and its done-check are handled
+            future.add_done_callback(self._on_workflow_future_done)
+            self._wf_executor.submit(self._prune_caches) # Same single worker: runs once the workflow is done
         else:
             # This case should ideally not be reached due to prior checks
             show_error_dialog("Error", "Could not determine workflow function to run.", parent=self)
 
+    def _prune_caches(self):
+        """Trims the page image and extraction caches to their size caps (least recently used entries go first).
+        The tag cache evicts by itself (see _TagCache). Runs on the workflow worker after a run; errors are only printed."""
+        try:
+            for name, (removed, freed) in (("page image", prune_page_image_cache(PAGE_IMAGE_CACHE_MAX_BYTES)),
+                                           ("extraction", prune_cache_dir(EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_BYTES))):
+                if removed: print(f"Pruned {removed} {name} cache entries ({freed / 1024 ** 2:.0f} MiB).")
+        except Exception as e:
+            print(f"Cache pruning skipped: {type(e).__name__}: {e}")
+
+    def _request_workflow_stop(self):
+        """Stop button: asks the running workflow to end at its next check (files already in flight finish first)."""
+        if not self.p4_wf_is_processing or self._wf_stop.is_set(): return
+        self._wf_stop.set()
+        self.log_status("Stop requested: finishing the work in progress, then stopping...", "warning")
+        try: self._w.stop_btn.config(state="disabled", text="Stopping...")
+        except tk.TclError: pass
+
+    def shutdown_workflow(self):
+        """App window closing: stops a running workflow at its next check and drops anything not started yet, so the
+        (non-daemon) worker thread does not keep the process alive until the whole run is done. Returns immediately."""
+        self._wf_stop.set()
+        self._wf_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _raise_if_stopped(self):
+        """Called by workflow threads between steps: ends the run if Stop was pressed."""
+        if self._wf_stop.is_set(): raise WorkflowStepError("Stopped by user.")
+
+    def _on_workflow_future_done(self, future):
+        """Done callback of the workflow future (runs on the worker thread): hands the check to the Tk thread."""
+        self._post_ui(self._check_workflow_future, future)
+
+    def _check_workflow_future(self, future):
+        """Safety net for a workflow thread that died without reporting. The workflows call _workflow_finished themselves;
+        that call is queued ahead of this one, so p4_wf_is_processing is only still set here if it never happened."""
+        if future is self._wf_future: self._wf_future = None # Last post of this run: the drain may go idle now
+        if not self.p4_wf_is_processing: return
+        exc = future.exception()
+        self._workflow_finished(False, None, f"Workflow thread ended unexpectedly: {exc}" if exc else None)
+
     def _update_progress_bar(self, value):
-        """Safely updates the progress bar value from any thread."""
+        """Sets the progress bar value (main thread; workers go through _queue_progress). Changes smaller than
+        _PROGRESS_MIN_STEP are skipped (each set is a Tcl variable write plus a bar redraw); 0 and 100 always apply."""
+        if abs(value - self._progress_shown) < _PROGRESS_MIN_STEP and value not in (0, 100): return
         try:
-            if hasattr(self, 'p4_wf_progress_bar') and self.p4_wf_progress_bar.winfo_exists():
-                self.p4_wf_progress_var.set(value)
-                self.update_idletasks() # Ensure UI updates
+            self.p4_wf_progress_var.set(value) # The bar redraws itself at the next idle; no forced update_idletasks
+            self._progress_shown = value
         except tk.TclError:
             print(f"P4 WF Warning: Could not update progress bar (value: {value})")
 
     def _workflow_finished(self, success=True, final_tsv_path=None, summary_message=None):
-        """Called from the main thread after workflow finishes to update UI."""
+        """Updates UI after the workflow finishes. Safe to call from worker threads (posted to the UI queue,
+        behind the lines the worker already logged)."""
+        if threading.current_thread() is not threading.main_thread():
+            self._post_ui(self._workflow_finished, success, final_tsv_path, summary_message)
+            return
         self.p4_wf_is_processing = False
         is_bulk = self.p4_wf_is_bulk_mode.get()
         selected_type = self.p4_wf_processing_type.get()
@@ -682,299 +1080,352 @@ class WorkflowPage(ttk.Frame):
             final_button_text = "Workflow Failed (See Log)"
             final_bg = 'salmon' # Error color
 
+        # Final status message
+        if summary_message:
+            final_line = self._format_log_line(summary_message, "info" if success else "error")
+        elif success and final_tsv_path:
+            final_line = self._format_log_line(f"Workflow successful. Final Output: {os.path.basename(final_tsv_path)}", "info")
+        elif not success:
+            final_line = self._format_log_line(f"Workflow failed. See previous logs for details.", "error")
+        else: # Success but no specific path/message
+            final_line = self._format_log_line(f"Workflow finished.", "info")
+
+        # Button, final log line and progress bar all change in this one Tk callback, so they are redrawn together
+        # on the next idle pass. The final line is written directly (not queued for the next drain tick), after
+        # anything the worker logged that is still waiting in the queue.
+        self._process_ui_queue()
         try:
             # Update Run Button
-            if hasattr(self, 'p4_wf_run_button') and self.p4_wf_run_button.winfo_exists():
-                self.p4_wf_run_button.config(state="normal", text=final_button_text, bg=final_bg)
+            self._w.run_btn.config(state="normal", text=final_button_text, bg=final_bg)
+            self._w.stop_btn.config(state="disabled", text="Stop")
 
             # Log final status message
-            if summary_message:
-                self.log_status(summary_message, level="info" if success else "error")
-            elif success and final_tsv_path:
-                self.log_status(f"Workflow successful. Final Output: {os.path.basename(final_tsv_path)}", level="info")
-            elif not success:
-                self.log_status(f"Workflow failed. See previous logs for details.", level="error")
-            else: # Success but no specific path/message
-                 self.log_status(f"Workflow finished.", level="info")
-
+            self._write_log_text(final_line)
 
             # Update Progress Bar
-            if hasattr(self, 'p4_wf_progress_bar') and self.p4_wf_progress_bar.winfo_exists():
-                self.p4_wf_progress_var.set(100 if success else 0) # Full or zero based on success
+            self._progress_shown = 100 if success else 0 # Full or zero based on success
+            self._w.progress.configure(value=self._progress_shown) # Straight to the widget: no variable write/trace round trip
 
         except tk.TclError:
             print("P4 WF Warning: Could not update workflow button/status state on finish.")
 
 
+    def _finalize_intermediate_json(self, intermediate_json_path, success):
+        """Removes the intermediate JSON after a successful run (if enabled); on failure tells the user it was kept."""
+        if success:
+            if not _REMOVE_INTERMEDIATE_ON_SUCCESS: return # Nothing to do, so don't even stat the file
+            try:
+                os.remove(intermediate_json_path) # One syscall, no exists() check to race with
+                self.log_status(f"Cleaned up intermediate JSON: {os.path.basename(intermediate_json_path)}", "debug")
+            except FileNotFoundError: pass
+            except OSError as rem_e:
+                self.log_status(f"Could not remove intermediate JSON {os.path.basename(intermediate_json_path)}: {rem_e}", "warning")
+        elif os.path.isfile(intermediate_json_path):
+            self.log_status(f"Keeping intermediate JSON on failure: {os.path.basename(intermediate_json_path)}", "warning")
+
+    def _find_resumable_bulk_run(self, output_dir, run_signature):
+        """Returns the timestamp of the newest unfinished bulk run in output_dir (a .partial intermediate plus its checkpoint)
+        that was started with run_signature (see _bulk_run_signature), or None."""
+        prefix, suffix = _BULK_INTER_FMT.split("{stamp}")
+        suffix += _PARTIAL_SUFFIX
+        try:
+            stamps = [entry.name[len(prefix):-len(suffix)] for entry in os.scandir(output_dir)
+                      if entry.name.startswith(prefix) and entry.name.endswith(suffix)]
+        except OSError:
+            return None
+        for stamp in sorted(stamps, reverse=True): # Timestamps sort chronologically
+            sidecar_path = os.path.join(output_dir, _BULK_INTER_FMT.format(stamp=stamp) + _RESUME_SIDECAR_SUFFIX)
+            if not os.path.isfile(sidecar_path): continue
+            state = self._load_bulk_resume_state(sidecar_path)
+            if state is not None and state.get("run") == run_signature: # Other files/model/prompt: not this run's items
+                return stamp
+        return None
+
+    def _save_bulk_resume_state(self, sidecar_path, offset, count, done_paths, run_signature):
+        """Atomically rewrites the bulk checkpoint. Failing to write it only costs the ability to resume."""
+        tmp_path = sidecar_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"offset": offset, "count": count, "done": done_paths, "run": run_signature}, f)
+            os.replace(tmp_path, sidecar_path)
+        except OSError as e:
+            self.log_status(f"Could not save bulk resume checkpoint: {e}", "warning")
+
+    def _load_bulk_resume_state(self, sidecar_path):
+        """Reads a bulk checkpoint written by _save_bulk_resume_state. Returns the dict, or None if unusable."""
+        try:
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if isinstance(state.get("offset"), int) and isinstance(state.get("count"), int) and isinstance(state.get("done"), list):
+                return state
+            self.log_status(f"Ignoring malformed resume checkpoint: {os.path.basename(sidecar_path)}", "warning")
+        except (OSError, ValueError, AttributeError) as e:
+            self.log_status(f"Could not read resume checkpoint {os.path.basename(sidecar_path)}: {e}", "warning")
+        return None
+
     # --- Internal Helper for Tagging ---
-    def _wf_gemini_tag_json(self, intermediate_json_path, tag_prompt_template_pass1, api_key,
-                            tag_model_name_pass1, tag_batch_size, tag_api_delay,
-                            enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2):
+    def _run_tag_pass(self, items, pass_num, model_name, prompt, api_key, tag_cfg, tag_cache, output_dir, base_filename,
+                      progress_callback, rate_limiter=None):
+        """Runs one tagging pass and returns a tagged copy of every item, in order.
+        Items with the same text are sent to Gemini once, and items already in tag_cache (for this pass, model and prompt)
+        or with no question/answer text are not sent at all; newly returned tags (except ERROR: results) are added to tag_cache."""
+        scope = _tag_cache_scope(pass_num, model_name, prompt)
+        keys = [_tag_item_key(scope, item) for item in items]
+        tags_by_key = {}; to_tag = {} # key -> first item with that key
+        for key, item in zip(keys, items):
+            if key in tags_by_key or key in to_tag: continue
+            if not _has_tag_text(item): tags_by_key[key] = ""; continue # Blank item: no request, no tags
+            cached_tags = tag_cache.get(key)
+            if cached_tags is not None: tags_by_key[key] = cached_tags
+            else: to_tag[key] = item
+        if len(to_tag) < len(items):
+            self.log_status(f"  Pass {pass_num}: tagging {len(to_tag)} unique item(s); {len(items) - len(to_tag)} duplicate/cached/blank item(s) are not sent.", "info")
+
+        if to_tag:
+            tagged_generator = tag_tsv_rows_gemini(
+                input_data=list(to_tag.values()),
+                api_key=api_key,
+                model_name_pass1=model_name,      # The model/prompt of the pass being run
+                system_prompt_pass1=prompt,
+                batch_size=tag_cfg.batch_size,
+                api_delay=tag_cfg.api_delay,
+                log_func=self.log_status,
+                progress_callback=progress_callback,
+                output_dir=output_dir, # Pass output dir for potential internal temp files
+                base_filename=base_filename, # Base name for internal temp files
+                enable_second_pass=pass_num == 2,
+                second_pass_model_name=model_name if pass_num == 2 else None,
+                second_pass_prompt=prompt if pass_num == 2 else None,
+                parent_widget=self,
+                rate_limiter=rate_limiter,
+                stop_event=self._wf_stop
+            )
+            # Collect results (yields header first, then tagged dicts); the header is taken off the generator, not sliced off a copy
+            header = next(tagged_generator, None)
+            tagged_items = list(tagged_generator)
+            self._raise_if_stopped() # A stopped pass yields nothing; don't report that as a tagging failure
+            if header is None or not tagged_items: # Check if only header or nothing yielded
+                raise WorkflowStepError(f"Gemini tagging (Pass {pass_num}) failed (no data yielded).")
+            for key, tagged_item in zip(to_tag, tagged_items): # Yielded in input order
+                tags = tagged_item.get('Tags', '')
+                tags_by_key[key] = tags
+                if "ERROR:" not in tags: tag_cache[key] = tags # Failures are retried next run
+        return [{**item, 'Tags': tags_by_key.get(key, '')} for key, item in zip(keys, items)]
+
+    def _wf_gemini_tag_json(self, intermediate_json_path, api_key, tag_cfg, input_data=None):
         """
         Handles the Gemini tagging process (Pass 1 and optional Pass 2).
-        Loads data from intermediate_json_path, performs tagging,
+        Loads data from intermediate_json_path (or uses input_data if the caller already has it in memory,
+        in which case the path only names the outputs), performs tagging,
         saves the final tagged JSON data, and returns it.
+        tag_cfg is the tagging settings snapshot taken on the Tk thread by _start_workflow_thread.
         """
+        tag_model_name_pass1, tag_prompt_template_pass1 = tag_cfg.model_pass1, tag_cfg.prompt_pass1
+        tag_batch_size, tag_api_delay, enable_second_pass = tag_cfg.batch_size, tag_cfg.api_delay, tag_cfg.enable_second_pass
+        tag_model_name_pass2, tag_prompt_template_pass2 = tag_cfg.model_pass2, tag_cfg.prompt_pass2
         final_tagged_data = None
         # Define path for the final tagged JSON *before* TSV conversion
         output_dir = os.path.dirname(intermediate_json_path)
         base_name = os.path.splitext(os.path.basename(intermediate_json_path))[0]
         # Ensure base_name doesn't contain suffixes like '_intermediate_visual' for cleaner final name
-        suffixes_to_remove = ["_intermediate_visual", "_intermediate_analysis", "_intermediate"]
-        for suffix in suffixes_to_remove:
+        for suffix in _INTERMEDIATE_SUFFIXES:
             if base_name.endswith(suffix):
                 base_name = base_name[:-len(suffix)]
                 break
-        final_tagged_json_output_path = os.path.join(output_dir, f"{base_name}_final_tagged_data.json")
+        final_tagged_json_output_path = os.path.join(output_dir, _TAGGED_JSON_FMT.format(base=base_name))
 
+        # --- Tag cache (tags from earlier runs, by pass/model/prompt and item text); saved in `finally`, so the tags of a
+        # stopped or failed run are kept too ---
+        tag_cache = _TagCache(TAG_CACHE_PATH)
 
         try:
-            # --- Load Input JSON ---
-            self.after(0, self.log_status, f"Loading intermediate data from: {os.path.basename(intermediate_json_path)}", "debug")
+            # --- Load Input JSON (skipped when the data is already in memory) ---
             try:
-                with open(intermediate_json_path, 'r', encoding='utf-8') as f_p1:
-                    json_data_pass1 = json.load(f_p1)
+                if input_data is not None:
+                    json_data_pass1 = input_data
+                else:
+                    self.log_status(f"Loading intermediate data from: {os.path.basename(intermediate_json_path)}", "debug")
+                    json_data_pass1 = list(iter_json_array(intermediate_json_path)) # Tagging batches by index, so the items are kept
                 if not json_data_pass1:
-                    self.after(0, self.log_status, "Intermediate JSON is empty. Skipping tagging.", "warning")
+                    self.log_status("Intermediate JSON is empty. Skipping tagging.", "warning")
                     return [] # Return empty list if input is empty
             except Exception as load_e:
                 raise WorkflowStepError(f"Failed to load intermediate JSON for Pass 1: {load_e}")
 
-            # --- Pass 1 Tagging ---
-            self.after(0, self.log_status, f"  Starting Tagging Pass 1 ({tag_model_name_pass1}, Batch: {tag_batch_size}, Delay: {tag_api_delay}s)...", "debug")
-            progress_start_pass1 = 35 # Progress after extraction/analysis
-            progress_end_pass1 = 75 if enable_second_pass else 90 # End progress for pass 1
-
-            def update_tag_progress_pass1(processed, total):
-                progress = progress_start_pass1 + ((processed / total) * (progress_end_pass1 - progress_start_pass1)) if total > 0 else progress_end_pass1
-                self.after(0, self._update_progress_bar, progress)
-
-            # Use generator to process tags
-            tagged_data_pass1_generator = tag_tsv_rows_gemini(
-                input_data=json_data_pass1,                 # Pass loaded data
-                api_key=api_key,
-                model_name_pass1=tag_model_name_pass1,      # Correct parameter name
-                system_prompt_pass1=tag_prompt_template_pass1, # Correct parameter name
-                batch_size=tag_batch_size,
-                api_delay=tag_api_delay,
-                log_func=self.log_status,
-                progress_callback=update_tag_progress_pass1,
-                output_dir=output_dir, # Pass output dir for potential internal temp files
-                base_filename=f"{base_name}_tagging_p1", # Base name for internal temp files
-                parent_widget=self
-            )
-            # Collect results (yields header first, then tagged dicts)
-            tagged_data_pass1_results = list(tagged_data_pass1_generator)
-            if not tagged_data_pass1_results or len(tagged_data_pass1_results) <= 1 and json_data_pass1: # Check if only header or nothing yielded
-                raise WorkflowStepError("Gemini tagging (Pass 1) failed (no data yielded).")
-            tagged_data_pass1 = tagged_data_pass1_results[1:] # Skip header
-
-            self.after(0, self.log_status, "  Tagging Pass 1 Complete.", "info")
-            self.after(0, self._update_progress_bar, progress_end_pass1)
-            # Store Pass 1 results, don't assign to final_tagged_data yet
-            results_pass1 = tagged_data_pass1
-
-            # --- Pass 2 Tagging (Optional) ---
+            # --- Pass 1 (+ optional Pass 2) Tagging ---
+            # Pass 2 tags the ORIGINAL data (not Pass 1's output), so the passes are independent: Pass 2 runs on its own
+            # thread alongside Pass 1. Both share one RateLimiter, so together they stay within the request budget.
+            # With "Pass 2 only for items Pass 1 left untagged", Pass 2 instead runs after Pass 1, on just those items.
+            progress_start, progress_end = 35, 90 # Progress after extraction/analysis .. before TSV generation
+            rate_limiter = RateLimiter(min_interval=tag_api_delay)
+            self.log_status(f"  Starting Tagging Pass 1 ({tag_model_name_pass1}, Batch: {tag_batch_size}, Delay: {tag_api_delay}s)...", "debug")
             if enable_second_pass:
-                self.after(0, self.log_status, f"  Starting Tagging Pass 2 ({tag_model_name_pass2}, Batch: {tag_batch_size}, Delay: {tag_api_delay}s)...", "debug")
-                progress_start_pass2 = 75
-                progress_end_pass2 = 90
-
-                def update_tag_progress_pass2(processed, total):
-                    progress = progress_start_pass2 + ((processed / total) * (progress_end_pass2 - progress_start_pass2)) if total > 0 else progress_end_pass2
-                    self.after(0, self._update_progress_bar, progress)
-
-                # Input for Pass 2 should be the ORIGINAL data to avoid basing tags on Pass 1 tags
-                tagged_data_pass2_generator = tag_tsv_rows_gemini(
-                    input_data=json_data_pass1,                  # Use original data for Pass 2 input
-                    api_key=api_key,
-                    # Pass 2 specific parameters
-                    model_name_pass1=tag_model_name_pass2,       # Use Pass 2 model here
-                    system_prompt_pass1=tag_prompt_template_pass2, # Use Pass 2 prompt here
-                    # Common parameters
-                    batch_size=tag_batch_size,
-                    api_delay=tag_api_delay,
-                    log_func=self.log_status,
-                    progress_callback=update_tag_progress_pass2,
-                    output_dir=output_dir, # Pass output dir for potential internal temp files
-                    base_filename=f"{base_name}_tagging_p2", # Base name for internal temp files
-                    # Pass enable_second_pass flag and model/prompt info if needed by the function
-                    enable_second_pass=True,
-                    second_pass_model_name=tag_model_name_pass2,
-                    second_pass_prompt=tag_prompt_template_pass2,
-                    parent_widget=self
-                )
-                # Collect results (yields header first, then tagged dicts)
-                tagged_data_pass2_results = list(tagged_data_pass2_generator)
-                if not tagged_data_pass2_results or len(tagged_data_pass2_results) <= 1 and json_data_pass1: # Check if only header or nothing yielded
-                    raise WorkflowStepError("Gemini tagging (Pass 2) failed (no data yielded).")
-                results_pass2 = tagged_data_pass2_results[1:] # Skip header
-
-                self.after(0, self.log_status, "  Tagging Pass 2 Complete.", "info")
-                self.after(0, self._update_progress_bar, progress_end_pass2)
+                self._tag_pass_progress = [(0, 0), (0, 0)]
+                pass1_progress = functools.partial(self._update_two_pass_progress, 0, progress_start, progress_end)
+                pass2_progress = functools.partial(self._update_two_pass_progress, 1, progress_start, progress_end)
+                if tag_cfg.pass2_untagged_only:
+                    # Cascade: Pass 2 only gets the items Pass 1 left untagged (no tags, or an ERROR:), so it waits for Pass 1
+                    results_pass1 = self._run_tag_pass(
+                        json_data_pass1, 1, tag_model_name_pass1, tag_prompt_template_pass1, api_key, tag_cfg,
+                        tag_cache, output_dir, f"{base_name}_tagging_p1", pass1_progress, rate_limiter)
+                    self.log_status("  Tagging Pass 1 Complete.", "info")
+                    pass2_indices = [i for i, item in enumerate(results_pass1) if _needs_second_pass(item)]
+                    self.log_status(f"  Starting Tagging Pass 2 on the {len(pass2_indices)} item(s) Pass 1 left untagged ({tag_model_name_pass2}, Batch: {tag_batch_size}, Delay: {tag_api_delay}s)...", "debug")
+                    results_pass2 = [{}] * len(results_pass1) # Items Pass 2 skipped contribute no tags
+                    if pass2_indices:
+                        pass2_items = self._run_tag_pass(
+                            [json_data_pass1[i] for i in pass2_indices], 2, tag_model_name_pass2, tag_prompt_template_pass2, api_key, tag_cfg,
+                            tag_cache, output_dir, f"{base_name}_tagging_p2", pass2_progress, rate_limiter)
+                        for i, item_p2 in zip(pass2_indices, pass2_items): results_pass2[i] = item_p2
+                else:
+                    self.log_status(f"  Starting Tagging Pass 2 alongside it ({tag_model_name_pass2}, Batch: {tag_batch_size}, Delay: {tag_api_delay}s)...", "debug")
+                    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="p4_tag_p2") as pass2_pool:
+                        pass2_future = pass2_pool.submit(
+                            self._run_tag_pass, json_data_pass1, 2, tag_model_name_pass2, tag_prompt_template_pass2, api_key, tag_cfg,
+                            tag_cache, output_dir, f"{base_name}_tagging_p2", pass2_progress, rate_limiter)
+                        results_pass1 = self._run_tag_pass(
+                            json_data_pass1, 1, tag_model_name_pass1, tag_prompt_template_pass1, api_key, tag_cfg,
+                            tag_cache, output_dir, f"{base_name}_tagging_p1", pass1_progress, rate_limiter)
+                        self.log_status("  Tagging Pass 1 Complete.", "info")
+                        results_pass2 = pass2_future.result()
+                json_data_pass1 = input_data = None # Both passes returned copies; the untagged items can go now
+                self.log_status("  Tagging Pass 2 Complete.", "info")
+                self._queue_progress(progress_end)
 
                 # --- Merge Tags ---
-                self.after(0, self.log_status, "  Merging tags from Pass 1 and Pass 2...", "debug")
-                merged_data = []
+                self.log_status("  Merging tags from Pass 1 and Pass 2...", "debug")
                 if len(results_pass1) != len(results_pass2):
-                    self.after(0, self.log_status, f"Warning: Mismatch in item count between Pass 1 ({len(results_pass1)}) and Pass 2 ({len(results_pass2)}). Merging based on Pass 1 length.", "warning")
-                    # Handle mismatch - prioritize Pass 1 structure, merge where possible
-                    for i, item_p1 in enumerate(results_pass1):
-                        merged_item = item_p1.copy() # Start with Pass 1 item
-                        tags1 = item_p1.get('Tags', '')
-                        tags2 = ""
-                        if i < len(results_pass2):
-                            tags2 = results_pass2[i].get('Tags', '')
-
-                        # Merge logic (handle potential errors from tagging)
-                        set1 = set(tag for tag in tags1.split() if not tag.startswith("ERROR:"))
-                        set2 = set(tag for tag in tags2.split() if not tag.startswith("ERROR:"))
-                        merged_set = set1.union(set2)
-                        merged_tags = " ".join(sorted(list(merged_set)))
-
-                        # Add back any error tags if they existed
-                        error_tags1 = " ".join(tag for tag in tags1.split() if tag.startswith("ERROR:"))
-                        error_tags2 = " ".join(tag for tag in tags2.split() if tag.startswith("ERROR:"))
-                        all_errors = f"{error_tags1} {error_tags2}".strip()
-
-                        final_tags = f"{merged_tags} {all_errors}".strip()
-                        merged_item['Tags'] = final_tags if final_tags else "" # Ensure empty string if no tags/errors
-                        merged_data.append(merged_item)
-
-                else: # Counts match, proceed with normal merge
-                    for item_p1, item_p2 in zip(results_pass1, results_pass2):
-                        merged_item = item_p1.copy() # Start with Pass 1 item
-                        tags1 = item_p1.get('Tags', '')
-                        tags2 = item_p2.get('Tags', '')
-
-                        # Merge logic (handle potential errors from tagging)
-                        set1 = set(tag for tag in tags1.split() if not tag.startswith("ERROR:"))
-                        set2 = set(tag for tag in tags2.split() if not tag.startswith("ERROR:"))
-                        merged_set = set1.union(set2)
-                        merged_tags = " ".join(sorted(list(merged_set)))
-
-                        # Add back any error tags if they existed
-                        error_tags1 = " ".join(tag for tag in tags1.split() if tag.startswith("ERROR:"))
-                        error_tags2 = " ".join(tag for tag in tags2.split() if tag.startswith("ERROR:"))
-                        all_errors = f"{error_tags1} {error_tags2}".strip()
-
-                        final_tags = f"{merged_tags} {all_errors}".strip()
-                        merged_item['Tags'] = final_tags if final_tags else "" # Ensure empty string if no tags/errors
-                        merged_data.append(merged_item)
-
-                final_tagged_data = merged_data # Assign merged results
-                self.after(0, self.log_status, f"  Tag merging complete ({len(final_tagged_data)} items).", "debug")
+                    self.log_status(f"Warning: Mismatch in item count between Pass 1 ({len(results_pass1)}) and Pass 2 ({len(results_pass2)}). Merging based on Pass 1 length.", "warning")
+                # Pass 1 decides the items; rows Pass 2 didn't return contribute no tags
+                # Merged in place: Pass 1's items are this run's own copies, so no third list of dicts is built
+                for item_p1, item_p2 in zip_longest(results_pass1, results_pass2[:len(results_pass1)], fillvalue={}):
+                    item_p1['Tags'] = _merge_tag_strings(item_p1.get('Tags', ''), item_p2.get('Tags', ''))
+                results_pass2 = None
+
+                final_tagged_data = results_pass1 # Assign merged results
+                self.log_status(f"  Tag merging complete ({len(final_tagged_data)} items).", "debug")
 
             else: # Pass 2 not enabled
+                results_pass1 = self._run_tag_pass(
+                    json_data_pass1, 1, tag_model_name_pass1, tag_prompt_template_pass1, api_key, tag_cfg,
+                    tag_cache, output_dir, f"{base_name}_tagging_p1", functools.partial(self._update_ranged_progress, progress_start, progress_end), rate_limiter)
+                json_data_pass1 = input_data = None # Pass 1 returned copies; the untagged items can go now
+                self.log_status("  Tagging Pass 1 Complete.", "info")
+                self._queue_progress(progress_end)
                 final_tagged_data = results_pass1 # Use Pass 1 results directly
 
             # --- Save the final tagged data (after Pass 1 or merged Pass 1+2) ---
             if final_tagged_data is not None:
                 try:
-                    self.after(0, self.log_status, f"Saving final tagged intermediate JSON: {os.path.basename(final_tagged_json_output_path)}", "debug")
-                    with open(final_tagged_json_output_path, 'w', encoding='utf-8') as f_tagged:
-                        json.dump(final_tagged_data, f_tagged, indent=2)
-                    self.after(0, self.log_status, f"Saved final tagged data to {os.path.basename(final_tagged_json_output_path)}", "info")
+                    self.log_status(f"Saving final tagged intermediate JSON: {os.path.basename(final_tagged_json_output_path)}", "debug")
+                    _dump_json(final_tagged_json_output_path, final_tagged_data)
+                    self.log_status(f"Saved final tagged data to {os.path.basename(final_tagged_json_output_path)}", "info")
                 except Exception as save_err:
                     # Log warning but don't necessarily stop the whole workflow
-                    self.after(0, self.log_status, f"Warning: Error saving final tagged intermediate JSON: {save_err}", "warning")
+                    self.log_status(f"Warning: Error saving final tagged intermediate JSON: {save_err}", "warning")
             # --- END OF ADDED SECTION ---
 
             # Return the final tagged data for TSV generation
             return final_tagged_data
 
         except WorkflowStepError as wse: # Catch errors specific to this helper
-             self.after(0, self.log_status, f"Error during tagging process: {wse}", "error")
+             self.log_status(f"Error during tagging process: {wse}", "error")
              return None # Indicate failure
         except Exception as e: # Catch unexpected errors
-            self.after(0, self.log_status, f"Unexpected error during tagging process: {e}", "error")
+            self.log_status(f"Unexpected error during tagging process: {e}", "error")
             # traceback.print_exc() # Optional: print full traceback to console for debugging
             return None # Indicate failure
+        finally:
+            try: tag_cache.close()
+            except sqlite3.Error as cache_err: self.log_status(f"Could not save tag cache: {cache_err}", "warning")
 
 
     def _run_single_visual_workflow_thread(self, input_pdf_path, output_dir, safe_base_name, api_key,
-                                            extract_model_name, tag_model_name_pass1, extract_prompt, tag_prompt_template_pass1,
-                                            save_direct_flag, anki_media_dir_from_ui,
-                                            tag_batch_size, tag_api_delay,
-                                            enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2):
+                                            extract_model_name, extract_prompt,
+                                            save_direct_flag, anki_media_dir_from_ui, tag_cfg):
         """Core logic for SINGLE FILE VISUAL Q&A workflow."""
         final_tsv_path = None; success = False; uploaded_file_uri = None; final_image_folder = None; parsed_data = None; tagging_success = False
-        intermediate_json_path = os.path.join(output_dir, f"{safe_base_name}_intermediate_visual.json")
-        final_tsv_path = os.path.join(output_dir, f"{safe_base_name}_final_tagged_visual.txt")
+        intermediate_json_path = os.path.join(output_dir, _VIS_INTER_FMT.format(base=safe_base_name))
+        final_tsv_path = os.path.join(output_dir, _VIS_FINAL_FMT.format(base=safe_base_name))
 
         try:
             start_time = time.time()
-            # STEP 1a: Generate Images
-            self.after(0, self.log_status, f"Starting Step 1a (Visual): Generating Page Images...", "step"); self.after(0, self._update_progress_bar, 5)
+            # STEP 1a: Generate Images (CPU-bound; runs on its own thread while Step 1b waits on Gemini)
+            self.log_status(f"Starting Step 1a (Visual): Generating Page Images...", "step"); self._queue_progress(5)
             image_destination_path = anki_media_dir_from_ui if save_direct_flag else output_dir
-            final_image_folder, page_image_map = generate_page_images(input_pdf_path, image_destination_path, safe_base_name, save_direct_flag, self.log_status, parent_widget=self, filename_prefix=safe_base_name)
+            # Page ranges render in worker processes; fewer when writing straight into Anki's media folder, to avoid thrashing it
+            render_workers = min(os.cpu_count() or 1, 4) if save_direct_flag else (os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="p4_render") as render_pool:
+                image_future = render_pool.submit(generate_page_images, input_pdf_path, image_destination_path, safe_base_name, save_direct_flag, self.log_status,
+                                                  parent_widget=self, filename_prefix=safe_base_name, render_workers=render_workers)
+
+                # STEP 1b: Gemini Extraction -> JSON (the upload is the original PDF, so it doesn't need the images)
+                self.log_status(f"Starting Step 1b (Visual): Gemini JSON Extraction ({extract_model_name})...", "step")
+                try:
+                    parsed_data, uploaded_file_uri = self._visual_extraction_cached(input_pdf_path, api_key, extract_model_name, extract_prompt)
+                finally:
+                    wait_futures([image_future]) # Never leave rendering running behind a failed extraction
+            final_image_folder, page_image_map = image_future.result()
             if final_image_folder is None: raise WorkflowStepError("Failed during page image generation.")
-            self.after(0, self.log_status, f"Step 1a Complete. Images in: {final_image_folder}", "info"); self.after(0, self._update_progress_bar, 10)
-
-            # STEP 1b: Gemini Extraction -> JSON
-            self.after(0, self.log_status, f"Starting Step 1b (Visual): Gemini JSON Extraction ({extract_model_name})...", "step")
-            parsed_data, uploaded_file_uri = call_gemini_visual_extraction(input_pdf_path, api_key, extract_model_name, extract_prompt, self.log_status, parent_widget=self)
+            self.log_status(f"Step 1a Complete. Images in: {final_image_folder}", "info"); self._queue_progress(10)
             if parsed_data is None: raise WorkflowStepError("Gemini PDF visual extraction failed (check logs/temp files).")
-            if not parsed_data: self.after(0, self.log_status, "No Q&A pairs extracted from the document.", "warning")
+            if not parsed_data: self.log_status("No Q&A pairs extracted from the document.", "warning")
 
             # Add metadata needed for TSV generation later
-            for item in parsed_data:
-                if isinstance(item, dict):
-                    item['_page_image_map'] = page_image_map # Map page numbers to image filenames
-                    item['_source_pdf_prefix'] = safe_base_name # Store the base name for reference
+            attach_page_image_map(parsed_data, page_image_map, safe_base_name)
 
             # Save intermediate JSON (useful for debugging)
             try:
-                with open(intermediate_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(parsed_data, f, indent=2)
-                self.after(0, self.log_status, f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
+                _dump_json(intermediate_json_path, parsed_data)
+                self.log_status(f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
             except Exception as json_e:
                 raise WorkflowStepError(f"Failed to save intermediate JSON: {json_e}")
-            self.after(0, self.log_status, "Step 1b Complete.", "info"); self.after(0, self._update_progress_bar, 35)
+            self.log_status("Step 1b Complete.", "info"); self._queue_progress(35)
 
             # STEP 2: Tag Intermediate JSON
             if not parsed_data:
-                 self.after(0, self.log_status, f"Skipping Tagging Step: No data extracted.", "warning")
+                 self.log_status(f"Skipping Tagging Step: No data extracted.", "warning")
                  # Still generate an empty TSV file for consistency
                  tsv_gen_success = generate_tsv_from_json_data([], final_tsv_path, self.log_status)
                  if not tsv_gen_success: raise WorkflowStepError("Failed to generate empty final TSV.")
                  tagging_success = True # Consider it a success (no data to tag)
             else:
-                self.after(0, self.log_status, f"Starting Step 2 (Tagging): Tagging extracted JSON...", "step")
+                self._raise_if_stopped()
+                self.log_status(f"Starting Step 2 (Tagging): Tagging extracted JSON...", "step")
                 final_tagged_data = self._wf_gemini_tag_json(
-                    intermediate_json_path, tag_prompt_template_pass1, api_key, tag_model_name_pass1,
-                    tag_batch_size, tag_api_delay, enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2
+                    intermediate_json_path, api_key, tag_cfg,
+                    input_data=parsed_data # Already in memory; no need to re-read the file just written
                 )
                 if final_tagged_data is None:
                     raise WorkflowStepError("Gemini tagging step failed (check logs/temp files).")
                 tagging_success = True
 
                 # STEP 3: Generate Final TSV from tagged JSON data
-                self.after(0, self.log_status, f"Starting Step 3: Generating Final TSV from tagged data...", "step")
+                self.log_status(f"Starting Step 3: Generating Final TSV from tagged data...", "step")
                 tsv_gen_success = generate_tsv_from_json_data(final_tagged_data, final_tsv_path, self.log_status)
                 if not tsv_gen_success: raise WorkflowStepError("Failed to generate final TSV file from tagged data.")
-                self.after(0, self.log_status, f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info"); self.after(0, self._update_progress_bar, 95)
+                self.log_status(f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info"); self._queue_progress(95)
 
             # Workflow Complete
             end_time = time.time(); total_time = end_time - start_time
-            self.after(0, self.log_status, f"Visual Q&A Workflow finished successfully in {total_time:.2f} seconds!", "info")
-            self.after(0, self._update_progress_bar, 100)
+            self.log_status(f"Visual Q&A Workflow finished successfully in {total_time:.2f} seconds!", "info")
+            self._queue_progress(100)
             success_message = f"Processed '{os.path.basename(input_pdf_path)}'.\nFinal TSV:\n{final_tsv_path}\n\n"
             if save_direct_flag:
                 success_message += f"Images Saved Directly To:\n{final_image_folder}"
             else:
                 success_message += f"Images Saved To Subfolder:\n{final_image_folder}\n\nIMPORTANT: Manually copy images from\n'{os.path.basename(final_image_folder)}' to Anki's 'collection.media' folder before importing the TSV."
-            self.after(0, show_info_dialog, "Workflow Complete", success_message, self)
+            self._post_ui(show_info_dialog, "Workflow Complete", success_message, self)
             success = True
 
         except WorkflowStepError as wse:
-            self.after(0, self.log_status, f"Visual Workflow stopped: {wse}", "error")
-            self.after(0, show_error_dialog, "Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self)
+            self.log_status(f"Visual Workflow stopped: {wse}", "error")
+            if not self._wf_stop.is_set(): self._post_ui(show_error_dialog, "Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self) # No dialog for a requested stop
             success = False
         except Exception as e:
             error_message = f"Unexpected visual workflow error: {type(e).__name__}: {e}"
-            self.after(0, self.log_status, f"FATAL WORKFLOW ERROR (Visual): {error_message}\n{traceback.format_exc()}", "error")
-            self.after(0, show_error_dialog, "Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
+            self.log_status(f"FATAL WORKFLOW ERROR (Visual): {error_message}" + (f"\n{traceback.format_exc()}" if self._debug_enabled else " (enable Debug Logging for the traceback)"), "error")
+            self._post_ui(show_error_dialog, "Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
             success = False
         finally:
             # Cleanup Gemini uploaded file
@@ -982,38 +1433,28 @@ class WorkflowPage(ttk.Frame):
                 try:
                     cleanup_gemini_file(uploaded_file_uri, api_key, self.log_status)
                 except Exception as clean_e:
-                    self.after(0, self.log_status, f"Error during cleanup: {clean_e}", "warning")
+                    self.log_status(f"Error during cleanup: {clean_e}", "warning")
 
-            # Cleanup intermediate JSON file (only on success, keep on failure for debugging) ---Changing this, hopefully briefly
-            if success and os.path.exists(intermediate_json_path):
-                try:
-                   #  os.remove(intermediate_json_path)
-                    # self.after(0, self.log_status, f"Cleaned up intermediate JSON: {os.path.basename(intermediate_json_path)}", "debug")
-                    pass
-                except Exception as rem_e:
-                    self.after(0, self.log_status, f"Could not remove intermediate JSON {os.path.basename(intermediate_json_path)}: {rem_e}", "warning")
-            elif not success and os.path.exists(intermediate_json_path):
-                 self.after(0, self.log_status, f"Keeping intermediate JSON on failure: {os.path.basename(intermediate_json_path)}", "warning")
+            # Cleanup intermediate JSON (kept on failure for debugging)
+            self._finalize_intermediate_json(intermediate_json_path, success)
 
 
             # Update UI state via main thread
-            self.after(0, self._workflow_finished, success, final_tsv_path if success else None)
+            self._workflow_finished(success, final_tsv_path if success else None)
 
 
     def _run_single_text_analysis_workflow_thread(self, input_file_path, output_dir, safe_base_name, api_key,
-                                                  analysis_model_name, tag_model_name_pass1, analysis_prompt, tag_prompt_template_pass1,
-                                                  text_chunk_size, text_api_delay,
-                                                  tag_batch_size, tag_api_delay,
-                                                  enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2):
+                                                  analysis_model_name, analysis_prompt,
+                                                  text_chunk_size, text_api_delay, tag_cfg):
         """Core logic for SINGLE FILE TEXT ANALYSIS workflow."""
-        final_tsv_path = None; success = False; parsed_data = None; tagging_success = False
-        intermediate_json_path = os.path.join(output_dir, f"{safe_base_name}_intermediate_analysis.json")
-        final_tsv_path = os.path.join(output_dir, f"{safe_base_name}_final_tagged_analysis.txt")
+        final_tsv_path = None; success = False; parsed_data = None; tagging_success = False; finished_sent = False
+        intermediate_json_path = os.path.join(output_dir, _TEXT_INTER_FMT.format(base=safe_base_name))
+        final_tsv_path = os.path.join(output_dir, _TEXT_FINAL_FMT.format(base=safe_base_name))
 
         try:
             start_time = time.time()
             # STEP 1a: Extract Text
-            self.after(0, self.log_status, f"Starting Step 1a (Text): Extracting Text...", "step"); self.after(0, self._update_progress_bar, 5)
+            self.log_status(f"Starting Step 1a (Text): Extracting Text...", "step"); self._queue_progress(5)
             extracted_text = ""; file_type = ""
             if input_file_path.lower().endswith(".pdf"):
                 extracted_text = extract_text_from_pdf(input_file_path, self.log_status)
@@ -1026,302 +1467,408 @@ class WorkflowPage(ttk.Frame):
 
             if extracted_text is None: raise WorkflowStepError(f"Text extraction failed for {file_type}.")
             if not extracted_text.strip():
-                self.after(0, self.log_status, f"No text content extracted from the {file_type} file. Workflow finished.", "warning")
+                self.log_status(f"No text content extracted from the {file_type} file. Workflow finished.", "warning")
                 # Generate empty TSV
                 tsv_gen_success = generate_tsv_from_json_data([], final_tsv_path, self.log_status)
                 if not tsv_gen_success: raise WorkflowStepError("Failed to generate empty final TSV.")
-                self.after(0, self._workflow_finished, True, final_tsv_path) # Finish successfully
-                return # Exit thread
+                self._workflow_finished(True, final_tsv_path); finished_sent = True # Finish successfully
+                return # Exit thread (finally must not schedule a second finish)
 
-            self.after(0, self.log_status, f"Step 1a Complete. Extracted ~{len(extracted_text)} characters.", "info"); self.after(0, self._update_progress_bar, 10)
+            self.log_status(f"Step 1a Complete. Extracted ~{len(extracted_text)} characters.", "info"); self._queue_progress(10)
 
             # STEP 1b: Gemini Analysis -> JSON
-            self.after(0, self.log_status, f"Starting Step 1b (Text): Gemini Analysis ({analysis_model_name}) in chunks...", "step")
+            self.log_status(f"Starting Step 1b (Text): Gemini Analysis ({analysis_model_name}) in chunks...", "step")
             parsed_data = call_gemini_text_analysis(extracted_text, api_key, analysis_model_name, analysis_prompt, self.log_status, output_dir, safe_base_name, text_chunk_size, text_api_delay, parent_widget=self)
             if parsed_data is None: raise WorkflowStepError("Gemini text analysis failed (check logs/temp files).")
-            if not parsed_data: self.after(0, self.log_status, "No Q&A pairs extracted from text.", "warning")
+            if not parsed_data: self.log_status("No Q&A pairs extracted from text.", "warning")
 
             # Save intermediate JSON
             try:
-                with open(intermediate_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(parsed_data, f, indent=2)
-                self.after(0, self.log_status, f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
+                _dump_json(intermediate_json_path, parsed_data)
+                self.log_status(f"Saved intermediate JSON: {os.path.basename(intermediate_json_path)}", "info")
             except Exception as json_e:
                 raise WorkflowStepError(f"Failed to save intermediate JSON: {json_e}")
-            self.after(0, self.log_status, "Step 1b Complete (Gemini chunk processing).", "info"); self.after(0, self._update_progress_bar, 35)
+            self.log_status("Step 1b Complete (Gemini chunk processing).", "info"); self._queue_progress(35)
 
             # STEP 2: Tag Intermediate JSON
             if not parsed_data:
-                 self.after(0, self.log_status, f"Skipping Tagging Step: No data extracted.", "warning")
+                 self.log_status(f"Skipping Tagging Step: No data extracted.", "warning")
                  # Generate empty TSV
                  tsv_gen_success = generate_tsv_from_json_data([], final_tsv_path, self.log_status)
                  if not tsv_gen_success: raise WorkflowStepError("Failed to generate empty final TSV.")
                  tagging_success = True # Consider success
             else:
-                self.after(0, self.log_status, f"Starting Step 2 (Tagging): Tagging extracted JSON...", "step")
+                self._raise_if_stopped()
+                self.log_status(f"Starting Step 2 (Tagging): Tagging extracted JSON...", "step")
                 final_tagged_data = self._wf_gemini_tag_json(
-                    intermediate_json_path, tag_prompt_template_pass1, api_key, tag_model_name_pass1,
-                    tag_batch_size, tag_api_delay, enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2
+                    intermediate_json_path, api_key, tag_cfg,
+                    input_data=parsed_data # Already in memory; no need to re-read the file just written
                 )
                 if final_tagged_data is None:
                     raise WorkflowStepError("Gemini tagging step failed (check logs/temp files).")
                 tagging_success = True
 
                 # STEP 3: Generate Final TSV from tagged JSON data
-                self.after(0, self.log_status, f"Starting Step 3: Generating Final TSV from tagged data...", "step")
+                self.log_status(f"Starting Step 3: Generating Final TSV from tagged data...", "step")
                 tsv_gen_success = generate_tsv_from_json_data(final_tagged_data, final_tsv_path, self.log_status)
                 if not tsv_gen_success: raise WorkflowStepError("Failed to generate final TSV file from tagged data.")
-                self.after(0, self.log_status, f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info"); self.after(0, self._update_progress_bar, 95)
+                self.log_status(f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info"); self._queue_progress(95)
 
             # Workflow Complete
             end_time = time.time(); total_time = end_time - start_time
-            self.after(0, self.log_status, f"Text Analysis Workflow finished successfully in {total_time:.2f} seconds!", "info")
-            self.after(0, self._update_progress_bar, 100)
+            self.log_status(f"Text Analysis Workflow finished successfully in {total_time:.2f} seconds!", "info")
+            self._queue_progress(100)
             success_message = f"Processed '{os.path.basename(input_file_path)}'.\nFinal TSV:\n{final_tsv_path}\n"
-            self.after(0, show_info_dialog, "Workflow Complete", success_message, self)
+            self._post_ui(show_info_dialog, "Workflow Complete", success_message, self)
             success = True
 
         except WorkflowStepError as wse:
-            self.after(0, self.log_status, f"Text Analysis Workflow stopped: {wse}", "error")
-            self.after(0, show_error_dialog, "Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self)
+            self.log_status(f"Text Analysis Workflow stopped: {wse}", "error")
+            if not self._wf_stop.is_set(): self._post_ui(show_error_dialog, "Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self) # No dialog for a requested stop
             success = False
         except Exception as e:
             error_message = f"Unexpected text analysis workflow error: {type(e).__name__}: {e}"
-            self.after(0, self.log_status, f"FATAL WORKFLOW ERROR (Text): {error_message}\n{traceback.format_exc()}", "error")
-            self.after(0, show_error_dialog, "Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
+            self.log_status(f"FATAL WORKFLOW ERROR (Text): {error_message}" + (f"\n{traceback.format_exc()}" if self._debug_enabled else " (enable Debug Logging for the traceback)"), "error")
+            self._post_ui(show_error_dialog, "Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
             success = False
         finally:
-            # Cleanup intermediate JSON file (only on success)
-            if success and os.path.exists(intermediate_json_path):
-                try:
-                    # os.remove(intermediate_json_path)
-                    #self.after(0, self.log_status, f"Cleaned up intermediate JSON: {os.path.basename(intermediate_json_path)}", "debug")
-                    pass
-                except Exception as rem_e:
-                    self.after(0, self.log_status, f"Could not remove intermediate JSON {os.path.basename(intermediate_json_path)}: {rem_e}", "warning")
-            elif not success and os.path.exists(intermediate_json_path):
-                 self.after(0, self.log_status, f"Keeping intermediate JSON on failure: {os.path.basename(intermediate_json_path)}", "warning")
+            # Cleanup intermediate JSON (kept on failure for debugging)
+            self._finalize_intermediate_json(intermediate_json_path, success)
 
 
             # Update UI state via main thread
-            self.after(0, self._workflow_finished, success, final_tsv_path if success else None)
+            if not finished_sent:
+                self._workflow_finished(success, final_tsv_path if success else None)
+
 
+    def _bulk_extract_single_pdf(self, pdf_path, file_basename, sanitized_pdf_name, api_key, extract_model_name, extract_prompt,
+                                 bulk_image_subfolder_name, uploaded_file_uris, image_future, content_hash=None):
+        """Runs Step 1a/1b for one PDF of a bulk run and returns its extracted items (metadata attached).
+        Page rendering (1a, CPU) was queued on the image process pool up front (image_future) and runs there while
+        the Gemini call (1b, network) runs here.
+        The uploaded file URI is recorded in uploaded_file_uris so the caller can clean it up. Raises on failure."""
+
+        # STEP 1a: Generate Images (queued by the caller into the timestamped subfolder)
+        self.log_status(f"  Step 1a: Generating images for {file_basename} into {bulk_image_subfolder_name}...", "debug")
+
+        # STEP 1b: Gemini Extraction -> JSON (overlaps with the rendering above)
+        self.log_status(f"  Step 1b: Extracting JSON for {file_basename}...", "debug")
+        try:
+            parsed_data, uploaded_file_uri = self._visual_extraction_cached(pdf_path, api_key, extract_model_name, extract_prompt, content_hash)
+        finally:
+            # Always wait for rendering, so a failed PDF is never renamed while PyMuPDF still has it open
+            wait_futures([image_future])
+        if uploaded_file_uri: uploaded_file_uris[pdf_path] = uploaded_file_uri # Store URI for cleanup
+        final_image_folder, page_image_map, image_log = image_future.result()
+        for message, level in image_log: self.log_status(message, level) # Replay the worker process's log lines
+        if final_image_folder is None: raise WorkflowStepError("Image generation failed.")
+        if parsed_data is None: raise WorkflowStepError("Gemini PDF visual extraction failed.")
+        if not parsed_data: self.log_status(f"Warning: No Q&A pairs extracted from {file_basename}.", "warning")
+
+        # STEP 1c: Add metadata to extracted items
+        attach_page_image_map(parsed_data, page_image_map, sanitized_pdf_name)
+        return parsed_data
+
+    def _visual_extraction_cached(self, pdf_path, api_key, extract_model_name, extract_prompt, content_hash=None):
+        """call_gemini_visual_extraction, served from the extraction cache when this PDF's content was already extracted
+        with the same model and prompt (no upload then, so the returned URI is None). Successful results are cached.
+        content_hash is the PDF's pdf_content_hash if the caller already has it; otherwise it is computed here."""
+        cache_path = None
+        if self._use_extract_cache:
+            try:
+                cache_path = _extract_cache_path(content_hash or pdf_content_hash(pdf_path), extract_model_name, extract_prompt)
+            except OSError as e:
+                self.log_status(f"Extraction cache skipped for {os.path.basename(pdf_path)}: {e}", "debug")
+            cached = _read_cache_file(cache_path) if cache_path else None
+            if isinstance(cached, list):
+                touch_cache_entry(cache_path) # Recently used: kept when the cache is pruned
+                self.log_status(f"Using cached extraction for {os.path.basename(pdf_path)} ({len(cached)} items).", "info")
+                return cached, None
+        parsed_data, uploaded_file_uri = call_gemini_visual_extraction(pdf_path, api_key, extract_model_name, extract_prompt, self.log_status, parent_widget=self)
+        if cache_path and parsed_data: # Failures (None) and empty results are retried next time
+            try: _write_cache_file(cache_path, parsed_data)
+            except (OSError, TypeError) as e: self.log_status(f"Could not cache extraction for {os.path.basename(pdf_path)}: {e}", "warning")
+        return parsed_data, uploaded_file_uri
+
+    def _rename_failed_pdf(self, pdf_path, pdf_dir, file_basename):
+        """Renames a PDF that failed in bulk mode to 'UP_<name>' (adding _1, _2... on collisions)."""
+        try:
+            name, ext = os.path.splitext(f"UP_{file_basename}") # Prepend UP_
+            new_name = os.path.join(pdf_dir, f"{name}{ext}")
+            counter = 1
+            # Handle potential name collisions for renamed files
+            while os.path.exists(new_name):
+                new_name = os.path.join(pdf_dir, f"{name}_{counter}{ext}")
+                counter += 1
+            os.replace(pdf_path, new_name) # Same semantics on Windows and POSIX (os.rename raises on Windows if the target appeared meanwhile)
+            self.log_status(f"Renamed failed file to: {os.path.basename(new_name)}", "warning")
+        except OSError as rename_e:
+            self.log_status(f"Could not rename failed file {file_basename}: {rename_e}", "error")
+
+    def _find_duplicate_pdfs(self, pdf_paths):
+        """Hashes every PDF once. Returns ({pdf_path: earlier pdf_path} for every PDF whose content is byte-identical to
+        an earlier one in the list, {pdf_path: content hash}); the hashes are reused for the page image and extraction caches."""
+        first_by_hash = {}; duplicate_of = {}; content_hashes = {}
+        for pdf_path in pdf_paths:
+            try: content_hash = content_hashes[pdf_path] = pdf_content_hash(pdf_path)
+            except OSError: continue # Unreadable right now; processing the file reports it
+            first_path = first_by_hash.setdefault(content_hash, pdf_path)
+            if first_path != pdf_path: duplicate_of[pdf_path] = first_path
+        return duplicate_of, content_hashes
+
+    def _bulk_process_single_pdf(self, pdf_path, next_pdf_path, api_key, extract_model_name, extract_prompt,
+                                 bulk_image_subfolder_name, render_futures, duplicate_of, uploaded_file_uris, content_hashes):
+        """Bulk file-pool task. Returns (pdf_path, items), items being None if the file failed and _FILE_NOT_RUN if
+        Stop was pressed before it started. A successful file's upload is recorded in uploaded_file_uris right here
+        (the caller deletes them all at the end, even if it stops reading results early); a failed file is renamed
+        with an 'UP_' prefix and its upload is removed right away.
+        next_pdf_path is the file that will start after this one; it is prefetched into the page cache.
+        Files in duplicate_of are not processed (empty items); the caller reuses the earlier file's items.
+        content_hashes holds the hashes _find_duplicate_pdfs computed, so the file is not read again for the caches."""
+        if pdf_path in duplicate_of: return pdf_path, []
+        if self._wf_stop.is_set(): # Not started, not renamed; its queued rendering is dropped too
+            render_futures[pdf_path].cancel()
+            return pdf_path, _FILE_NOT_RUN
+        pdf_dir, file_basename = os.path.split(pdf_path) # Split once; every later step reuses these
+        sanitized_pdf_name = sanitize_filename(os.path.splitext(file_basename)[0])
+        file_uris = {}
+        prefetch_file(next_pdf_path) # Hide cold-disk latency of the next file behind this one
+        self.log_status(f"Processing file: {file_basename}", "info")
+        try:
+            items_for_file = self._bulk_extract_single_pdf(
+                pdf_path, file_basename, sanitized_pdf_name, api_key, extract_model_name, extract_prompt,
+                bulk_image_subfolder_name, file_uris, render_futures[pdf_path], content_hashes.get(pdf_path)
+            )
+            uploaded_file_uris.update(file_uris) # Store URI for final cleanup
+            return pdf_path, items_for_file
+        except Exception as file_e: # WorkflowStepError included; only the log detail differs
+            if isinstance(file_e, CancelledError): # The run stopped before this file's rendering started: not the file's fault
+                self.log_status(f"Skipped {file_basename}: the run was stopped.", "skip")
+                not_run = True
+            else:
+                not_run = False
+                detail = str(file_e) if isinstance(file_e, WorkflowStepError) else f"{type(file_e).__name__}: {file_e}"
+                self.log_status(f"Failed processing {file_basename}: {detail}. Attempting to rename...", "error")
+                if self._debug_enabled: # Formatting the stack is only worth it when someone will read it
+                    self.log_status(f"Traceback for {file_basename}:\n{traceback.format_exc()}", "debug")
+                self._rename_failed_pdf(pdf_path, pdf_dir, file_basename)
+            # Clean up Gemini file immediately since this specific file failed
+            uploaded_file_uri = file_uris.get(pdf_path)
+            if uploaded_file_uri:
+                try:
+                    cleanup_gemini_file(uploaded_file_uri, api_key, self.log_status)
+                except Exception as clean_e:
+                    self.log_status(f"Error during immediate cleanup for {file_basename}: {clean_e}", "warning")
+            return pdf_path, _FILE_NOT_RUN if not_run else None
 
     def _run_bulk_visual_workflow_thread(self, input_pdf_paths, output_dir, api_key,
-                                          extract_model_name, tag_model_name_pass1, extract_prompt, tag_prompt_template_pass1,
-                                          anki_media_dir,
-                                          tag_batch_size, tag_api_delay,
-                                          enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2):
-        """Core logic for BULK VISUAL Q&A workflow."""
-        final_tsv_path = None; success = False; uploaded_file_uris = {}; tagging_success = False
-        aggregated_json_data = []; total_files = len(input_pdf_paths); processed_files = 0; success_files = 0; failed_files = 0; skipped_files = 0
-        start_time = time.time(); timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S')
-        intermediate_json_path = os.path.join(output_dir, f"bulk_visual_{timestamp_str}_intermediate.json")
-        final_tsv_path = os.path.join(output_dir, f"bulk_visual_{timestamp_str}_final_tagged.txt")
+                                          extract_model_name, extract_prompt,
+                                          anki_media_dir, tag_cfg, resume_stamp=None, max_concurrent_files=BULK_MAX_CONCURRENT_FILES):
+        """Core logic for BULK VISUAL Q&A workflow. With resume_stamp, continues that unfinished run instead of starting a new one.
+        Up to max_concurrent_files PDFs are extracted at the same time."""
+        final_tsv_path = None; success = False; uploaded_file_uris = {}; tagging_success = False; finished_sent = False
+        total_items = 0; total_files = len(input_pdf_paths); processed_files = 0; success_files = 0; failed_files = 0; skipped_files = 0
+        start_time = time.time(); timestamp_str = resume_stamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        intermediate_json_path = os.path.join(output_dir, _BULK_INTER_FMT.format(stamp=timestamp_str))
+        partial_json_path = intermediate_json_path + _PARTIAL_SUFFIX; resume_sidecar_path = intermediate_json_path + _RESUME_SIDECAR_SUFFIX
+        final_tsv_path = os.path.join(output_dir, _BULK_FINAL_FMT.format(stamp=timestamp_str))
 
         try:
             # --- Create Timestamped Subfolder in INPUT directory ---
-            bulk_image_subfolder_name = f"Bulk_Visual_{timestamp_str}"
+            bulk_image_subfolder_name = _BULK_IMAGE_SUBFOLDER_FMT.format(stamp=timestamp_str)
             # Use output_dir (derived from input file path) as the base, NOT anki_media_dir
             target_image_subfolder_path = os.path.join(output_dir, bulk_image_subfolder_name)
             # --- Added Logging ---
-            self.after(0, self.log_status, f"DEBUG: Attempting to create image subfolder in input dir at: {target_image_subfolder_path}", "debug")
+            self.log_status(f"DEBUG: Attempting to create image subfolder in input dir at: {target_image_subfolder_path}", "debug")
             # --- End Added Logging ---
             try:
                 os.makedirs(target_image_subfolder_path, exist_ok=True)
-                self.after(0, self.log_status, f"Created/verified image subfolder: {target_image_subfolder_path}", "info")
+                self.log_status(f"Created/verified image subfolder: {target_image_subfolder_path}", "info")
             except OSError as e:
                 # Raise error immediately if subfolder creation fails
-                self.after(0, self.log_status, f"FATAL: Failed to create image subfolder '{target_image_subfolder_path}': {e}", "error")
-                self.after(0, show_error_dialog, "Bulk Workflow Error", f"Could not create image subfolder:\n{target_image_subfolder_path}\n\nError: {e}", self)
-                self.after(0, self._workflow_finished, False, None, f"Failed to create image subfolder: {e}")
-                return # Stop the thread
-
-            # STEP 1: Process Each PDF -> JSON
-            self.after(0, self.log_status, f"Starting Step 1: Processing {total_files} PDF files...", "step")
-            for pdf_path in input_pdf_paths:
-                current_file_success = False; uploaded_file_uri = None; parsed_data = None
-                processed_files += 1
-                file_basename = os.path.basename(pdf_path)
-                sanitized_pdf_name = sanitize_filename(os.path.splitext(file_basename)[0])
-                self.after(0, self.log_status, f"Processing file {processed_files}/{total_files}: {file_basename}", "info")
-                # Update progress based on file count (up to 50% for this step)
-                self.after(0, self._update_progress_bar, (processed_files / total_files) * 50 if total_files > 0 else 0)
-
-                # Skip if not a PDF (already filtered, but double-check)
-                if not pdf_path.lower().endswith(".pdf"):
-                    self.after(0, self.log_status, f"Skipping non-PDF file: {file_basename}", "skip")
-                    skipped_files += 1
-                    continue
-
+                self.log_status(f"FATAL: Failed to create image subfolder '{target_image_subfolder_path}': {e}", "error")
+                self._post_ui(show_error_dialog, "Bulk Workflow Error", f"Could not create image subfolder:\n{target_image_subfolder_path}\n\nError: {e}", self)
+                self._workflow_finished(False, None, f"Failed to create image subfolder: {e}"); finished_sent = True
+                return # Stop the thread (finally must not schedule a second finish)
+
+            # STEP 1: Process Each PDF -> JSON (several files in flight; Step 1b is network-bound)
+            # Non-PDFs were already filtered out (and reported) when the list was selected
+            run_signature = _bulk_run_signature(input_pdf_paths, extract_model_name, extract_prompt)
+            resume_state = self._load_bulk_resume_state(resume_sidecar_path) if resume_stamp else None
+            if resume_state is not None and resume_state.get("run") != run_signature: # Offered only on a match; changed since
+                raise WorkflowStepError(f"Resume checkpoint {os.path.basename(resume_sidecar_path)} is for different PDFs, model or prompt.")
+            done_pdf_paths = resume_state["done"] if resume_state else [] # Finished files, in checkpoint order
+            done_set = set(done_pdf_paths)
+            pdf_paths_to_process = [p for p in input_pdf_paths if p not in done_set]
+            if resume_state:
+                processed_files = success_files = total_files - len(pdf_paths_to_process); total_items = resume_state["count"]
+                self.log_status(f"Resuming bulk run {timestamp_str}: {processed_files} file(s) already done ({total_items} items), {len(pdf_paths_to_process)} left.", "info")
+            # Byte-identical copies (same PDF under another name) are extracted and rendered once; later copies reuse the items
+            duplicate_of, content_hashes = self._find_duplicate_pdfs(pdf_paths_to_process)
+            if duplicate_of: self.log_status(f"{len(duplicate_of)} PDF(s) are identical to an earlier file in this run and will reuse its results.", "info")
+            duplicated_originals = set(duplicate_of.values())
+            items_by_original = {} # Finished files in duplicated_originals -> their items (None if they failed)
+            bulk_workers = max(1, min(max_concurrent_files, len(pdf_paths_to_process)))
+            self.log_status(f"Starting Step 1: Processing {total_files} PDF files ({bulk_workers} at a time)...", "step")
+            # Rendering (CPU) runs in worker processes: true parallelism across cores, overlapping the network-bound extraction calls.
+            # Workers are spawned, not forked: a fork would copy this process's gRPC channels and threads (locks held mid-call)
+            image_workers = max(1, min(BULK_IMAGE_WORKERS, len(pdf_paths_to_process)))
+            try:
+                image_pool = ProcessPoolExecutor(max_workers=image_workers, mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError, ImportError) as e: # e.g. no working multiprocessing on this platform
+                self.log_status(f"Process pool unavailable ({e}); rendering pages in threads instead.", "warning")
+                image_pool = ThreadPoolExecutor(max_workers=image_workers, thread_name_prefix="p4_bulk_img")
+            # Every render is queued up front (in processing order), so all image workers stay busy while the file
+            # pool waits on Gemini: file i + 1's pages are already rendering while file i is still being extracted
+            self.log_status(f"DEBUG: Queueing page rendering for {len(pdf_paths_to_process)} PDFs into: {target_image_subfolder_path}", "debug")
+            render_futures = {}
+            for pdf_path in pdf_paths_to_process:
+                if pdf_path in duplicate_of: continue
+                sanitized_pdf_name = sanitize_filename(os.path.splitext(os.path.basename(pdf_path))[0])
+                render_futures[pdf_path] = image_pool.submit(
+                    render_page_images_job,
+                    pdf_path, target_image_subfolder_path, sanitized_pdf_name, False, # Save to specified subfolder, not directly to Anki media root
+                    filename_prefix=sanitized_pdf_name, content_hash=content_hashes.get(pdf_path)
+                )
+            process_one = functools.partial(self._bulk_process_single_pdf, api_key=api_key, extract_model_name=extract_model_name, extract_prompt=extract_prompt,
+                                            bulk_image_subfolder_name=bulk_image_subfolder_name, render_futures=render_futures,
+                                            duplicate_of=duplicate_of, uploaded_file_uris=uploaded_file_uris, content_hashes=content_hashes)
+            # Items are streamed into <intermediate>.partial as each file finishes instead of being aggregated in RAM;
+            # after every file it is synced and checkpointed, so a crash can be resumed from the last finished file
+            try:
+                if resume_state:
+                    intermediate_writer = JsonArrayWriter(partial_json_path, resume_at=resume_state["offset"], resume_count=resume_state["count"])
+                else:
+                    intermediate_writer = JsonArrayWriter(partial_json_path)
+            except OSError as e:
+                raise WorkflowStepError(f"Failed to open aggregated intermediate JSON file: {e}")
+            with intermediate_writer, image_pool, ThreadPoolExecutor(max_workers=bulk_workers, thread_name_prefix="p4_bulk_pdf") as file_pool:
+                # map() keeps input order, so the output is identical to a sequential run
+                # With bulk_workers files in flight, file i + bulk_workers is the next to start after file i
+                next_pdf_paths = pdf_paths_to_process[bulk_workers:] + [None] * bulk_workers
+                # After a Stop, files not started yet come back as _FILE_NOT_RUN right away and files already in flight
+                # finish normally, so every result is still read (and every finished file checkpointed)
+                # Per-file calls bound once, outside the loop
+                log, queue_progress, save_resume = self.log_status, self._queue_progress, self._save_bulk_resume_state
                 try:
-                    # STEP 1a: Generate Images (Directly to Anki Media Subfolder)
-                    self.after(0, self.log_status, f"  Step 1a: Generating images for {file_basename} into {bulk_image_subfolder_name}...", "debug")
-                    # --- Added Logging ---
-                    self.after(0, self.log_status, f"DEBUG: Calling generate_page_images with destination: {target_image_subfolder_path}", "debug")
-                    # --- End Added Logging ---
-                    # Pass the timestamped subfolder path (in input dir) and set save_direct_flag to False
-                    final_image_folder, page_image_map = generate_page_images(
-                        pdf_path, target_image_subfolder_path, sanitized_pdf_name, save_direct_flag=False, # Save to specified subfolder, not directly to Anki media root
-                        log_func=self.log_status, parent_widget=self, filename_prefix=sanitized_pdf_name
-                    )
-                    if final_image_folder is None: raise WorkflowStepError("Image generation failed.")
-
-                    # STEP 1b: Gemini Extraction -> JSON
-                    self.after(0, self.log_status, f"  Step 1b: Extracting JSON for {file_basename}...", "debug")
-                    parsed_data, uploaded_file_uri = call_gemini_visual_extraction(
-                        pdf_path, api_key, extract_model_name, extract_prompt,
-                        self.log_status, parent_widget=self
-                    )
-                    if uploaded_file_uri: uploaded_file_uris[pdf_path] = uploaded_file_uri # Store URI for cleanup
-                    if parsed_data is None: raise WorkflowStepError("Gemini PDF visual extraction failed.")
-                    if not parsed_data: self.after(0, self.log_status, f"Warning: No Q&A pairs extracted from {file_basename}.", "warning")
-
-                    # STEP 1c: Add metadata to extracted items
-                    for item in parsed_data:
-                        if isinstance(item, dict):
-                            item['_page_image_map'] = page_image_map
-                            item['_source_pdf_prefix'] = sanitized_pdf_name
-
-                    # Add successfully parsed data to the aggregate list
-                    if parsed_data:
-                        aggregated_json_data.extend(parsed_data)
-                        self.after(0, self.log_status, f"  Success: Added {len(parsed_data)} items from {file_basename}.", "debug")
-                    success_files += 1
-                    current_file_success = True
-
-                except (WorkflowStepError, Exception) as file_e:
-                    failed_files += 1
-                    current_file_success = False
-                    self.after(0, self.log_status, f"Failed processing {file_basename}: {file_e}. Attempting to rename...", "error")
-                    # Attempt to rename the failed PDF file
-                    try:
-                        pdf_dir = os.path.dirname(pdf_path)
-                        new_basename = f"UP_{file_basename}" # Prepend UP_
-                        new_name = os.path.join(pdf_dir, new_basename)
-                        counter = 1
-                        # Handle potential name collisions for renamed files
-                        while os.path.exists(new_name):
-                            name, ext = os.path.splitext(new_basename)
-                            new_name = os.path.join(pdf_dir, f"{name}_{counter}{ext}")
-                            counter += 1
-                        os.rename(pdf_path, new_name)
-                        self.after(0, self.log_status, f"Renamed failed file to: {os.path.basename(new_name)}", "warning")
-                    except Exception as rename_e:
-                        self.after(0, self.log_status, f"Could not rename failed file {file_basename}: {rename_e}", "error")
-                finally:
-                    # Clean up Gemini file immediately if this specific file failed
-                    if not current_file_success and uploaded_file_uri:
+                    for pdf_path, items_for_file in file_pool.map(process_one, pdf_paths_to_process, next_pdf_paths):
+                        original_path = duplicate_of.get(pdf_path)
+                        if items_for_file is _FILE_NOT_RUN or (original_path is not None and original_path not in items_by_original):
+                            continue # Stop kept this file (or the file it duplicates) from starting: not counted
+                        processed_files += 1
+                        # Update progress based on file count (up to 50% for this step)
+                        queue_progress((processed_files / total_files) * 50 if total_files > 0 else 0)
+                        if original_path is not None: # map() keeps input order, so the original has already been handled
+                            original_items = items_by_original[original_path]
+                            if original_items is None:
+                                log(f"Skipped {os.path.basename(pdf_path)}: identical to {os.path.basename(original_path)}, which failed.", "skip")
+                                skipped_files += 1 # Not renamed: only the original is
+                                continue
+                            log(f"{os.path.basename(pdf_path)} is identical to {os.path.basename(original_path)}; reusing its {len(original_items)} items.", "info")
+                            source_prefix = sanitize_filename(os.path.splitext(os.path.basename(pdf_path))[0])
+                            # Shallow copies under this file's prefix, keeping the original's page image map (same pages)
+                            items_for_file = [{**item, '_source_pdf_prefix': source_prefix} if isinstance(item, dict) else item for item in original_items]
+                        elif pdf_path in duplicated_originals:
+                            items_by_original[pdf_path] = items_for_file
+                        if items_for_file is None:
+                            failed_files += 1
+                            continue
+                        success_files += 1
+                        # Append the whole per-file batch to the intermediate file in one go, then checkpoint
                         try:
-                            cleanup_gemini_file(uploaded_file_uri, api_key, self.log_status)
-                            if pdf_path in uploaded_file_uris:
-                                del uploaded_file_uris[pdf_path] # Remove from final cleanup list
-                        except Exception as clean_e:
-                            self.after(0, self.log_status, f"Error during immediate cleanup for {file_basename}: {clean_e}", "warning")
+                            if items_for_file: intermediate_writer.write_items(items_for_file)
+                            resume_offset = intermediate_writer.checkpoint()
+                        except (OSError, TypeError, ValueError) as e:
+                            raise WorkflowStepError(f"Failed to write aggregated intermediate JSON file: {e}")
+                        done_pdf_paths.append(pdf_path)
+                        save_resume(resume_sidecar_path, resume_offset, intermediate_writer.count, done_pdf_paths, run_signature)
+                        if items_for_file:
+                            total_items += len(items_for_file)
+                            log(f"  Success: Added {len(items_for_file)} items from {os.path.basename(pdf_path)}.", "debug")
+                finally:
+                    for render_future in render_futures.values(): render_future.cancel() # Stopped early: drop renders not started yet
 
-            self.after(0, self.log_status, f"Finished processing all {total_files} files. Extracted {len(aggregated_json_data)} total items.", "info")
-            self.after(0, self._update_progress_bar, 50) # Mark end of file processing phase
+            self._raise_if_stopped() # Stopped during Step 1: the checkpoint is kept, so running the same files again resumes
+            # Every file is done: publish the intermediate under its final name and drop the checkpoint
+            try:
+                os.replace(partial_json_path, intermediate_json_path)
+            except OSError as e:
+                raise WorkflowStepError(f"Failed to finalize aggregated intermediate JSON file: {e}")
+            try: os.remove(resume_sidecar_path)
+            except OSError: pass
+
+            self.log_status(f"Finished processing all {total_files} files. Extracted {total_items} total items.", "info")
+            self._queue_progress(50) # Mark end of file processing phase
 
             # STEP 2: Aggregate and Tag
-            if not aggregated_json_data:
+            if total_items == 0:
                 raise WorkflowStepError("No data successfully extracted from any PDF. Cannot proceed.")
+            self.log_status(f"Aggregated JSON saved: {os.path.basename(intermediate_json_path)} ({total_items} items)", "info")
+            self._queue_progress(55) # Progress after saving JSON
 
-            self.after(0, self.log_status, f"Writing aggregated intermediate JSON ({len(aggregated_json_data)} items)...", "step")
-            try:
-                with open(intermediate_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(aggregated_json_data, f, indent=2)
-                self.after(0, self.log_status, f"Aggregated JSON saved: {os.path.basename(intermediate_json_path)}", "info")
-            except IOError as e:
-                raise WorkflowStepError(f"Failed to write aggregated intermediate JSON file: {e}")
-            self.after(0, self._update_progress_bar, 55) # Progress after saving JSON
-
-            self.after(0, self.log_status, f"Starting Step 2 (Tagging): Tagging aggregated JSON...", "step")
+            self._raise_if_stopped()
+            self.log_status(f"Starting Step 2 (Tagging): Tagging aggregated JSON...", "step")
             # Reuse the tagging helper function
             final_tagged_data = self._wf_gemini_tag_json(
-                intermediate_json_path, tag_prompt_template_pass1, api_key, tag_model_name_pass1,
-                tag_batch_size, tag_api_delay, enable_second_pass, tag_model_name_pass2, tag_prompt_template_pass2
+                intermediate_json_path, api_key, tag_cfg
             )
             if final_tagged_data is None:
                 raise WorkflowStepError("Gemini tagging step failed for aggregated JSON (check logs/temp files).")
             tagging_success = True
 
             # STEP 3: Generate Final TSV
-            self.after(0, self.log_status, f"Starting Step 3: Generating Final TSV from tagged data...", "step")
+            self.log_status(f"Starting Step 3: Generating Final TSV from tagged data...", "step")
             tsv_gen_success = generate_tsv_from_json_data(final_tagged_data, final_tsv_path, self.log_status)
             if not tsv_gen_success: raise WorkflowStepError("Failed to generate final TSV file from tagged data.")
-            self.after(0, self.log_status, f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info")
-            self.after(0, self._update_progress_bar, 95) # Progress before final completion
+            self.log_status(f"Step 3 Complete: Final tagged file saved: {os.path.basename(final_tsv_path)}", "info")
+            self._queue_progress(95) # Progress before final completion
 
             # Workflow Complete
             end_time = time.time(); total_time = end_time - start_time
-            self.after(0, self.log_status, f"Bulk Visual Q&A Workflow finished successfully in {total_time:.2f} seconds!", "info")
-            self.after(0, self._update_progress_bar, 100)
+            self.log_status(f"Bulk Visual Q&A Workflow finished successfully in {total_time:.2f} seconds!", "info")
+            self._queue_progress(100)
             summary = (
                 f"Bulk Processing Complete!\n\n"
                 f"Files Processed: {processed_files}/{total_files}\n"
                 f"Successful: {success_files}\n"
                 f"Failed (Renamed 'UP_'): {failed_files}\n"
-                f"Skipped (Non-PDF): {skipped_files}\n\n"
+                f"Skipped (identical to a failed file): {skipped_files}\n\n"
                 f"Final Tagged File:\n{final_tsv_path}\n\n"
                 f"Images Saved To Subfolder (in Input Dir):\n{target_image_subfolder_path}\n\n" # Clarify location
                 f"IMPORTANT:\nManually copy the folder\n'{bulk_image_subfolder_name}'\ninto Anki's 'collection.media' folder\nbefore importing the TSV file!"
             )
-            self.after(0, show_info_dialog, "Bulk Workflow Complete", summary, self)
+            self._post_ui(show_info_dialog, "Bulk Workflow Complete", summary, self)
             success = True
 
         except WorkflowStepError as wse:
-            self.after(0, self.log_status, f"Bulk Workflow stopped: {wse}", "error")
-            self.after(0, show_error_dialog, "Bulk Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self)
+            self.log_status(f"Bulk Workflow stopped: {wse}", "error")
+            if not self._wf_stop.is_set(): self._post_ui(show_error_dialog, "Bulk Workflow Failed", f"Failed: {wse}\nCheck log and intermediate files.", self) # No dialog for a requested stop
             success = False
         except Exception as e:
             error_message = f"Unexpected bulk workflow error: {type(e).__name__}: {e}"
-            self.after(0, self.log_status, f"FATAL BULK WORKFLOW ERROR: {error_message}\n{traceback.format_exc()}", "error")
-            self.after(0, show_error_dialog, "Bulk Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
+            self.log_status(f"FATAL BULK WORKFLOW ERROR: {error_message}" + (f"\n{traceback.format_exc()}" if self._debug_enabled else " (enable Debug Logging for the traceback)"), "error")
+            self._post_ui(show_error_dialog, "Bulk Workflow Error", f"Unexpected error:\n{e}\nCheck log.", self)
             success = False
         finally:
-            # Final cleanup of all successfully uploaded Gemini files
-            for pdf_p, uri in uploaded_file_uris.items():
+            # Final cleanup of all successfully uploaded Gemini files (deletes are independent, so run them concurrently)
+            def cleanup_one(file_basename, uri):
                 try:
                     cleanup_gemini_file(uri, api_key, self.log_status)
                 except Exception as clean_e:
-                    self.after(0, self.log_status, f"Error during final cleanup for {os.path.basename(pdf_p)}: {clean_e}", "warning")
+                    self.log_status(f"Error during final cleanup for {file_basename}: {clean_e}", "warning")
+            if uploaded_file_uris:
+                cleanup_jobs = [(os.path.basename(p), uri) for p, uri in uploaded_file_uris.items()] # Basenames computed once, up front
+                with ThreadPoolExecutor(max_workers=min(8, len(cleanup_jobs)), thread_name_prefix="p4_cleanup") as cleanup_pool:
+                    list(cleanup_pool.map(lambda job: cleanup_one(*job), cleanup_jobs))
 
-            # Cleanup intermediate JSON (only on success)
-            if success and os.path.exists(intermediate_json_path):
-                try:
-                    # os.remove(intermediate_json_path)
-                    # self.after(0, self.log_status, f"Cleaned up intermediate JSON: {os.path.basename(intermediate_json_path)}", "debug")
-                    pass
-                except Exception as rem_e:
-                    self.after(0, self.log_status, f"Could not remove intermediate JSON {os.path.basename(intermediate_json_path)}: {rem_e}", "warning")
-            elif not success and os.path.exists(intermediate_json_path):
-                 self.after(0, self.log_status, f"Keeping intermediate JSON on failure: {os.path.basename(intermediate_json_path)}", "warning")
+            # Cleanup intermediate JSON (kept on failure for debugging)
+            self._finalize_intermediate_json(intermediate_json_path, success)
+            if not success and os.path.isfile(resume_sidecar_path):
+                self.log_status(f"Unfinished run kept ({os.path.basename(partial_json_path)}). Run the same files again to resume it.", "warning")
 
 
             # Prepare final summary message for the log/button update
-            final_summary = f"Bulk processing finished. {success_files}/{total_files} successful, {failed_files} failed (renamed 'UP_'), {skipped_files} skipped."
+            final_summary = _BULK_SUMMARY(ok=success_files, total=total_files, failed=failed_files, skipped=skipped_files)
             # Update UI state via main thread
-            self.after(0, self._workflow_finished, success, final_tsv_path if success else None, final_summary)
-
-# Example usage (for testing purposes, if run directly)
-if __name__ == '__main__':
-    root = tk.Tk()
-    root.title("Workflow Page Test")
-    root.geometry("800x700")
-
-    # Mock App instance with necessary attributes
-    class MockApp:
-        def __init__(self):
-            self.gemini_api_key = StringVar(value="YOUR_API_KEY_HERE") # Replace with a real key for actual testing
-            self.api_key_visible = False
-
-        def toggle_api_key_visibility(self):
-             print("Toggling API Key visibility (Mock)")
-             # In a real app, you'd update the show character of the entry
-             pass
-
-    mock_app = MockApp()
-    page = WorkflowPage(root, mock_app)
-    page.pack(expand=True, fill='both')
-
-    root.mainloop()
+            if not finished_sent:
+                self._workflow_finished(success, final_tsv_path if success else None, final_summary)
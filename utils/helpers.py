@@ -1,20 +1,89 @@
 # utils/helpers.py
 import re
 import os
+import json
+import shutil
 import subprocess
 import traceback
+import functools
 import tkinter as tk
 from tkinter import messagebox
 
+from ..constants import IJSON_INSTALLED, ijson, ORJSON_INSTALLED, orjson
+
 # --- Custom Exceptions ---
 class ProcessingError(Exception): pass
 class WorkflowStepError(Exception): pass
 
+@functools.lru_cache(maxsize=4096) # Same names are sanitized over and over in bulk runs; str in, str out, so safe to memoize
 def sanitize_filename(filename):
     """Removes invalid characters for filenames."""
     base_name = os.path.basename(filename); name_part, _ = os.path.splitext(base_name)
     sanitized = re.sub(r'[\\/*?:"<>|\s]+', '_', name_part); return sanitized if sanitized else "processed_file"
 
+def prefetch_file(path):
+    """Asks the OS to start reading a file into the page cache in the background (POSIX only, no-op elsewhere)."""
+    if not path or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED) # Non-blocking: just kicks off readahead
+        finally:
+            os.close(fd)
+    except OSError:
+        pass # Purely a hint; the real read will report any problem
+
+def has_pdf_header(path):
+    """True if the file starts like a PDF. Readers accept the %PDF- marker anywhere in the first 1024 bytes, so this does too."""
+    try:
+        with open(path, 'rb') as f:
+            return b"%PDF-" in f.read(1024)
+    except OSError:
+        return False
+
+def touch_cache_entry(path):
+    """Marks a cache entry (file or folder) as just used, for prune_cache_dir's least-recently-used order."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass # Only affects eviction order
+
+def _entry_size(path):
+    """Bytes used by a cache entry: a file, or every file below a folder."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for name in file_names:
+            try: total += os.path.getsize(os.path.join(dir_path, name))
+            except OSError: pass
+    return total
+
+def prune_cache_dir(cache_dir, max_bytes):
+    """Removes the least recently used entries (files or folders, by modification time) of cache_dir until the rest fit
+    in max_bytes. Entries still being written ('.tmp' in the name) are left alone. Returns (entries removed, bytes freed)."""
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if ".tmp" in entry.name: continue
+                try: entries.append((entry.stat().st_mtime, _entry_size(entry.path), entry.path))
+                except OSError: pass # Removed meanwhile
+    except OSError:
+        return 0, 0 # No cache yet
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for _, size, path in sorted(entries): # Oldest first
+        if total <= max_bytes: break
+        try:
+            if os.path.isdir(path): shutil.rmtree(path)
+            else: os.remove(path)
+        except OSError:
+            continue
+        total -= size; removed += 1; freed += size
+    return removed, freed
+
 def get_subprocess_startupinfo():
     """Creates startupinfo object to hide console window on Windows."""
     startupinfo = None
@@ -79,6 +148,13 @@ def ask_yes_no(title, question, parent=None):
         print(f"Error displaying yes/no dialog: {e}")
         return False # Default to No on error
 
+def _tsv_join(row):
+    """Joins one row's cells with tabs. Rows are normally all strings, so map(str, ...) is only the fallback."""
+    try:
+        return "\t".join(row)
+    except TypeError: # Non-string cell somewhere in this row
+        return "\t".join(map(str, row))
+
 # --- NEW FUNCTION ---
 def save_tsv_incrementally(data_rows, output_dir, base_filename, step_name, log_func):
     """
@@ -101,13 +177,76 @@ def save_tsv_incrementally(data_rows, output_dir, base_filename, step_name, log_
     temp_filepath = os.path.join(output_dir, temp_filename)
     try:
         with open(temp_filepath, 'w', encoding='utf-8', newline='') as f:
+            # Interleave rows and newlines in one list and join once: a single sized allocation and a single write(),
+            # instead of a temporary "row + newline" string per row
+            parts = []; append = parts.append
             for row in data_rows:
-                f.write("\t".join(map(str, row)) + "\n")
+                append(_tsv_join(row)); append("\n")
+            f.write("".join(parts))
         log_func(f"Saved intermediate {step_name} results ({len(data_rows)-1} data rows) to {temp_filename}", "debug")
         return temp_filepath
     except Exception as e:
         log_func(f"Error saving intermediate {step_name} results to {temp_filepath}: {e}", "error")
         return None
 
+def _dumps_indented(obj):
+    """json.dumps(obj, indent=2), encoded by orjson when it is installed (same layout, non-ASCII kept as UTF-8)."""
+    if ORJSON_INSTALLED:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, indent=2)
+
+class JsonArrayWriter:
+    """
+    Streams a JSON array to disk batch by batch, so the caller never has to hold the whole list.
+    The file content is identical to json.dump(all_items, f, indent=2).
+    Pass resume_at (an offset returned by checkpoint()) and resume_count to continue an unfinished file.
+    """
+    def __init__(self, path, resume_at=None, resume_count=0):
+        self.path = path
+        if resume_at is None:
+            self.count = 0 # Items written so far
+            self._f = open(path, 'w', encoding='utf-8')
+            self._f.write("[")
+        else:
+            self.count = resume_count
+            self._f = open(path, 'r+', encoding='utf-8')
+            self._f.seek(resume_at); self._f.truncate() # Drop anything written after the last checkpoint (half-written item, closing "]")
+
+    def write_items(self, items):
+        """Appends items (any iterable of JSON-serializable objects) to the array."""
+        for item in items:
+            self._f.write(",\n  " if self.count else "\n  ")
+            self._f.write(_dumps_indented(item).replace("\n", "\n  ")) # Re-indent one level, like json.dump does
+            self.count += 1
+
+    def checkpoint(self, fsync=True):
+        """Flushes everything written so far (to disk too unless fsync=False) and returns the offset to resume from."""
+        self._f.flush()
+        if fsync: os.fsync(self._f.fileno())
+        return self._f.tell()
+
+    def close(self):
+        if self._f is not None:
+            self._f.write("\n]" if self.count else "]")
+            self._f.close(); self._f = None
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): self.close()
+
+_IJSON_BUF_SIZE = 1024 * 1024 # Read 1 MiB per parser call instead of ijson's 64 KiB default
+
+def iter_json_array(path):
+    """Yields the items of the JSON array stored in path, streamed with ijson when it is installed with a compiled backend
+    (the file text and the parsed list never both sit in memory), else parsed in one go with orjson or json.load."""
+    if IJSON_INSTALLED:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'item', use_float=True, buf_size=_IJSON_BUF_SIZE) # use_float: plain floats, like json.load (not Decimal)
+    elif ORJSON_INSTALLED:
+        with open(path, 'rb') as f:
+            yield from orjson.loads(f.read()) # Parses the raw UTF-8 bytes directly, no str decode step
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
 # Add more helper GUI functions if needed (e.g., safe_widget_config)
 